@@ -14,7 +14,11 @@ if BASE_DIR not in sys.path:
 # 若仍希望调试看路径，可以解开下一行
 # print(BASE_DIR)
 
-from bptracer.BaseRunner import BaseRunner
+import glob
+import shlex
+import subprocess
+
+from bptracer.taskGraph import TaskGraph
 from bptracer import Kraken2
 from bptracer import inputList
 from bptracer import BP
@@ -23,6 +27,12 @@ from bptracer import HGT
 from bptracer import Megahit
 from bptracer import SPAdes
 from bptracer import fileManager
+from bptracer import metrics
+from bptracer import costModel
+from bptracer import hostResource
+from bptracer import taskQueue
+from bptracer import batchExecutor
+from bptracer import aligner
 from bptracer.tool import load_config_module
 from bptracer import version
 
@@ -83,10 +93,55 @@ def build_parser() -> argparse.ArgumentParser:
     global_parent.add_argument(
         "--max-workers",
         type=int,
-        default=3,
+        default=None,
         help=(
             "Maximum number of scripts to run in parallel when --auto-run is set. "
-            "Default: 3."
+            "Default: no limit other than --cores/--mem."
+        ),
+    )
+    global_parent.add_argument(
+        "--cores",
+        type=int,
+        default=None,
+        help=(
+            "CPU core budget used to pack scripts when --auto-run is set. "
+            "Default: auto-detected from the host."
+        ),
+    )
+    global_parent.add_argument(
+        "--mem",
+        type=float,
+        default=None,
+        help=(
+            "Memory budget in GB used to pack scripts when --auto-run is set. "
+            "Default: MemTotal from /proc/meminfo."
+        ),
+    )
+    global_parent.add_argument(
+        "--resume",
+        action="store_true",
+        help=(
+            "With --auto-run, skip scripts whose declared outputs are newer than "
+            "their inputs and whose command and configuration are unchanged since "
+            "their last successful run (see <script>.manifest.json)."
+        ),
+    )
+    global_parent.add_argument(
+        "--executor",
+        choices=["local", "slurm", "sge"],
+        default="local",
+        help=(
+            "Where --auto-run executes the scripts: on this host (local), or as one "
+            "array job per stage and resource group on Slurm or SGE, chained by "
+            "job dependencies. Default: local."
+        ),
+    )
+    global_parent.add_argument(
+        "--metrics",
+        action="store_true",
+        help=(
+            "Record wall time, CPU time, peak memory and disk I/O of every command "
+            "in the generated scripts under shell/metrics/ (see 'BPtracer report')."
         ),
     )
     global_parent.add_argument(
@@ -130,6 +185,9 @@ def build_parser() -> argparse.ArgumentParser:
         "\n"
         "Example:\n"
         "  BPtracer BP --file paired_fastq_list.txt --pwd /path/to/output\n"
+        "  BPtracer BP --file paired_fastq_list.txt --pwd /path/to/output --stream-reads\n"
+        "  BPtracer BP --file paired_fastq_list.txt --pwd /path/to/output --combined-db\n"
+        "  BPtracer BP --file paired_fastq_list.txt --pwd /path/to/output --subsample 0.1\n"
     )
 
     BP2_description = (
@@ -140,6 +198,9 @@ def build_parser() -> argparse.ArgumentParser:
         "\n"
         "Example:\n"
         "  BPtracer BP2 --file paired_fastq_list.txt --pwd /path/to/output\n"
+        "  BPtracer BP2 --file paired_fastq_list.txt --pwd /path/to/output --append\n"
+        "  BPtracer BP2 --file paired_fastq_list.txt --pwd /path/to/output --aligner diamond-more-sensitive\n"
+        "  BPtracer BP2 --file paired_fastq_list.txt --pwd /path/to/output --one-pass\n"
     )
 
     Tax_description = (
@@ -185,6 +246,82 @@ def build_parser() -> argparse.ArgumentParser:
         "  BPtracer HGT --file contig_fasta_list.txt --pwd /path/to/output\n"
     )
 
+    All_description = (
+        "Run BP, BP2, Tax, assembly and HGT as one dependency graph.\n"
+        "\n"
+        "The FASTQ list is read once; the FASTA decoded by BP S01 is reused by\n"
+        "Kraken2 and MEGAHIT instead of decompressing the FASTQ.gz again, HGT runs\n"
+        "on the contigs of each sample, and BP2 starts once every BP S02 script\n"
+        "has finished. Scripts of different steps overlap within --cores/--mem.\n"
+        "\n"
+        "Example:\n"
+        "  BPtracer all --file paired_fastq_list.txt --pwd /path/to/output --auto-run\n"
+        "  BPtracer all --file paired_fastq_list.txt --pwd /path/to/output --assembler none\n"
+    )
+
+    Report_description = (
+        "Summarize runtime metrics recorded by scripts generated with --metrics.\n"
+        "\n"
+        "Wall time, CPU time, peak memory and disk I/O of every command are\n"
+        "aggregated per stage, per tool and per sample, printed and saved to\n"
+        "shell/metrics/report.<by>.tsv.\n"
+        "\n"
+        "Example:\n"
+        "  BPtracer report --pwd /path/to/output\n"
+        "  BPtracer report --pwd /path/to/output --by tool\n"
+    )
+
+    Plan_description = (
+        "Predict the per-stage makespan of generated scripts without running them.\n"
+        "\n"
+        "Script durations are estimated from input sizes and refined by metrics of\n"
+        "previous runs (--metrics); the scheduler is simulated longest-job-first\n"
+        "within the --cores/--mem budget, next to plain list order for comparison.\n"
+        "\n"
+        "Example:\n"
+        "  BPtracer plan --pwd /path/to/output --cores 128 --mem 500\n"
+        "  BPtracer plan --pwd /path/to/output --command BP2 --cores 64\n"
+    )
+
+    Worker_description = (
+        "Claim and run generated scripts from a task queue on a shared filesystem.\n"
+        "\n"
+        "Start any number of workers, on any nodes that see the output folder.\n"
+        "Tasks are claimed atomically, kept alive by heartbeats and re-queued when\n"
+        "their worker stops responding; dependencies and --cores/--mem are respected.\n"
+        "\n"
+        "Example:\n"
+        "  BPtracer worker --queue /path/to/output/queue --tasks /path/to/output/shell/tasks.BP2.jsonl\n"
+        "  BPtracer worker --queue /path/to/output/queue --cores 32 --mem 120\n"
+    )
+
+    Concordance_description = (
+        "Compare two aligner backends of the BP2 BLAST stage on the same chunks.\n"
+        "\n"
+        "Existing BP2 chunks (temp.N.fa) are aligned again with each backend,\n"
+        "abundances are computed as in BP2 S04, and per-gene ppm deltas, best-hit\n"
+        "agreement and alignment times are written to\n"
+        "BPTracer/<GeneType>/Concordance/<GeneType>.<A>.vs.<B>.tsv (+ .json).\n"
+        "\n"
+        "Example:\n"
+        "  BPtracer concordance --pwd /path/to/output --auto-run\n"
+        "  BPtracer concordance --pwd /path/to/output --aligners blastx mmseqs --GeneType ARGs --chunks 0 1\n"
+    )
+
+    Cache_description = (
+        "Inspect or prune the BLAST hit cache shared by BP2 runs (BP_BLAST_CACHE).\n"
+        "\n"
+        "With BPtracer BP2 --blast-cache (or BP_BLAST_CACHE), S03 keeps the hits of\n"
+        "every searched sequence, keyed by sequence, database checksum and search\n"
+        "parameters, and only BLASTs cache misses. The cache is off by default.\n"
+        "'stats' shows entries, size and hit rate; 'prune' evicts least recently\n"
+        "used entries down to --max-gb and/or entries unused for --older-than days.\n"
+        "\n"
+        "Example:\n"
+        "  BPtracer cache stats --cache /local/scratch/blast_hits.sqlite\n"
+        "  BPtracer cache prune --cache /local/scratch/blast_hits.sqlite --max-gb 10 --older-than 180\n"
+    )
+
     # ---------------------- BP 子命令 ---------------------------
 
     bp_parser = add_subparser(subparsers, 'BP', BP_description, parents=[global_parent])
@@ -210,6 +347,55 @@ def build_parser() -> argparse.ArgumentParser:
         help="Gene types to analyze (e.g. 'ARGs,MGEs'). Default: 'ALL' (all types).",
         default='ALL',
     )
+    bp_req.add_argument(
+        '--stream-reads',
+        action='store_true',
+        help=(
+            "Decode each FASTQ once and stream the FASTA into minimap2 and the USCMG\n"
+            "search through FIFOs; only a BGZF-compressed read store is kept for S02."
+        ),
+    )
+    bp_req.add_argument(
+        '--combined-db',
+        action='store_true',
+        help=(
+            "Search both mates of each sample once against the combined gene database\n"
+            "(BP_GENE_COMBINED_DATABASE) and split the hits by gene type."
+        ),
+    )
+    bp_req.add_argument(
+        '--derep',
+        action='store_true',
+        help=(
+            "Collapse identical read pairs after decoding in S01; their multiplicity\n"
+            "weights the 16S, USCMG and gene abundance counts. Not with --stream-reads."
+        ),
+    )
+    bp_req.add_argument(
+        '--prefilter',
+        action='store_true',
+        help=(
+            "Drop reads whose 6-frame translation shares no seed with the gene database\n"
+            "before diamond in S02 (index: <database>.seeds.npz, see BuildSeedIndex.py)."
+        ),
+    )
+    bp_req.add_argument(
+        '--one-pass',
+        action='store_true',
+        help=(
+            "Run the S02 diamond search with the final e-value/identity thresholds and\n"
+            "keep its hits (extracted.m8) so that BP2 --one-pass can skip BLAST."
+        ),
+    )
+    bp_req.add_argument(
+        '--subsample',
+        type=float,
+        default=None,
+        help=(
+            "Profile a deterministic subset of read pairs: a fraction (<1) or a target\n"
+            "number of pairs (>=1). Abundances are scaled back to the full library."
+        ),
+    )
 
     # ---------------------- BP2 子命令 ---------------------------
 
@@ -242,6 +428,36 @@ def build_parser() -> argparse.ArgumentParser:
         help="Gene types to analyze (e.g. 'ARGs,MGEs'). Default: 'ALL' (all types).",
         default='ALL',
     )
+    bp2_req.add_argument(
+        '--append',
+        action='store_true',
+        help=(
+            "Only BLAST samples not yet in the cohort tables and merge their\n"
+            "columns into the existing OUT.* and Tax.* tables."
+        ),
+    )
+    bp2_req.add_argument(
+        '--aligner',
+        choices=list(aligner.ALIGNERS),
+        default=None,
+        help="Aligner of the BLAST stage (S03). Default: BP_ALIGNER of the configuration (blastx).",
+    )
+    bp2_req.add_argument(
+        '--blast-cache',
+        default=None,
+        help=(
+            "Reuse BLAST hits across runs from this SQLite cache file (must be on a local disk).\n"
+            "Default: BP_BLAST_CACHE of the configuration (off)."
+        ),
+    )
+    bp2_req.add_argument(
+        '--one-pass',
+        action='store_true',
+        help=(
+            "Skip the BLAST stage (S03) and compute abundances from the S02 diamond hits\n"
+            "written by BPtracer BP --one-pass."
+        ),
+    )
 
     # ---------------------- Tax 子命令（Kraken2）-------------------
 
@@ -271,6 +487,12 @@ def build_parser() -> argparse.ArgumentParser:
         default='F',
         help="Print underlying commands (T) or not (F).",
     )
+    tax_req.add_argument(
+        '--subsample',
+        type=float,
+        default=None,
+        help="Classify a deterministic subset of read pairs: a fraction (<1) or a target number of pairs (>=1).",
+    )
 
     # ---------------------- SPAdes 子命令 -------------------------
 
@@ -343,6 +565,235 @@ def build_parser() -> argparse.ArgumentParser:
         help="Print underlying commands (T) or not (F).",
     )
 
+    # ---------------------- all 子命令 ----------------------------
+
+    all_parser = add_subparser(subparsers, 'all', All_description, parents=[global_parent])
+    all_req = all_parser.add_argument_group('required arguments')
+    all_req.add_argument(
+        '--file', '-f',
+        help="List file of paired-end metagenomic FASTQ reads.",
+        required=True,
+    )
+    all_req.add_argument(
+        '--pwd', '-o',
+        help="Output folder.",
+        default="./",
+    )
+    all_req.add_argument(
+        '--print',
+        choices=['T', 'F'],
+        default='F',
+        help="Print underlying commands (T) or not (F).",
+    )
+    all_req.add_argument(
+        '--GeneType', '-g',
+        help="Gene types to analyze (e.g. 'ARGs,MGEs'). Default: 'ALL' (all types).",
+        default='ALL',
+    )
+    all_req.add_argument(
+        '--stream-reads',
+        action='store_true',
+        help="Stream decoded reads through FIFOs in BP S01 (see BPtracer BP --stream-reads).",
+    )
+    all_req.add_argument(
+        '--combined-db',
+        action='store_true',
+        help="One combined diamond search per sample in BP S02 (see BPtracer BP --combined-db).",
+    )
+    all_req.add_argument(
+        '--derep',
+        action='store_true',
+        help="Collapse identical read pairs in BP S01 (see BPtracer BP --derep).",
+    )
+    all_req.add_argument(
+        '--prefilter',
+        action='store_true',
+        help="Seed prefilter before the gene diamond search in BP S02 (see BPtracer BP --prefilter).",
+    )
+    all_req.add_argument(
+        '--one-pass',
+        action='store_true',
+        help="Use the BP S02 diamond hits for abundances and skip the BLAST stage of BP2 (see BPtracer BP --one-pass).",
+    )
+    all_req.add_argument(
+        '--subsample',
+        type=float,
+        default=None,
+        help="Decode a deterministic subset of read pairs for all steps (see BPtracer BP --subsample).",
+    )
+    all_req.add_argument(
+        '--thread', '-t',
+        type=int,
+        help="Number of threads used in BLAST stage of BP2.",
+        default=4,
+    )
+    all_req.add_argument(
+        '--aligner',
+        choices=list(aligner.ALIGNERS),
+        default=None,
+        help="Aligner of the BLAST stage of BP2 (see BPtracer BP2 --aligner).",
+    )
+    all_req.add_argument(
+        '--blast-cache',
+        default=None,
+        help="BLAST hit cache file of BP2 (see BPtracer BP2 --blast-cache).",
+    )
+    all_req.add_argument(
+        '--db', '-d',
+        help=(
+            "Database for Kraken2 classification. Options: "
+            "BPTax_V1, BPTax_V2, krakenDB-202212, krakenDB-202406."
+        ),
+        default="BPTax_V2",
+    )
+    all_req.add_argument(
+        '--assembler',
+        choices=['megahit', 'spades', 'none'],
+        default='megahit',
+        help="Assembler whose contigs are passed to HGT; 'none' skips assembly and HGT. Default: megahit.",
+    )
+    all_req.add_argument(
+        '--hgt-db',
+        help="Database for HGT classification (see BPtracer HGT --db). Default: RefseqPan2.",
+        default="RefseqPan2",
+    )
+
+    # ---------------------- report 子命令 -------------------------
+
+    report_parser = add_subparser(subparsers, 'report', Report_description, parents=[global_parent])
+    report_req = report_parser.add_argument_group('required arguments')
+    report_req.add_argument(
+        '--pwd', '-o',
+        help="Output folder of a previous run (metrics are read from <pwd>/shell/metrics).",
+        default="./",
+    )
+    report_req.add_argument(
+        '--by',
+        choices=['stage', 'tool', 'sample', 'script'],
+        action='append',
+        help="Aggregation key, may be repeated. Default: stage, tool and sample.",
+    )
+    report_req.add_argument(
+        '--all-runs',
+        action='store_true',
+        help="Include every recorded run instead of only the latest run of each script.",
+    )
+
+    # ---------------------- plan 子命令 ---------------------------
+
+    plan_parser = add_subparser(subparsers, 'plan', Plan_description, parents=[global_parent])
+    plan_req = plan_parser.add_argument_group('required arguments')
+    plan_req.add_argument(
+        '--pwd', '-o',
+        help="Output folder containing shell/tasks.<command>.jsonl.",
+        default="./",
+    )
+    plan_req.add_argument(
+        '--command',
+        help="Only plan the scripts generated by this sub-command (e.g. BP, BP2, Tax). Default: all.",
+        default=None,
+    )
+
+    # ---------------------- worker 子命令 -------------------------
+
+    worker_parser = add_subparser(subparsers, 'worker', Worker_description, parents=[global_parent])
+    worker_req = worker_parser.add_argument_group('required arguments')
+    worker_req.add_argument(
+        '--queue', '-q',
+        help="Queue folder shared by all workers.",
+        required=True,
+    )
+    worker_req.add_argument(
+        '--tasks',
+        action='append',
+        default=[],
+        help="Task manifest (shell/tasks.<command>.jsonl) to add to the queue; may be repeated.",
+    )
+    worker_req.add_argument(
+        '--stale-timeout',
+        type=float,
+        default=taskQueue.STALE_TIMEOUT,
+        help=f"Seconds without heartbeat before a claimed task is re-queued. Default: {taskQueue.STALE_TIMEOUT}.",
+    )
+    worker_req.add_argument(
+        '--pwd', '-o',
+        help="Output folder, used to read previous metrics for task ordering.",
+        default="./",
+    )
+
+    # ---------------------- concordance 子命令 --------------------
+
+    concordance_parser = add_subparser(subparsers, 'concordance', Concordance_description, parents=[global_parent])
+    concordance_req = concordance_parser.add_argument_group('required arguments')
+    concordance_req.add_argument(
+        '--pwd', '-o',
+        help="Output folder of a previous BP2 run.",
+        default="./",
+    )
+    concordance_req.add_argument(
+        '--aligners',
+        nargs=2,
+        choices=list(aligner.ALIGNERS),
+        default=['blastx', 'diamond-more-sensitive'],
+        help="The two backends to compare (A B). Default: blastx diamond-more-sensitive.",
+    )
+    concordance_req.add_argument(
+        '--GeneType', '-g',
+        help="Gene types to compare (e.g. 'ARGs,MGEs'). Default: 'ARGs'.",
+        default='ARGs',
+    )
+    concordance_req.add_argument(
+        '--chunks',
+        type=int,
+        nargs='+',
+        default=[0],
+        help="Indexes of the BP2 chunks (temp.N.fa) to align. Default: 0.",
+    )
+    concordance_req.add_argument(
+        '--thread', '-t',
+        type=int,
+        help="Number of threads of each aligner run.",
+        default=4,
+    )
+    concordance_req.add_argument(
+        '--print',
+        choices=['T', 'F'],
+        default='F',
+        help="Print underlying commands (T) or not (F).",
+    )
+
+    # ---------------------- cache 子命令 --------------------------
+
+    cache_parser = add_subparser(subparsers, 'cache', Cache_description, parents=[global_parent])
+    cache_req = cache_parser.add_argument_group('required arguments')
+    cache_req.add_argument(
+        'action',
+        choices=['stats', 'prune'],
+        help="Show cache statistics, or evict entries and compact the cache file.",
+    )
+    cache_req.add_argument(
+        '--cache',
+        help="Cache file. Default: BP_BLAST_CACHE of the configuration.",
+        default=None,
+    )
+    cache_req.add_argument(
+        '--max-gb',
+        type=float,
+        default=None,
+        help="prune: evict least recently used entries until the cache is below this size.",
+    )
+    cache_req.add_argument(
+        '--older-than',
+        type=float,
+        default=None,
+        help="prune: evict entries not used for this many days.",
+    )
+    cache_req.add_argument(
+        '--pwd', '-o',
+        help="Output folder (only used to load the configuration).",
+        default="./",
+    )
+
     return parser
 
 
@@ -369,6 +820,9 @@ def init_config(args):
         raise AttributeError(f"配置模块 {args.config} 中缺少 set_output_path 方法")
 
     cfg.set_output_path(args.pwd)
+    if args.metrics:
+        cfg.METRICS_ENABLED = True
+        print(f"Metrics will be recorded to: {cfg.METRICS_PATH}")
     print(f"Output path set to: {cfg.OUTPUT_PATH}")
     print("mkdir analysis folders (将在各子命令中按需具体创建)")
     return cfg
@@ -378,11 +832,14 @@ def init_config(args):
 # 各子命令的具体执行逻辑
 # ----------------------------------------------------------------------
 
-def run_bp(args, config):
+def run_bp(args, config, graph=None, dataList=None, decoded=None):
     """
     BP 主流程（step 1）：
     S01_RawdataStat   : per-sample read QC / basic stats
     S02_GeneAnno      : per-sample, per-geneType annotation
+
+    graph / dataList 由 all 子命令传入，以便各子命令共享同一依赖图与样品列表；
+    decoded 不为 None 时记录 样品 ID -> (解压后的 _1.fa, _2.fa, S01 脚本)。
     """
 
     fileManager.mkdir(config.SHELL_PATH)
@@ -390,10 +847,28 @@ def run_bp(args, config):
     print(f"Shells set to: {config.SHELL_PATH}")
     print(f"Results set to: {config.BP_OUTPUT_PATH}")
 
+    if args.stream_reads:
+        config.BP_STREAM_READS = True
+        print("Streaming decoded reads in S01; read store: 00.DataStat/<sample>/<sample>_[12].fa.gz")
+    if args.derep:
+        if args.stream_reads:
+            print("Warning: --derep is not available with --stream-reads and is ignored")
+        else:
+            config.BP_DEREP_READS = True
+            print("Collapsing identical read pairs in S01; multiplicity is kept as SZ:i:N in read headers")
+    set_subsample(args, config)
+    if args.prefilter:
+        config.BP_PREFILTER = True
+        print("Prefiltering reads with the translated seed index before the gene diamond search in S02")
+    if args.one_pass:
+        config.BP_ONE_PASS = True
+        print("One-pass mode: S02 diamond uses the final thresholds and its hits are kept for BP2 --one-pass")
+
     # 读取 fqlist
-    dataList = inputList.read_paired_list(args.file)
+    if dataList is None:
+        dataList = inputList.read_paired_list(args.file)
     # 生成 inputlist 用于后续分析（保留原始文件名 'intput.list'）
-    inputList.generate_inputlist(args.file, "intput.list", config.BP_OUTPUT_PATH)
+    inputList.generate_inputlist(args.file, "intput.list", config)
 
     # 基因类型列表
     gene_types = (
@@ -402,9 +877,10 @@ def run_bp(args, config):
         else ['ARGs', 'MGEs', 'MRGs', 'VFs', 'SGs']
     )
 
-    # ---- 分阶段列表 ----
-    s01_scripts = []  # S01: RawdataStat
-    s02_scripts = []  # S02: GeneAnno
+    # ---- 依赖图：S02 的每个脚本只依赖同一样品的 S01 脚本 ----
+    if graph is None:
+        graph = TaskGraph()
+    s01_scripts = {}  # S01: RawdataStat，样品 ID -> 脚本路径
 
     # ---------------------- S01: RawdataStat ----------------------
     for i in range(dataList.number):
@@ -416,9 +892,28 @@ def run_bp(args, config):
         soft_runner.print_command(should_print=args.print)
         script_path = os.path.join(config.SHELL_PATH, f"BP.S01.RawStat.{ID}.sh")
         soft_runner.generate_script(script_path)
-        s01_scripts.append(script_path)
+        s01_scripts[ID] = graph.add(
+            script_path, stage="S01_RawdataStat", resources=soft_runner.resources()
+        )
+        if decoded is not None:
+            fa1, fa2 = soft_runner.outputs()[:2]
+            decoded[ID] = (fa1, fa2, script_path)
 
     # ---------------------- S02: 各基因类型的注释 ----------------------
+    if args.combined_db:
+        # 合并库：每个样品一个脚本，一次搜索全部基因类型
+        for i in range(dataList.number):
+            ID = dataList.id[i]
+            soft_runner = BP.GeneAnnoCombined(config=config, id=ID, geneTypes=gene_types)
+            soft_runner.print_command(should_print=args.print)
+            script_path = os.path.join(config.SHELL_PATH, f"BP.S02.GeneAnno.{ID}.sh")
+            soft_runner.generate_script(script_path)
+            graph.add(
+                script_path, stage="S02_GeneAnno", depends=[s01_scripts[ID]],
+                resources=soft_runner.resources(),
+            )
+        return graph
+
     for gtype in gene_types:
         for i in range(dataList.number):
             ID = dataList.id[i]
@@ -433,13 +928,12 @@ def run_bp(args, config):
                 config.SHELL_PATH, f"BP.S02.{gtype}Anno.{ID}.sh"
             )
             soft_runner.generate_script(script_path)
-            s02_scripts.append(script_path)
+            graph.add(
+                script_path, stage="S02_GeneAnno", depends=[s01_scripts[ID]],
+                resources=soft_runner.resources(),
+            )
 
-    # 返回有序 dict，main() 中将按键顺序依次执行各阶段
-    return {
-        "S01_RawdataStat": s01_scripts,
-        "S02_GeneAnno": s02_scripts,
-    }
+    return graph
 
 
 def run_bp2(args, config):
@@ -447,6 +941,10 @@ def run_bp2(args, config):
     BP2 后处理流程（step 2）：
     S03_ExtractAndBlast : split fasta & run BLAST in chunks
     S04_MergeBlast      : merge BLAST results per geneType
+
+    --append 时只处理 Cohort.samples.list 之外的新样品，
+    脚本命名为 BP.S03.append.* 与 BP.S04.*.Append.sh。
+    --one-pass 时没有 S03，S04 直接合并各样品 S02 的 diamond 比对（extracted.m8）。
     """
 
     gene_types = (
@@ -460,52 +958,90 @@ def run_bp2(args, config):
     else:
         print("Printing is disabled because --print=F")
 
-    # 分阶段脚本列表
-    s03_scripts = []  # S03: 分块 BLAST（BP.S03.temp.*.sh）
-    s04_scripts = []  # S04: 合并 BLAST 结果（BP.S04.{gtype}.Merge.sh）
+    if args.one_pass:
+        config.BP_ONE_PASS = True
+        print("One-pass mode: abundances from the S02 diamond hits, the BLAST stage is skipped")
+    else:
+        if args.aligner:
+            config.BP_ALIGNER = args.aligner
+        print(f"Aligner of the BLAST stage: {config.BP_ALIGNER}")
+        if args.blast_cache:
+            config.BP_BLAST_CACHE = os.path.abspath(args.blast_cache)
+        if config.BP_BLAST_CACHE:
+            print(f"BLAST hit cache: {config.BP_BLAST_CACHE}")
+
+    fileManager.mkdir(config.SHELL_PATH)
+
+    # 依赖图：S04 合并脚本只依赖同一基因类型的 S03 分块 BLAST 脚本
+    graph = TaskGraph()
 
     for gtype in gene_types:
         print(f"Processing gene type: {gtype}")
 
         # 1) ExtractedFaFiles：分割 fasta 并生成对应脚本（S03）
         soft_runner = BP2.ExtractedFaFiles(
-            config=config, geneType=gtype, thread=args.thread
+            config=config, geneType=gtype, thread=args.thread, append=args.append
         )
         soft_runner.process_files()
+        if args.append and not soft_runner.samples:
+            print(f"No new samples for {gtype}, skipped.")
+            continue
+        chunk_prefix = "append" if args.append else "temp"
 
+        s03_scripts = []  # S03: 分块 BLAST（BP.S03.temp.*.sh / BP.S03.append.*.sh）
         for i, split_fa in enumerate(soft_runner.split_fa):
             soft_runner.build_command(index=i)
             soft_runner.print_command(should_print=args.print, index=i)
 
             script_path = os.path.join(
-                config.SHELL_PATH, f"BP.S03.temp.{gtype}.{i}.sh"
+                config.SHELL_PATH, f"BP.S03.{chunk_prefix}.{gtype}.{i}.sh"
             )
             soft_runner.generate_script(script_path, index=i)
-            s03_scripts.append(script_path)
+            s03_scripts.append(graph.add(
+                script_path, stage="S03_ExtractAndBlast",
+                resources=soft_runner.resources(index=i),
+            ))
             print(f"Generated script for file {split_fa}: {script_path}")
 
         # 2) CatBlastFiles：合并 BLAST 结果（S04）
-        soft_runner = BP2.CatBlastFiles(config=config, geneType=gtype)
+        soft_runner = BP2.CatBlastFiles(config=config, geneType=gtype, append=args.append)
         soft_runner.process_files()
         soft_runner.build_command()
         soft_runner.print_command(should_print=args.print)
-        merge_script = os.path.join(config.SHELL_PATH, f"BP.S04.{gtype}.Merge.sh")
+        merge_name = "Append" if args.append else "Merge"
+        merge_script = os.path.join(config.SHELL_PATH, f"BP.S04.{gtype}.{merge_name}.sh")
         soft_runner.generate_script(merge_script)
-        s04_scripts.append(merge_script)
+        graph.add(
+            merge_script, stage="S04_MergeBlast", depends=s03_scripts,
+            resources=soft_runner.resources(),
+        )
 
-    # 返回分阶段结构，交给 main() 做按阶段顺序的 auto-run
-    return {
-        "S03_ExtractAndBlast": s03_scripts,
-        "S04_MergeBlast": s04_scripts,
-    }
+    return graph
 
 
-def run_tax(args, config):
+def set_subsample(args, config):
+    """--subsample（BP、Tax 与 all 子命令）写入 config.BP_SUBSAMPLE。"""
+    subsample = getattr(args, "subsample", None)
+    if subsample is None:
+        return
+    if subsample <= 0:
+        sys.exit("Error: --subsample must be a positive fraction (<1) or number of read pairs (>=1)")
+    config.BP_SUBSAMPLE = subsample
+    if subsample < 1:
+        print(f"Subsampling {subsample:.2%} of read pairs (selected by read name hash)")
+    else:
+        print(f"Subsampling about {int(subsample)} read pairs per sample (selected by read name hash)")
+
+
+def run_tax(args, config, graph=None, dataList=None, decoded=None):
     """
     Kraken2 单独使用（Tax 子命令）：
     S00_FastqStat : per-sample read count / basic stats
     S01_Kraken2   : per-sample taxonomic classification
     S02_Merge     : merge classification outputs
+
+    decoded 由 all 子命令传入（见 run_bp）：Kraken2 直接读取 BP S01 解压出的 FASTA，
+    不再重复解压 FASTQ.gz，并依赖同一样品的 S01 脚本。
     """
 
     fileManager.mkdir(config.SHELL_PATH)
@@ -517,15 +1053,23 @@ def run_tax(args, config):
     print(f"Results set to: {config.Kraken2_OUTPUT_PATH}")
     print(f"Database set to: {config.Kraken2_DATABASE}")
 
-    dataList = inputList.read_paired_list(args.file)
+    if dataList is None:
+        dataList = inputList.read_paired_list(args.file)
+    set_subsample(args, config)
 
-    # S00：统计每个样品的 reads 数量
-    s00_scripts = []
-    soft_runner = Kraken2.FastqStatRunner(config=config, fqlist=args.file)
+    if graph is None:
+        graph = TaskGraph()
+
+    # S00：统计每个样品的 reads 数量；all 子命令中汇总 BP S01 解压时的统计，不再扫描 FASTQ
+    stats, stat_depends = None, []
+    if decoded is not None:
+        stats = [BP.readstat_path(config, dataList.id[i]) for i in range(dataList.number)]
+        stat_depends = [decoded[dataList.id[i]][2] for i in range(dataList.number)]
+    soft_runner = Kraken2.FastqStatRunner(config=config, fqlist=args.file, stats=stats)
     soft_runner.print_command(should_print=args.print)
     stat_script = os.path.join(config.SHELL_PATH, "Tax.S00.Stat.sh")
     soft_runner.generate_script(stat_script)
-    s00_scripts.append(stat_script)
+    graph.add(stat_script, stage="S00_FastqStat", depends=stat_depends, resources=soft_runner.resources())
 
     # S01：每个样品的 Kraken2 分类
     s01_scripts = []
@@ -533,33 +1077,209 @@ def run_tax(args, config):
         ID = dataList.id[i]
         file1 = dataList.file1[i]
         file2 = dataList.file2[i]
+        depends = []
+        if decoded is not None:
+            file1, file2, upstream = decoded[ID]
+            depends = [upstream]
+        # BP S01 解压出的 FASTA 已经抽样；读取原始 FASTQ 时由 Kraken2Runner 抽样
+        raw = file1 == dataList.file1[i]
 
         soft_runner = Kraken2.Kraken2Runner(
-            config=config, id=ID, file1=file1, file2=file2
+            config=config, id=ID, file1=file1, file2=file2, compressed=decoded is None or str(file1).endswith(".gz"),
+            subsample=config.BP_SUBSAMPLE if raw else None,
         )
         soft_runner.print_command(should_print=args.print)
         script_path = os.path.join(config.SHELL_PATH, f"Tax.S01.Kraken2.{ID}.sh")
         soft_runner.generate_script(script_path)
-        s01_scripts.append(script_path)
+        s01_scripts.append(graph.add(
+            script_path, stage="S01_Kraken2", depends=depends, resources=soft_runner.resources()
+        ))
 
-    # S02：合并 Kraken2 结果
-    s02_scripts = []
+    # S02：合并 Kraken2 结果，等待 S00 与全部样品的 S01
     soft_runner = Kraken2.Kraken2Runner2(config=config, id_list=dataList.id)
     soft_runner.print_command(should_print=args.print)
     merge_script = os.path.join(config.SHELL_PATH, "Tax.S02.Kraken2.Merge.sh")
     soft_runner.generate_script(merge_script)
-    s02_scripts.append(merge_script)
+    graph.add(
+        merge_script, stage="S02_Merge", depends=[stat_script] + s01_scripts,
+        resources=soft_runner.resources(),
+    )
+
+    return graph
+
+
+def run_all(args, config):
+    """
+    全流程（all 子命令）：在同一个依赖图中生成 BP、BP2、Tax、组装与 HGT 脚本。
+    - fq list 只读取一次，各子命令共用同一样品列表；
+    - BP S01 解压出的 FASTA 供 Kraken2 与 Megahit 复用，不再各自解压 FASTQ.gz；
+    - BP2 作为一个任务，在全部 BP S02 完成后生成并执行（见 BP2.BP2Runner）；
+    - HGT 使用同一样品组装出的 contig。
+    各脚本只等待自身的上游，不同子命令的阶段可在同一主机上交叠运行。
+    """
+    dataList = inputList.read_paired_list(args.file)
+    gene_types = (
+        args.GeneType.split(',')
+        if args.GeneType != 'ALL'
+        else ['ARGs', 'MGEs', 'MRGs', 'VFs', 'SGs']
+    )
+
+    graph = TaskGraph()
+    decoded = {}  # 样品 ID -> (_1.fa, _2.fa, BP S01 脚本)
+    run_bp(args, config, graph=graph, dataList=dataList, decoded=decoded)
+    s02_scripts = graph.stages()["S02_GeneAnno"]
+    if config.BP_DEREP_READS:
+        # 去重后的读库不能用于 Kraken2 与组装（它们不识别 SZ:i:N），改为读取原始 FASTQ
+        for i in range(dataList.number):
+            ID = dataList.id[i]
+            decoded[ID] = (dataList.file1[i], dataList.file2[i], decoded[ID][2])
+
+    # BP2：嵌套执行时沿用本次的配置与运行选项
+    options = []
+    if args.config:
+        options += ["--config", os.path.abspath(args.config) if os.path.exists(args.config) else args.config]
+    if args.metrics:
+        options.append("--metrics")
+    if args.resume:
+        options.append("--resume")
+    if args.aligner:
+        options += ["--aligner", args.aligner]
+    if args.blast_cache:
+        options += ["--blast-cache", os.path.abspath(args.blast_cache)]
+    if args.one_pass:
+        options.append("--one-pass")
+    soft_runner = BP2.BP2Runner(
+        config=config, fqlist=args.file, gene_types=gene_types, thread=args.thread,
+        print=args.print, samples=list(dataList.id), options=options,
+    )
+    soft_runner.print_command(should_print=args.print)
+    bp2_script = os.path.join(config.SHELL_PATH, "All.BP2.sh")
+    soft_runner.generate_script(bp2_script)
+    graph.add(bp2_script, stage="S03_BP2", depends=s02_scripts, resources=soft_runner.resources())
+
+    run_tax(args, config, graph=graph, dataList=dataList, decoded=decoded)
+
+    contigs = {}  # 样品 ID -> (contig 文件, 组装脚本)
+    if args.assembler == 'megahit':
+        run_megahit(args, config, graph=graph, dataList=dataList, decoded=decoded, contigs=contigs)
+    elif args.assembler == 'spades':
+        run_spades(args, config, graph=graph, dataList=dataList, contigs=contigs)
+    if contigs:
+        run_hgt(args, config, graph=graph, contigs=contigs, db=args.hgt_db)
+
+    return graph
 
-    # 返回分阶段 dict
-    return {
-        "S00_FastqStat": s00_scripts,
-        "S01_Kraken2": s01_scripts,
-        "S02_Merge": s02_scripts,
-    }
 
+def run_report(args, config):
+    """汇总 --metrics 记录的运行统计（report 子命令），不生成脚本。"""
+    metrics.report(
+        config.METRICS_PATH,
+        by=args.by or ['stage', 'tool', 'sample'],
+        all_runs=args.all_runs,
+    )
+    return TaskGraph()
+
+
+def run_plan(args, config):
+    """预测已生成脚本的各阶段完成时间（plan 子命令），不执行脚本。"""
+    cores = args.cores or hostResource.detect_cores()
+    mem = args.mem or hostResource.detect_memory() or float("inf")
+    pattern = f"tasks.{args.command}.jsonl" if args.command else "tasks.*.jsonl"
+    task_files = sorted(glob.glob(os.path.join(config.SHELL_PATH, pattern)))
+    if not task_files:
+        print(f"No task manifest found in {config.SHELL_PATH}. Generate scripts first.")
+
+    for task_file in task_files:
+        graph = TaskGraph.load(task_file)
+        costs = costModel.estimate(graph, config.METRICS_PATH)
+        lpt = costModel.simulate(graph, costs, cores, mem, lpt=True)
+        fifo = costModel.simulate(graph, costs, cores, mem, lpt=False)
+
+        print(f"\n==== {os.path.basename(task_file)}: {len(graph)} scripts, "
+              f"{cores} cores, {mem:.0f} GB ====")
+        print(f"{'Stage':<24}{'Scripts':>8}{'Task-h':>10}{'Start-h':>10}{'End-h':>10}")
+        for stage_name, stage_scripts in graph.stages().items():
+            print(f"{stage_name:<24}{len(stage_scripts):>8}"
+                  f"{sum(costs[s] for s in stage_scripts) / 3600:>10.2f}"
+                  f"{min(lpt[s][0] for s in stage_scripts) / 3600:>10.2f}"
+                  f"{max(lpt[s][1] for s in stage_scripts) / 3600:>10.2f}")
+        print(f"Predicted makespan: {max(end for _, end in lpt.values()) / 3600:.2f} h "
+              f"(longest-job-first), {max(end for _, end in fifo.values()) / 3600:.2f} h (list order)")
+    return TaskGraph()
+
+
+def run_worker(args, config):
+    """从共享任务队列领取并执行脚本（worker 子命令）。"""
+    queue = taskQueue.TaskQueue(args.queue)
+    for tasks_file in args.tasks:
+        queue.submit(tasks_file)
+    taskQueue.run_worker(
+        args.queue, cores=args.cores, mem=args.mem,
+        stale_timeout=args.stale_timeout, metrics_path=config.METRICS_PATH,
+    )
+    return TaskGraph()
 
-def run_spades(args, config):
-    """SPAdes 组装脚本生成（单阶段，每个样品一个脚本）。"""
+
+def run_concordance(args, config):
+    """
+    比较两个比对后端（concordance 子命令）：
+    S03_Concordance : 每个后端重新比对所选分块并计算丰度
+    S04_Concordance : 比较两个后端的丰度与最佳比对
+    """
+    if args.aligners[0] == args.aligners[1]:
+        sys.exit("Error: --aligners needs two different backends")
+    fileManager.mkdir(config.SHELL_PATH)
+    graph = TaskGraph()
+    for gtype in args.GeneType.split(','):
+        runs, align_scripts = [], []
+        for name in args.aligners:
+            soft_runner = BP2.ConcordanceAlign(
+                config=config, geneType=gtype, aligner=name, chunks=args.chunks, thread=args.thread,
+            )
+            soft_runner.process_files()
+            soft_runner.print_command(should_print=args.print)
+            script_path = os.path.join(config.SHELL_PATH, f"BP.Concordance.{gtype}.{name}.sh")
+            soft_runner.generate_script(script_path)
+            align_scripts.append(graph.add(
+                script_path, stage="S03_Concordance", resources=soft_runner.resources(),
+            ))
+            runs.append(soft_runner)
+
+        soft_runner = BP2.ConcordanceCompare(config=config, geneType=gtype, runs=runs)
+        soft_runner.print_command(should_print=args.print)
+        script_path = os.path.join(config.SHELL_PATH, f"BP.Concordance.{gtype}.compare.sh")
+        soft_runner.generate_script(script_path)
+        graph.add(script_path, stage="S04_Concordance", depends=align_scripts, resources=soft_runner.resources())
+        print(f"{gtype}: {' vs '.join(args.aligners)} on chunks {args.chunks} -> {soft_runner.report_file()}")
+    return graph
+
+
+def run_cache(args, config):
+    """查看或清理 BP2 的 BLAST 结果缓存（cache 子命令），不生成脚本。"""
+    cache = args.cache or config.BP_BLAST_CACHE
+    if not cache:
+        print("BP_BLAST_CACHE is not set in the configuration; use --cache to specify the cache file.")
+        sys.exit(1)
+    cmd = shlex.split(config.BP_BLAST_CACHE_SOFTWARE) + [args.action, "--cache", cache]
+    if args.action == 'prune':
+        if args.max_gb is None and args.older_than is None:
+            print("BPtracer cache prune needs --max-gb and/or --older-than.")
+            sys.exit(1)
+        if args.max_gb is not None:
+            cmd += ["--max-gb", str(args.max_gb)]
+        if args.older_than is not None:
+            cmd += ["--older-than", str(args.older_than)]
+    subprocess.run(cmd, check=True)
+    return TaskGraph()
+
+
+def run_spades(args, config, graph=None, dataList=None, contigs=None):
+    """
+    SPAdes 组装脚本生成（单阶段，每个样品一个脚本）。
+
+    SPAdes 的纠错需要碱基质量，因此始终读取原始 FASTQ；
+    contigs 不为 None 时记录 样品 ID -> (contig 文件, 组装脚本)，供 HGT 使用。
+    """
 
     fileManager.mkdir(config.SHELL_PATH)
     fileManager.mkdir(config.SPAdes_OUTPUT_PATH)
@@ -567,9 +1287,11 @@ def run_spades(args, config):
     print(f"Shells set to: {config.SHELL_PATH}")
     print(f"Results set to: {config.SPAdes_OUTPUT_PATH}")
 
-    dataList = inputList.read_paired_list(args.file)
+    if dataList is None:
+        dataList = inputList.read_paired_list(args.file)
 
-    all_scripts = []
+    if graph is None:
+        graph = TaskGraph()
     for i in range(dataList.number):
         ID = dataList.id[i]
         file1 = dataList.file1[i]
@@ -583,13 +1305,20 @@ def run_spades(args, config):
             config.SHELL_PATH, f"SPAdes.S01.Assambly.{ID}.sh"
         )
         soft_runner.generate_script(script_path)
-        all_scripts.append(script_path)
+        graph.add(script_path, stage="S01_SPAdes", resources=soft_runner.resources())
+        if contigs is not None:
+            contigs[ID] = (soft_runner.outputs()[0], script_path)
 
-    return all_scripts
+    return graph
 
 
-def run_megahit(args, config):
-    """Megahit 组装脚本生成（单阶段，每个样品一个脚本）。"""
+def run_megahit(args, config, graph=None, dataList=None, decoded=None, contigs=None):
+    """
+    Megahit 组装脚本生成（单阶段，每个样品一个脚本）。
+
+    decoded 不为 None 时读取 BP S01 解压出的 FASTA（Megahit 不使用碱基质量）；
+    contigs 不为 None 时记录 样品 ID -> (contig 文件, 组装脚本)，供 HGT 使用。
+    """
 
     fileManager.mkdir(config.SHELL_PATH)
     fileManager.mkdir(config.Megahit_OUTPUT_PATH)
@@ -597,13 +1326,19 @@ def run_megahit(args, config):
     print(f"Shells set to: {config.SHELL_PATH}")
     print(f"Results set to: {config.Megahit_OUTPUT_PATH}")
 
-    dataList = inputList.read_paired_list(args.file)
+    if dataList is None:
+        dataList = inputList.read_paired_list(args.file)
 
-    all_scripts = []
+    if graph is None:
+        graph = TaskGraph()
     for i in range(dataList.number):
         ID = dataList.id[i]
         file1 = dataList.file1[i]
         file2 = dataList.file2[i]
+        depends = []
+        if decoded is not None:
+            file1, file2, upstream = decoded[ID]
+            depends = [upstream]
 
         soft_runner = Megahit.MegahitRunner(
             config=config, id=ID, file1=file1, file2=file2
@@ -613,40 +1348,53 @@ def run_megahit(args, config):
             config.SHELL_PATH, f"Megahit.S01.Assambly.{ID}.sh"
         )
         soft_runner.generate_script(script_path)
-        all_scripts.append(script_path)
+        graph.add(
+            script_path, stage="S01_Megahit", depends=depends, resources=soft_runner.resources()
+        )
+        if contigs is not None:
+            contigs[ID] = (soft_runner.outputs()[0], script_path)
+
+    return graph
 
-    return all_scripts
 
+def run_hgt(args, config, graph=None, contigs=None, db=None):
+    """
+    HGT 检测脚本生成（单阶段，每个 contig 集合一个脚本）。
 
-def run_hgt(args, config):
-    """HGT 检测脚本生成（单阶段，每个 contig 集合一个脚本）。"""
+    contigs 由 all 子命令传入（见 run_megahit），此时不读取 --file，
+    每个脚本依赖生成其 contig 的组装脚本；db 缺省为 args.db。
+    """
 
     fileManager.mkdir(config.SHELL_PATH)
     fileManager.mkdir(config.HGT_OUTPUT_PATH)
 
-    config.set_HGT_database(args.db)
+    db = db or args.db
+    config.set_HGT_database(db)
     print(f"Output set to: {config.OUTPUT_PATH}")
     print(f"Shells set to: {config.SHELL_PATH}")
     print(f"Results set to: {config.HGT_OUTPUT_PATH}")
     print(f"Database set to: {config.BP_HGT_DATABASE}")
     print(f"Structure set to: {config.BP_HGT_STRUCTURE}")
 
-    dataList = inputList.read_single_list(args.file)
-
-    all_scripts = []
-    for i in range(dataList.number):
-        ID = dataList.id[i]
-        file1 = dataList.file1[i]
+    if contigs is None:
+        dataList = inputList.read_single_list(args.file)
+        contigs = {dataList.id[i]: (dataList.file1[i], None) for i in range(dataList.number)}
 
+    if graph is None:
+        graph = TaskGraph()
+    for ID, (file1, upstream) in contigs.items():
         soft_runner = HGT.HGTRunner(config=config, id=ID, file1=file1)
         soft_runner.print_command(should_print=args.print)
         script_path = os.path.join(
-            config.SHELL_PATH, f"HGT.S01.{args.db}.{ID}.sh"
+            config.SHELL_PATH, f"HGT.S01.{db}.{ID}.sh"
         )
         soft_runner.generate_script(script_path)
-        all_scripts.append(script_path)
+        graph.add(
+            script_path, stage="S01_HGT", depends=[upstream] if upstream else [],
+            resources=soft_runner.resources(),
+        )
 
-    return all_scripts
+    return graph
 
 
 # ----------------------------------------------------------------------
@@ -683,45 +1431,61 @@ def main():
     # args 已包含子命令参数，因此有 args.pwd
     config = init_config(args)
 
-    # 根据子命令分发，返回脚本列表或“阶段 -> 脚本列表”的 dict
-    scripts = []
+    # 根据子命令分发，返回记录脚本依赖关系的 TaskGraph
     if args.subparser_name == 'BP':
-        scripts = run_bp(args, config)
+        graph = run_bp(args, config)
     elif args.subparser_name == 'BP2':
-        scripts = run_bp2(args, config)
+        graph = run_bp2(args, config)
     elif args.subparser_name == 'Tax':
-        scripts = run_tax(args, config)
+        graph = run_tax(args, config)
     elif args.subparser_name == 'SPAdes':
-        scripts = run_spades(args, config)
+        graph = run_spades(args, config)
     elif args.subparser_name == 'Megahit':
-        scripts = run_megahit(args, config)
+        graph = run_megahit(args, config)
     elif args.subparser_name == 'HGT':
-        scripts = run_hgt(args, config)
+        graph = run_hgt(args, config)
+    elif args.subparser_name == 'all':
+        graph = run_all(args, config)
+    elif args.subparser_name == 'report':
+        graph = run_report(args, config)
+    elif args.subparser_name == 'plan':
+        graph = run_plan(args, config)
+    elif args.subparser_name == 'worker':
+        graph = run_worker(args, config)
+    elif args.subparser_name == 'concordance':
+        graph = run_concordance(args, config)
+    elif args.subparser_name == 'cache':
+        graph = run_cache(args, config)
     else:
         parser.print_help()
         sys.exit(1)
 
-    # 如果开启 auto-run，则执行已生成脚本
-    if args.auto_run and scripts:
-        runner = BaseRunner()
-
-        # 情况 1：普通子命令，返回的是 List[str]，当成单阶段处理
-        if isinstance(scripts, list):
-            print(f"[auto-run] Running {len(scripts)} scripts in parallel...")
-            runner.run_scripts_parallel(scripts, max_workers=args.max_workers)
-            print("[auto-run] All scripts finished.")
-
-        # 情况 2：多阶段子命令（BP、BP2、Tax），返回的是 Dict[str, List[str]]
-        elif isinstance(scripts, dict):
-            # 利用 dict 的插入顺序：按返回时的顺序依次执行各阶段
-            for stage_name, stage_scripts in scripts.items():
-                if not stage_scripts:
-                    continue
-                print(f"[auto-run] {stage_name}: running {len(stage_scripts)} scripts in parallel...")
-                runner.run_scripts_parallel(stage_scripts, max_workers=args.max_workers)
-                print(f"[auto-run] {stage_name} finished.")
-
-            print("[auto-run] All stages finished.")
+    # 记录依赖图，供 BPtracer plan / worker 使用
+    if len(graph):
+        graph.save(os.path.join(config.SHELL_PATH, f"tasks.{args.subparser_name}.jsonl"))
+
+    # 如果开启 auto-run，则按依赖关系执行已生成脚本：
+    # 每个脚本在其上游脚本全部完成后立即启动，阶段之间不再整体等待；
+    # 并发数由各脚本声明的 CPU/内存需求与主机预算（--cores/--mem）共同决定
+    if args.auto_run and len(graph):
+        for stage_name, stage_scripts in graph.stages().items():
+            print(f"[auto-run] {stage_name}: {len(stage_scripts)} scripts")
+        if args.executor != 'local':
+            # 集群执行：每个阶段按资源分组提交为数组作业
+            print(f"[auto-run] Submitting {len(graph)} scripts to {args.executor}...")
+            backend = batchExecutor.BACKENDS[args.executor](config, max_workers=args.max_workers)
+            status = backend.run(graph, resume=args.resume)
+        else:
+            print(f"[auto-run] Running {len(graph)} scripts by dependency order...")
+            status = graph.run(
+                max_workers=args.max_workers, cores=args.cores, mem=args.mem,
+                resume=args.resume, metrics_path=config.METRICS_PATH,
+            )
+        # 有脚本失败（或因上游失败未执行）时以非 0 状态退出
+        if status["failed"] or status["skipped"]:
+            sys.exit(f"[auto-run] {len(status['failed'])} scripts failed, "
+                     f"{len(status['skipped'])} skipped; see {os.path.join(config.SHELL_PATH, 'logs')}")
+        print("[auto-run] All stages finished.")
 
 
 if __name__ == '__main__':
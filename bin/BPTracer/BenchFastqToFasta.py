@@ -0,0 +1,97 @@
+"""
+FastqToFasta.py 与 Fq2fa.pl 的对比测试：
+
+    python3 BenchFastqToFasta.py [-i A1_1.fq.gz A1_2.fq.gz] [-n 2000000] [-t 8]
+
+未指定 -i 时生成一对随机的 150 bp 双端 FASTQ.gz（-n 条 reads；装有 bgzip 时另生成
+BGZF 版本）。分别用 Fq2fa.pl（两个文件依次转换，与旧版 S01 相同）和 FastqToFasta.py
+（两个文件同时转换）处理，校验输出的 MD5 一致并打印耗时。
+"""
+
+import os
+import sys
+import gzip
+import time
+import random
+import hashlib
+import argparse
+import tempfile
+import subprocess
+
+BIN_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def simulate_fastq(path, reads, length=150, seed=0):
+    rng = random.Random(seed)
+    with gzip.open(path, "wb", compresslevel=6) as f:
+        for i in range(reads):
+            seq = "".join(rng.choice("ACGT") for _ in range(length))
+            f.write(f"@read{i}/1 sim\n{seq}\n+\n{'I' * length}\n".encode())
+
+
+def md5(path):
+    digest = hashlib.md5()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 ** 2), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def timed(commands):
+    start = time.time()
+    for command in commands:
+        subprocess.run(command, check=True, stdout=subprocess.DEVNULL)
+    return time.time() - start
+
+
+def bench(inputs, workdir, threads):
+    perl_out = [os.path.join(workdir, f"perl_{i}.fa") for i in range(len(inputs))]
+    native_out = [os.path.join(workdir, f"native_{i}.fa") for i in range(len(inputs))]
+
+    perl_time = timed([["perl", os.path.join(BIN_DIR, "Fq2fa.pl"), fq, fa] for fq, fa in zip(inputs, perl_out)])
+    native_args = [arg for pair in zip(inputs, native_out) for arg in pair]
+    native_time = timed([[sys.executable, os.path.join(BIN_DIR, "FastqToFasta.py"), "-t", str(threads)] + native_args])
+
+    identical = all(md5(a) == md5(b) for a, b in zip(perl_out, native_out))
+    size_gb = sum(os.path.getsize(fq) for fq in inputs) / 1024 ** 3
+    print(f"{'Fq2fa.pl':<20}{perl_time:>10.2f} s")
+    print(f"{'FastqToFasta.py':<20}{native_time:>10.2f} s  ({perl_time / native_time:.2f}x, "
+          f"{size_gb / native_time * 3600:.1f} GB/h compressed input)")
+    print(f"Output identical: {identical}")
+    return identical
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark FastqToFasta.py against Fq2fa.pl")
+    parser.add_argument("-i", "--input", nargs="+", help="FASTQ.gz files to convert (default: simulated pair)")
+    parser.add_argument("-n", "--reads", type=int, default=2000000, help="Reads per simulated file (default: 2000000)")
+    parser.add_argument("-t", "--threads", type=int, default=8, help="Threads for FastqToFasta.py (default: 8)")
+    parser.add_argument("-w", "--workdir", default=None, help="Working folder (default: a temporary folder)")
+    args = parser.parse_args()
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="bench_fq2fa.")
+    os.makedirs(workdir, exist_ok=True)
+    inputs = args.input
+    if not inputs:
+        inputs = [os.path.join(workdir, f"sim_{r}.fq.gz") for r in (1, 2)]
+        for seed, path in enumerate(inputs):
+            simulate_fastq(path, args.reads, seed=seed)
+
+    print(f"==== gzip input ({', '.join(inputs)}) ====")
+    ok = bench(inputs, workdir, args.threads)
+
+    if not args.input and subprocess.run("command -v bgzip", shell=True, stdout=subprocess.DEVNULL).returncode == 0:
+        bgzf_inputs = []
+        for path in inputs:
+            bgzf = path.replace(".fq.gz", ".bgzf.fq.gz")
+            subprocess.run(f"gzip -dc {path} | bgzip -@ {args.threads} > {bgzf}", shell=True, check=True)
+            bgzf_inputs.append(bgzf)
+        print("==== BGZF input ====")
+        ok = bench(bgzf_inputs, workdir, args.threads) and ok
+
+    print(f"Files kept in {workdir}")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,417 @@
+"""
+BP2 S03 的 BLAST 结果缓存（BP_BLAST_CACHE）：跨批次、跨项目复用相同序列的比对结果。
+
+    python3 BlastCache.py run --cache blast_hits.sqlite --max-gb 20 -q temp.0.fa -o temp.0.fa.m8 -- \
+        blastx -query {query} -out {out} -db Gene-ARG.faa -evalue 1e-7 -num_threads 8 -outfmt 6 -max_target_seqs 1
+    python3 BlastCache.py stats --cache blast_hits.sqlite
+    python3 BlastCache.py prune --cache blast_hits.sqlite --max-gb 10 --older-than 180
+
+- 缓存为 SQLite 文件，键为 (搜索, 序列哈希)；搜索由数据库内容的校验和、比对程序版本与
+  影响结果的参数（去掉查询、输出、数据库路径与线程数）确定，数据库或参数变化时自然不再命中；
+- 比对程序可为 blastx、diamond 或 mmseqs（见 bptracer/aligner.py），数据库不由 -db 给出时用 --db 指定；
+- 值为该序列全部 outfmt 6 比对行去掉查询 ID 后的部分（-max_target_seqs 1 时即最佳比对），
+  没有比对的序列同样缓存，写出时换回本次的查询 ID，结果与直接比对相同；
+- run 只把未命中的序列（分块内相同的序列只取一条）交给比对程序，新结果写回缓存；
+- 每条记录带最近使用时间，超过 --max-gb 时按最近最少使用淘汰到上限的 90%。
+"""
+
+import os
+import sys
+import time
+import sqlite3
+import hashlib
+import argparse
+import subprocess
+
+# 每次 IN 查询的序列数（低于 SQLite 的变量个数上限）
+LOOKUP_BATCH = 500
+# 每条记录在键与比对行之外的估计开销（字节），用于估算缓存大小
+ROW_OVERHEAD = 48
+# 超过上限时淘汰到上限的比例，避免每个分块都触发淘汰
+PRUNE_TARGET = 0.9
+# 不影响比对结果、不参与缓存键的线程数参数（blastx、diamond、mmseqs，均带一个值）
+THREAD_OPTIONS = {"-num_threads", "-p", "--threads"}
+# 数据库校验和的读块大小
+CHECKSUM_BLOCK = 16 * 1024 ** 2
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS searches (
+    id INTEGER PRIMARY KEY,
+    db_checksum TEXT NOT NULL,
+    params TEXT NOT NULL,
+    db_path TEXT,
+    lookups INTEGER NOT NULL DEFAULT 0,
+    found INTEGER NOT NULL DEFAULT 0,
+    UNIQUE (db_checksum, params)
+);
+CREATE TABLE IF NOT EXISTS hits (
+    search_id INTEGER NOT NULL,
+    seq_hash BLOB NOT NULL,
+    hits BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    last_used INTEGER NOT NULL,
+    PRIMARY KEY (search_id, seq_hash)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS hits_last_used ON hits (last_used);
+CREATE TABLE IF NOT EXISTS databases (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    checksum TEXT NOT NULL
+);
+"""
+
+
+def connect(cache_file):
+    """
+    打开（必要时创建）缓存；多个 S03 脚本同时写入时等待锁。
+
+    使用 WAL 日志，读取不会被正在进行的写入阻塞；WAL 依赖共享内存，缓存文件须在本地盘上。
+    """
+    if os.path.dirname(cache_file):
+        os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+    db = sqlite3.connect(cache_file, timeout=600, isolation_level=None)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA synchronous=NORMAL")
+    db.executescript(SCHEMA)
+    return db
+
+
+def sequence_hash(seq):
+    """序列哈希（不区分大小写）。"""
+    return hashlib.blake2b(seq.upper(), digest_size=16).digest()
+
+
+def database_files(db_path):
+    """BLAST 数据库对应的文件：FASTA 本身，不存在时为 makeblastdb 生成的各文件。"""
+    if os.path.isfile(db_path):
+        return [db_path]
+    directory = os.path.dirname(db_path) or "."
+    name = os.path.basename(db_path) + "."
+    files = sorted(os.path.join(directory, f) for f in os.listdir(directory) if f.startswith(name))
+    if not files:
+        raise FileNotFoundError(f"BLAST database not found: {db_path}")
+    return files
+
+
+def database_checksum(db, db_path):
+    """
+    数据库内容的校验和；按 路径、大小、修改时间 记在缓存中，数据库不变时不重复计算。
+    """
+    checksum = hashlib.sha1()
+    for path in database_files(db_path):
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        row = db.execute("SELECT size, mtime_ns, checksum FROM databases WHERE path = ?", (path,)).fetchone()
+        if row and row[0] == stat.st_size and row[1] == stat.st_mtime_ns:
+            file_checksum = row[2]
+        else:
+            digest = hashlib.sha1()
+            with open(path, "rb") as f:
+                for block in iter(lambda: f.read(CHECKSUM_BLOCK), b""):
+                    digest.update(block)
+            file_checksum = digest.hexdigest()
+            db.execute("INSERT OR REPLACE INTO databases VALUES (?, ?, ?, ?)",
+                       (path, stat.st_size, stat.st_mtime_ns, file_checksum))
+        checksum.update(file_checksum.encode())
+    return checksum.hexdigest()
+
+
+def program_version(program):
+    """比对程序的版本（-version / --version / version 的第一行输出），取不到时为程序名。"""
+    for option in ("-version", "--version", "version"):
+        try:
+            result = subprocess.run([program, option], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                    text=True, timeout=60)
+        except (OSError, subprocess.TimeoutExpired):
+            break
+        if result.returncode == 0 and result.stdout.strip():
+            return result.stdout.strip().splitlines()[0]
+    return os.path.basename(program)
+
+
+def search_key(command, db_path=None):
+    """
+    从比对命令中取出数据库路径与影响结果的参数。
+
+    参数:
+    - command (List[str]): 比对命令，含 {query}/{out} 占位符。
+    - db_path (str): 数据库路径；None 时取 -db 的值。
+
+    返回:
+    - Tuple[str, str]: (数据库路径, 参数字符串)。
+    """
+    if db_path is None and "-db" in command[:-1]:
+        db_path = command[command.index("-db") + 1]
+    if db_path is None:
+        raise ValueError("The command has no -db option; give the database with --db")
+    params = [os.path.basename(command[0])]
+    i = 1
+    while i < len(command):
+        if command[i] in THREAD_OPTIONS:
+            i += 2
+            continue
+        if command[i] != db_path and "{query}" not in command[i] and "{out}" not in command[i]:
+            params.append(command[i])
+        i += 1
+    return db_path, " ".join(params)
+
+
+def get_search(db, db_path, params):
+    """返回 (数据库校验和, 参数) 对应的搜索 ID，不存在时创建。"""
+    checksum = database_checksum(db, db_path)
+    db.execute("INSERT OR IGNORE INTO searches (db_checksum, params, db_path) VALUES (?, ?, ?)",
+               (checksum, params, os.path.abspath(db_path)))
+    return db.execute("SELECT id FROM searches WHERE db_checksum = ? AND params = ?", (checksum, params)).fetchone()[0]
+
+
+def read_fasta(path):
+    """读取 FASTA，返回 [(查询 ID, 标题行, 序列)]；查询 ID 为标题行的第一个词（与 BLAST 的 qseqid 相同）。"""
+    records = []
+    header, seq = None, []
+    with open(path, "rb") as f:
+        for line in f:
+            line = line.rstrip(b"\r\n")
+            if line.startswith(b">"):
+                if header is not None:
+                    records.append((header[1:].split(None, 1)[0], header, b"".join(seq)))
+                header, seq = line, []
+            elif line:
+                seq.append(line.strip())
+    if header is not None:
+        records.append((header[1:].split(None, 1)[0], header, b"".join(seq)))
+    return records
+
+
+def lookup(db, search_id, hashes, now):
+    """
+    查询缓存并更新命中记录的最近使用时间。
+
+    返回:
+    - Dict[bytes, bytes]: 序列哈希 -> 去掉查询 ID 的比对行（没有比对时为空）。
+    """
+    cached = {}
+    unique = list(dict.fromkeys(hashes))
+    for i in range(0, len(unique), LOOKUP_BATCH):
+        batch = unique[i:i + LOOKUP_BATCH]
+        marks = ",".join("?" * len(batch))
+        cached.update(db.execute(
+            f"SELECT seq_hash, hits FROM hits WHERE search_id = ? AND seq_hash IN ({marks})",
+            [search_id] + batch,
+        ).fetchall())
+    db.execute("BEGIN IMMEDIATE")
+    db.executemany("UPDATE hits SET last_used = ? WHERE search_id = ? AND seq_hash = ?",
+                   [(now, search_id, h) for h in cached])
+    db.execute("UPDATE searches SET lookups = lookups + ?, found = found + ? WHERE id = ?",
+               (len(hashes), sum(1 for h in hashes if h in cached), search_id))
+    db.execute("COMMIT")
+    return {h: bytes(v) for h, v in cached.items()}
+
+
+def run_blast(command, misses, prefix):
+    """
+    对未命中的序列运行比对程序。
+
+    参数:
+    - command (List[str]): 比对命令，{query}/{out} 为查询与输出文件的占位符。
+    - misses (Dict[bytes, bytes]): 序列哈希 -> 序列。
+    - prefix (str): 临时文件的前缀。
+
+    返回:
+    - Dict[bytes, bytes]: 序列哈希 -> 去掉查询 ID 的比对行。
+    """
+    query, out = prefix + ".miss.fa", prefix + ".miss.m8"
+    # 以序号作为查询 ID，避免比对程序改写特殊格式的 ID
+    by_id = {}
+    with open(query, "wb") as f:
+        for i, (h, seq) in enumerate(misses.items()):
+            qid = b"q%d" % i
+            f.write(b">" + qid + b"\n" + seq + b"\n")
+            by_id[qid] = h
+    try:
+        subprocess.run([arg.replace("{query}", query).replace("{out}", out) for arg in command], check=True)
+        results = {h: [] for h in misses}
+        with open(out, "rb") as f:
+            for line in f:
+                qid, _, rest = line.partition(b"\t")
+                results[by_id[qid]].append(rest)
+    finally:
+        for path in (query, out):
+            if os.path.exists(path):
+                os.remove(path)
+    return {h: b"".join(lines) for h, lines in results.items()}
+
+
+def store(db, search_id, results, now):
+    """写入新的比对结果。"""
+    db.execute("BEGIN IMMEDIATE")
+    db.executemany(
+        "INSERT OR REPLACE INTO hits VALUES (?, ?, ?, ?, ?)",
+        [(search_id, h, v, len(h) + len(v) + ROW_OVERHEAD, now) for h, v in results.items()],
+    )
+    db.execute("COMMIT")
+
+
+def cache_size(db):
+    """缓存中全部记录的估计大小（字节）与记录数。"""
+    size, entries = db.execute("SELECT COALESCE(SUM(size), 0), COUNT(*) FROM hits").fetchone()
+    return size, entries
+
+
+def prune(db, max_bytes=None, older_than=None, now=None):
+    """
+    淘汰缓存记录。
+
+    参数:
+    - max_bytes (int): 估计大小上限；超过时按最近使用时间从旧到新删除，直到不超过上限的 PRUNE_TARGET。
+    - older_than (float): 删除超过这么多秒未使用的记录。
+
+    返回:
+    - int: 删除的记录数。
+    """
+    now = int(time.time()) if now is None else now
+    removed = 0
+    db.execute("BEGIN IMMEDIATE")
+    if older_than is not None:
+        removed += db.execute("DELETE FROM hits WHERE last_used < ?", (now - older_than,)).rowcount
+    if max_bytes is not None:
+        size, _ = cache_size(db)
+        if size > max_bytes:
+            excess = size - int(max_bytes * PRUNE_TARGET)
+            # 找到累计大小达到超出量的最近使用时间，删除该时间及更早的记录
+            freed = 0
+            cutoff = None
+            for last_used, batch in db.execute(
+                    "SELECT last_used, SUM(size) FROM hits GROUP BY last_used ORDER BY last_used"):
+                freed += batch
+                cutoff = last_used
+                if freed >= excess:
+                    break
+            removed += db.execute("DELETE FROM hits WHERE last_used <= ?", (cutoff,)).rowcount
+    db.execute("DELETE FROM searches WHERE id NOT IN (SELECT DISTINCT search_id FROM hits)")
+    db.execute("COMMIT")
+    return removed
+
+
+def run(args):
+    """比对一个分块：缓存命中的序列直接取结果，其余交给比对程序。"""
+    command = args.command[1:] if args.command[:1] == ["--"] else args.command
+    if not command:
+        raise SystemExit("BlastCache.py run: missing alignment command after --")
+    db_path, params = search_key(command, args.db)
+    params = program_version(command[0]) + " | " + params
+    now = int(time.time())
+
+    records = read_fasta(args.query)
+    hashes = [sequence_hash(seq) for _, _, seq in records]
+    db = connect(args.cache)
+    try:
+        search_id = get_search(db, db_path, params)
+        cached = lookup(db, search_id, hashes, now)
+        # 分块内相同的序列只比对一条
+        misses = {}
+        for (_, _, seq), h in zip(records, hashes):
+            if h not in cached and h not in misses:
+                misses[h] = seq
+        if misses:
+            results = run_blast(command, misses, args.output)
+            store(db, search_id, results, now)
+            cached.update(results)
+        if args.max_gb is not None:
+            removed = prune(db, max_bytes=args.max_gb * 1024 ** 3, now=now)
+            if removed:
+                print(f"Evicted {removed} least recently used entries from {args.cache}", file=sys.stderr)
+    finally:
+        db.close()
+
+    with open(args.output + ".tmp", "wb") as out:
+        for (qid, _, _), h in zip(records, hashes):
+            for rest in cached[h].splitlines(keepends=True):
+                out.write(qid + b"\t" + rest)
+    os.replace(args.output + ".tmp", args.output)
+    unique = len(set(hashes))
+    print(f"{len(records)} queries ({unique} distinct sequences): {unique - len(misses)} from cache, "
+          f"{len(misses)} searched", file=sys.stderr)
+
+
+def stats(args):
+    """打印缓存的记录数、大小与各搜索的命中率。"""
+    if not os.path.exists(args.cache):
+        print(f"No BLAST cache at {args.cache}")
+        return
+    db = connect(args.cache)
+    try:
+        size, entries = cache_size(db)
+        oldest, newest = db.execute("SELECT MIN(last_used), MAX(last_used) FROM hits").fetchone()
+        print(f"Cache file:   {args.cache} ({os.path.getsize(args.cache) / 1024 ** 2:.1f} MB on disk)")
+        print(f"Entries:      {entries} ({size / 1024 ** 2:.1f} MB estimated)")
+        if entries:
+            print(f"Last used:    {time.strftime('%Y-%m-%d %H:%M', time.localtime(oldest))} - "
+                  f"{time.strftime('%Y-%m-%d %H:%M', time.localtime(newest))}")
+        rows = db.execute("""
+            SELECT s.db_path, s.db_checksum, s.params, s.lookups, s.found,
+                   COUNT(h.seq_hash), COALESCE(SUM(h.hits = x''), 0)
+            FROM searches s LEFT JOIN hits h ON h.search_id = s.id
+            GROUP BY s.id ORDER BY s.db_path, s.id
+        """).fetchall()
+        for db_path, checksum, params, lookups, found, count, no_hit in rows:
+            hit_rate = f"{found / lookups:.1%}" if lookups else "-"
+            print(f"\n{db_path} [{checksum[:12]}]\n  {params}\n"
+                  f"  entries {count} (without hits {no_hit}), lookups {lookups}, cache hit rate {hit_rate}")
+    finally:
+        db.close()
+
+
+def prune_command(args):
+    """按大小上限与未使用时间淘汰记录，并回收文件空间。"""
+    if not os.path.exists(args.cache):
+        print(f"No BLAST cache at {args.cache}")
+        return
+    db = connect(args.cache)
+    try:
+        before = os.path.getsize(args.cache)
+        removed = prune(
+            db,
+            max_bytes=args.max_gb * 1024 ** 3 if args.max_gb is not None else None,
+            older_than=args.older_than * 86400 if args.older_than is not None else None,
+        )
+        db.execute("VACUUM")
+        size, entries = cache_size(db)
+    finally:
+        db.close()
+    print(f"Removed {removed} entries, {entries} left ({size / 1024 ** 2:.1f} MB estimated); "
+          f"file {before / 1024 ** 2:.1f} MB -> {os.path.getsize(args.cache) / 1024 ** 2:.1f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Content-addressed cache of BLAST hits shared by BP2 runs")
+    subparsers = parser.add_subparsers(dest="action", required=True)
+
+    run_parser = subparsers.add_parser("run", help="BLAST the cache misses of a query FASTA and merge the cached hits")
+    run_parser.add_argument("--cache", required=True, help="SQLite cache file")
+    run_parser.add_argument("-q", "--query", required=True, help="Query FASTA (a BP2 chunk)")
+    run_parser.add_argument("-o", "--output", required=True, help="BLAST result (outfmt 6) for all queries")
+    run_parser.add_argument("--db", default=None, help="Database searched by the command (default: the value of -db)")
+    run_parser.add_argument("--max-gb", type=float, default=None, help="Evict least recently used entries above this size")
+    run_parser.add_argument("command", nargs=argparse.REMAINDER,
+                            help="Alignment command after --, with {query} and {out} placeholders")
+
+    stats_parser = subparsers.add_parser("stats", help="Show entries, size and hit rate of the cache")
+    stats_parser.add_argument("--cache", required=True, help="SQLite cache file")
+
+    prune_parser = subparsers.add_parser("prune", help="Evict entries and compact the cache file")
+    prune_parser.add_argument("--cache", required=True, help="SQLite cache file")
+    prune_parser.add_argument("--max-gb", type=float, default=None, help="Evict least recently used entries above this size")
+    prune_parser.add_argument("--older-than", type=float, default=None, help="Evict entries unused for this many days")
+
+    args = parser.parse_args()
+    if args.action == "run":
+        run(args)
+    elif args.action == "stats":
+        stats(args)
+    else:
+        prune_command(args)
+
+
+if __name__ == "__main__":
+    main()
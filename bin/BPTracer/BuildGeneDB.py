@@ -0,0 +1,55 @@
+"""
+构建 ARGs、MGEs、MRGs、VFs、SGs 的合并 diamond 库（BP --combined-db 使用）：
+
+    python3 BuildGeneDB.py --diamond <diamond> -o Gene-ALL \
+        --faa ARGs:Gene-ARG.faa --faa MGEs:Gene-MGE.faa --faa MRGs:Gene-MRG.faa --faa VFs:Gene-VFs.faa --faa SGs:Gene-SGs.faa
+
+各序列的 ID 加上类型前缀（ARGs|原 ID），写出 Gene-ALL.faa 并由 diamond makedb 生成 Gene-ALL.dmnd。
+"""
+
+import argparse
+import subprocess
+
+TYPE_SEP = "|"
+
+
+def merge_faa(faa_files, output_faa):
+    """
+    合并各类型的氨基酸序列并为 ID 加上类型前缀。
+
+    参数:
+    - faa_files (Dict[str, str]): 基因类型 -> .faa 文件。
+    - output_faa (str): 输出文件。
+
+    返回:
+    - Dict[str, int]: 各类型的序列数。
+    """
+    counts = {}
+    with open(output_faa, "w") as out:
+        for gene_type, path in faa_files.items():
+            counts[gene_type] = 0
+            with open(path, "r") as f:
+                for line in f:
+                    if line.startswith(">"):
+                        line = f">{gene_type}{TYPE_SEP}{line[1:].lstrip()}"
+                        counts[gene_type] += 1
+                    out.write(line)
+    return counts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build one diamond database holding all gene types with type-tagged subject IDs")
+    parser.add_argument("--faa", action="append", required=True, metavar="TYPE:FAA",
+                        help="Gene type and its protein FASTA, e.g. ARGs:Gene-ARG.faa (repeatable)")
+    parser.add_argument("-o", "--output", required=True, help="Output prefix, e.g. Gene-ALL (writes .faa and .dmnd)")
+    parser.add_argument("--diamond", default="diamond", help="diamond executable (default: diamond)")
+    parser.add_argument("-p", "--threads", type=int, default=8, help="Threads for diamond makedb (default: 8)")
+    args = parser.parse_args()
+
+    faa_files = dict(item.split(":", 1) for item in args.faa)
+    output_faa = args.output + ".faa"
+    counts = merge_faa(faa_files, output_faa)
+    for gene_type, n in counts.items():
+        print(f"{gene_type}: {n} sequences")
+    subprocess.run([args.diamond, "makedb", "--in", output_faa, "-d", args.output, "-p", str(args.threads)], check=True)
+    print(f"Combined database written to {args.output}.dmnd")
@@ -0,0 +1,88 @@
+"""
+从功能基因的氨基酸序列构建预过滤（BP --prefilter）的种子索引，每个 diamond 库构建一次：
+
+    python3 BuildSeedIndex.py --faa Gene-ARG.faa -o Gene-ARG.seeds.npz
+    python3 BuildSeedIndex.py --faa Gene-ARG.faa Gene-MGE.faa Gene-MRG.faa Gene-VFs.faa Gene-SGs.faa -o Gene-ALL.seeds.npz
+
+BP 按 diamond 库的路径查找索引（Gene-ARG.dmnd -> Gene-ARG.seeds.npz）。
+全部序列在约简字母表上的间隔种子经哈希写入 2^hash_bits 位的位图；位图越大、种子越长，
+随机 reads 的误命中越少，但灵敏度随种子变长而下降，可用 PrefilterReads.py --truth 在基准样品上评估。
+"""
+
+import argparse
+import numpy as np
+
+from PrefilterReads import AA_CODE, INVALID, seed_offsets, seed_hashes
+
+# 每批编码的残基数
+BATCH_RESIDUES = 16 * 1024 ** 2
+# 每个字节中置位的个数
+POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def read_proteins(faa_files):
+    """按批返回约简编码后的蛋白序列（序列之间以 INVALID 分隔）。"""
+    batch = []
+    size = 0
+    for faa in faa_files:
+        with open(faa, "rb") as f:
+            for line in f:
+                if line.startswith(b">"):
+                    batch.append(b"*")
+                    size += 1
+                    if size >= BATCH_RESIDUES:
+                        yield AA_CODE[np.frombuffer(b"".join(batch), dtype=np.uint8)]
+                        batch, size = [], 0
+                else:
+                    seq = line.strip()
+                    batch.append(seq)
+                    size += len(seq)
+    if batch:
+        yield AA_CODE[np.frombuffer(b"".join(batch) + b"*", dtype=np.uint8)]
+
+
+def build_index(faa_files, shape, hash_bits):
+    """
+    参数:
+    - faa_files (List[str]): 氨基酸序列文件。
+    - shape (str): 种子形状。
+    - hash_bits (int): 位图大小为 2^hash_bits 位。
+
+    返回:
+    - Tuple[np.ndarray, int]: (位图, 种子数)。
+    """
+    offsets = seed_offsets(shape)
+    bits = np.zeros(2 ** hash_bits // 8, dtype=np.uint8)
+    seeds = 0
+    for residues in read_proteins(faa_files):
+        assert residues[-1] == INVALID
+        _, hashes = seed_hashes(residues, offsets, 1, hash_bits)
+        seeds += len(hashes)
+        hashes = np.unique(hashes)
+        np.bitwise_or.at(bits, hashes >> np.uint64(3), (1 << (hashes & np.uint64(7))).astype(np.uint8))
+    return bits, seeds
+
+
+def occupancy(bits):
+    """位图中置位的比例（分块计数，避免展开整个位图）。"""
+    step = 16 * 1024 ** 2
+    ones = sum(int(POPCOUNT[bits[i:i + step]].sum(dtype=np.int64)) for i in range(0, bits.size, step))
+    return ones / (bits.size * 8)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the seed index used by PrefilterReads.py from protein FASTA files")
+    parser.add_argument("--faa", nargs="+", required=True, help="Protein FASTA files of the gene database")
+    parser.add_argument("-o", "--output", required=True, help="Output index (.npz), e.g. Gene-ARG.seeds.npz")
+    parser.add_argument("--shape", default="111101110111",
+                        help="Spaced seed over the reduced amino-acid alphabet (default: 111101110111)")
+    parser.add_argument("--hash-bits", type=int, default=32,
+                        help="Bitmap of 2^N bits, 2^(N-3) bytes on disk and in memory (default: 32)")
+    args = parser.parse_args()
+
+    if not 10 <= args.hash_bits <= 36:
+        parser.error("--hash-bits must be between 10 and 36")
+    bits, seeds = build_index(args.faa, args.shape, args.hash_bits)
+    with open(args.output, "wb") as f:
+        np.savez(f, bits=bits, shape=np.array(args.shape), hash_bits=np.array(args.hash_bits))
+    print(f"{seeds} seeds from {len(args.faa)} files written to {args.output} (bitmap occupancy {occupancy(bits):.4%})")
@@ -0,0 +1,122 @@
+"""
+比较两个比对后端在同一批分块上的结果（BPtracer concordance）：
+
+    python3 CompareAbundance.py --names blastx diamond-more-sensitive \
+        --ppm blastx/OUT.ARGs.ppm.txt diamond-more-sensitive/OUT.ARGs.ppm.txt \
+        --m8 blastx/ARGs.blast.m8 diamond-more-sensitive/ARGs.blast.m8 \
+        --time blastx/align.time diamond-more-sensitive/align.time \
+        -o ARGs.blastx.vs.diamond-more-sensitive.tsv
+
+- 每个基因一行：两个后端在各样品上的平均 ppm、差值（B - A）、相对差值与单个样品的最大绝对差值，
+  按最大绝对差值降序排列；
+- 汇总（同名 .json，并打印）：检出基因数、总 ppm、全部 基因×样品 ppm 的 Pearson 相关系数，
+  以及按查询序列比较的最佳比对一致率和两个后端的比对耗时。
+"""
+
+import os
+import json
+import argparse
+import numpy as np
+import pandas as pd
+
+KEY_COLUMNS = ["Gene", "Subtype", "Type"]
+
+
+def read_ppm(ppm_file):
+    """读取 GeneAbundance 的 OUT.*.ppm.txt，返回以 (Gene, Subtype, Type) 为索引的样品 ppm 表。"""
+    return pd.read_csv(ppm_file, sep="\t").set_index(KEY_COLUMNS)
+
+
+def read_best_hits(m8_file):
+    """每条查询序列的第一条比对（即最佳比对）的目标基因。"""
+    hits = pd.read_csv(m8_file, sep="\t", header=None, usecols=[0, 1], names=["query", "gene"], dtype=str)
+    return hits.drop_duplicates("query").set_index("query")["gene"]
+
+
+def read_seconds(time_file):
+    """align.time 中记录的开始与结束时间（秒）之差。"""
+    with open(time_file) as f:
+        stamps = [float(line) for line in f if line.strip()]
+    return stamps[-1] - stamps[0] if len(stamps) >= 2 else None
+
+
+def compare_ppm(ppm_a, ppm_b, names):
+    """
+    参数:
+    - ppm_a, ppm_b (DataFrame): read_ppm 的结果。
+    - names (List[str]): 两个后端的名称。
+
+    返回:
+    - Tuple[DataFrame, dict]: (每个基因的比较表, 汇总)。
+    """
+    genes = ppm_a.index.union(ppm_b.index)
+    samples = ppm_a.columns.union(ppm_b.columns, sort=False)
+    a = ppm_a.reindex(index=genes, columns=samples, fill_value=0).astype(float)
+    b = ppm_b.reindex(index=genes, columns=samples, fill_value=0).astype(float)
+    diff = b - a
+
+    table = pd.DataFrame(index=genes)
+    table[f"ppm_{names[0]}"] = a.mean(axis=1)
+    table[f"ppm_{names[1]}"] = b.mean(axis=1)
+    table["delta"] = diff.mean(axis=1)
+    # 相对差值：以两者平均值为分母，两者均为 0 时为 0
+    denominator = (table[f"ppm_{names[0]}"] + table[f"ppm_{names[1]}"]) / 2
+    table["relative_delta"] = (table["delta"] / denominator.where(denominator > 0)).fillna(0)
+    table["max_abs_sample_delta"] = diff.abs().max(axis=1)
+    table = table[(a > 0).any(axis=1) | (b > 0).any(axis=1)]
+    table = table.sort_values("max_abs_sample_delta", ascending=False)
+
+    values_a, values_b = a.to_numpy().ravel(), b.to_numpy().ravel()
+    pearson = float(np.corrcoef(values_a, values_b)[0, 1]) if values_a.std() > 0 and values_b.std() > 0 else None
+    summary = {
+        "samples": len(samples),
+        "genes_detected": {names[0]: int((a > 0).any(axis=1).sum()), names[1]: int((b > 0).any(axis=1).sum())},
+        "genes_detected_by_both": int(((a > 0).any(axis=1) & (b > 0).any(axis=1)).sum()),
+        "total_ppm": {names[0]: round(float(a.to_numpy().sum()), 4), names[1]: round(float(b.to_numpy().sum()), 4)},
+        "pearson_gene_sample_ppm": round(pearson, 6) if pearson is not None else None,
+        "max_abs_delta": round(float(diff.abs().to_numpy().max()), 4) if diff.size else 0.0,
+    }
+    return table, summary
+
+
+def compare_hits(hits_a, hits_b, names):
+    """按查询序列比较两个后端的最佳比对目标。"""
+    both = hits_a.index.intersection(hits_b.index)
+    same = int((hits_a.loc[both] == hits_b.loc[both]).sum())
+    return {
+        "queries_hit": {names[0]: len(hits_a), names[1]: len(hits_b)},
+        "queries_hit_by_both": len(both),
+        "same_best_gene": same,
+        "best_gene_agreement": round(same / len(both), 6) if len(both) else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare gene abundances and hits of two aligner backends")
+    parser.add_argument("--names", nargs=2, required=True, help="Names of the two backends (A B)")
+    parser.add_argument("--ppm", nargs=2, required=True, help="OUT.<GeneType>.ppm.txt of A and B")
+    parser.add_argument("--m8", nargs=2, default=None, help="Merged m8 of A and B, to compare best hits per query")
+    parser.add_argument("--time", nargs=2, default=None, help="align.time files (start and end seconds) of A and B")
+    parser.add_argument("-o", "--output", required=True, help="Per-gene comparison table (TSV); summary in <output>.json")
+    args = parser.parse_args()
+
+    table, summary = compare_ppm(read_ppm(args.ppm[0]), read_ppm(args.ppm[1]), args.names)
+    summary = {"backends": args.names, **summary}
+    if args.m8:
+        summary.update(compare_hits(read_best_hits(args.m8[0]), read_best_hits(args.m8[1]), args.names))
+    if args.time:
+        seconds = [read_seconds(f) for f in args.time]
+        summary["align_seconds"] = dict(zip(args.names, seconds))
+        if all(seconds):
+            summary["speedup"] = round(seconds[0] / seconds[1], 3)
+
+    table.to_csv(args.output + ".tmp", sep="\t", float_format="%.6g")
+    os.replace(args.output + ".tmp", args.output)
+    with open(args.output + ".json", "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=1)
+    print(json.dumps(summary, indent=1))
+    print(f"Per-gene ppm deltas written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
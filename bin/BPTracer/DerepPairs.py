@@ -0,0 +1,134 @@
+"""
+双端读库去重（BP --derep）：R1、R2 序列完全相同的 read 对只保留第一对，
+标题行写为 ">name SZ:i:N"（N 为该序列对出现的次数，N = 1 时省略），写入新的读库：
+
+    python3 DerepPairs.py --sample A1 -1 A1_1.fa -2 A1_2.fa -o A1_1.derep.fa A1_2.derep.fa [--index]
+
+- 输入读库不被修改，重复运行（如 --resume 重跑 S01）得到相同的结果，不会对已去重的读库再次去重；
+- 两遍扫描：第一遍记录每个 read 对 (R1, R2) 序列的 64 位摘要，np.unique 求出每种摘要第一次出现的位置
+  与次数（每个 read 对约 40 字节，不按序列对建 dict），第二遍写出代表序列；
+- SZ:i:N 同时是 SAM 标签，minimap2 -y 会把它带入 SAM，Stream16S.py 据此加权；
+- 写出 <sample>.derep.sizes.tsv（N > 1 的 read 名称与 N），ProcessMeta.py 据此为 USCMG 比对加权；
+- ExtractHits.py 把 SZ:i:N 带入 extracted.fa，GeneAbundance.py 据此为 BLAST 比对加权；
+- 写出 <sample>.derep.json（去重前后的 read 对数）；--index 时为输出读库建立索引 <output>.idx。
+"""
+
+import os
+import json
+import hashlib
+import argparse
+import numpy as np
+
+from FastqToFasta import ReadIndex
+
+SIZE_TAG = b"SZ:i:"
+
+
+def read_pairs(fa1, fa2):
+    """按顺序读取两行 FASTA 的 read 对，返回 (标题1, 序列1, 标题2, 序列2)，均不含换行。"""
+    with open(fa1, "rb") as f1, open(fa2, "rb") as f2:
+        while True:
+            h1, s1 = f1.readline(), f1.readline()
+            h2, s2 = f2.readline(), f2.readline()
+            if not h1 or not h2:
+                if h1 or h2:
+                    raise RuntimeError(f"{fa1} and {fa2} hold different numbers of reads")
+                return
+            yield h1.rstrip(b"\n"), s1.rstrip(b"\n"), h2.rstrip(b"\n"), s2.rstrip(b"\n")
+
+
+def pair_key(s1, s2):
+    return hashlib.blake2b(s1 + b"\0" + s2, digest_size=8).digest()
+
+
+def read_name(header):
+    name = header[1:].split(None, 1)
+    return name[0] if name else b""
+
+
+def pair_sizes(fa1, fa2):
+    """
+    第一遍扫描：返回每个 read 对作为代表时的出现次数，非代表（重复出现）的 read 对为 0。
+
+    返回:
+    - np.ndarray: 与输入 read 对一一对应的 uint32 数组。
+    """
+    digests = bytearray()
+    for _, s1, _, s2 in read_pairs(fa1, fa2):
+        digests += pair_key(s1, s2)
+    keys = np.frombuffer(digests, dtype=np.uint64)
+    # return_index 为每种摘要第一次出现的位置
+    _, first, counts = np.unique(keys, return_index=True, return_counts=True)
+    sizes = np.zeros(keys.size, dtype=np.uint32)
+    sizes[first] = counts
+    return sizes
+
+
+def derep_pairs(sample, fa1, fa2, out_fa1, out_fa2, build_index=False):
+    """
+    参数:
+    - sample (str): 样品 ID。
+    - fa1, fa2 (str): 两端读库（两行 FASTA），不被修改。
+    - out_fa1, out_fa2 (str): 去重后的两端读库。
+    - build_index (bool): 是否为输出读库建立索引。
+
+    返回:
+    - dict: 去重统计。
+    """
+    if {os.path.abspath(out_fa1), os.path.abspath(out_fa2)} & {os.path.abspath(fa1), os.path.abspath(fa2)}:
+        raise ValueError("Output read stores must differ from the input read stores")
+    sizes_at = pair_sizes(fa1, fa2)
+    pairs_in = int(sizes_at.size)
+
+    outdir = os.path.dirname(os.path.abspath(out_fa1))
+    sizes_file = os.path.join(outdir, f"{sample}.derep.sizes.tsv")
+    indexes = [ReadIndex(fa + ".idx") if build_index else None for fa in (out_fa1, out_fa2)]
+    pairs_out = 0
+    with open(out_fa1 + ".tmp", "wb") as out1, open(out_fa2 + ".tmp", "wb") as out2, \
+            open(sizes_file + ".tmp", "wb") as sizes:
+        for i, (h1, s1, h2, s2) in enumerate(read_pairs(fa1, fa2)):
+            size = int(sizes_at[i])
+            if not size:
+                continue  # 已写出代表序列
+            pairs_out += 1
+            names = (read_name(h1), read_name(h2))
+            tag = b" " + SIZE_TAG + str(size).encode() if size > 1 else b""
+            for out, index, name, seq in zip((out1, out2), indexes, names, (s1, s2)):
+                fasta = [b">" + name + tag, seq]
+                out.write(b"\n".join(fasta) + b"\n")
+                if index is not None:
+                    index.update(fasta)
+            if size > 1:
+                for name in dict.fromkeys(names):
+                    sizes.write(name + b"\t" + str(size).encode() + b"\n")
+
+    os.replace(out_fa1 + ".tmp", out_fa1)
+    os.replace(out_fa2 + ".tmp", out_fa2)
+    os.replace(sizes_file + ".tmp", sizes_file)
+    for index in indexes:
+        if index is not None:
+            index.close()
+
+    summary = {
+        "sample": sample,
+        "pairs_in": pairs_in,
+        "pairs_out": pairs_out,
+        "duplicate_fraction": round(1 - pairs_out / pairs_in, 6) if pairs_in else 0.0,
+    }
+    with open(os.path.join(outdir, f"{sample}.derep.json"), "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=1)
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Collapse identical read pairs in the read store and record their multiplicity")
+    parser.add_argument("--sample", required=True, help="Sample ID")
+    parser.add_argument("-1", dest="fa1", required=True, help="R1 read store (two-line FASTA), left unchanged")
+    parser.add_argument("-2", dest="fa2", required=True, help="R2 read store (two-line FASTA), left unchanged")
+    parser.add_argument("-o", "--output", nargs=2, required=True, help="Deduplicated R1 and R2 read stores")
+    parser.add_argument("--index", action="store_true", help="Build the read offset index <output>.idx")
+    args = parser.parse_args()
+
+    summary = derep_pairs(args.sample, args.fa1, args.fa2, *args.output, build_index=args.index)
+    print(f"{args.sample}: {summary['pairs_in']} read pairs -> {summary['pairs_out']} unique "
+          f"({summary['duplicate_fraction']:.2%} duplicates)")
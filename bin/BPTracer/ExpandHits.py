@@ -0,0 +1,59 @@
+"""
+合并 BP2 各分块的 BLAST 结果，并把代表序列的比对展开到与其序列相同的全部序列
+（BP_BLAST_DEDUP：ExtractedFaFiles 跨样品去重后只比对代表序列）：
+
+    python3 ExpandHits.py --map Final.dedup.map -o Final.ARGs.blast.m8 temp.0.fa.m8 temp.1.fa.m8 ...
+
+dedup.map 每行为 "代表 ID<TAB>ID1,ID2,..."，同一代表可出现在多行（BP2 每条重复序列写一行）；代表序列的每一行比对原样写出，随后为每个相同序列
+写出一行只替换查询 ID 的比对，结果与逐条比对全部序列相同（仅行的顺序不同）。
+"""
+
+import os
+import argparse
+
+def load_dedup_map(map_file):
+    """读取 dedup.map，返回 代表 ID -> [其他 ID]。"""
+    duplicates = {}
+    with open(map_file, "rb") as f:
+        for line in f:
+            rep, _, ids = line.rstrip(b"\n").partition(b"\t")
+            if ids:
+                duplicates.setdefault(rep, []).extend(ids.split(b","))
+    return duplicates
+
+
+def expand_hits(m8_files, duplicates, output_file):
+    """
+    参数:
+    - m8_files (List[str]): 各分块的 BLAST 结果（outfmt 6）。
+    - duplicates (Dict[bytes, List[bytes]]): load_dedup_map 的结果。
+    - output_file (str): 合并后的结果。
+
+    返回:
+    - Tuple[int, int]: (读入的比对行数, 写出的比对行数)。
+    """
+    lines_in = lines_out = 0
+    with open(output_file + ".tmp", "wb") as out:
+        for m8_file in m8_files:
+            with open(m8_file, "rb") as f:
+                for line in f:
+                    lines_in += 1
+                    out.write(line)
+                    lines_out += 1
+                    query, sep, rest = line.partition(b"\t")
+                    for other in duplicates.get(query, ()):
+                        out.write(other + sep + rest)
+                        lines_out += 1
+    os.replace(output_file + ".tmp", output_file)
+    return lines_in, lines_out
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Concatenate BLAST chunk results and expand representative hits to identical sequences")
+    parser.add_argument("--map", required=True, help="dedup.map written by BP2 (representative<TAB>comma-separated IDs)")
+    parser.add_argument("-o", "--output", required=True, help="Merged BLAST result")
+    parser.add_argument("m8", nargs="+", help="BLAST results (outfmt 6) of the chunks")
+    args = parser.parse_args()
+
+    lines_in, lines_out = expand_hits(args.m8, load_dedup_map(args.map), args.output)
+    print(f"{lines_in} hits of representative sequences expanded to {lines_out} hits in {args.output}")
@@ -0,0 +1,247 @@
+"""
+按读库索引抽取比对上的 reads，替代 extract_usearch_reads.pl + MergeFastaRename.py：
+
+    python3 ExtractHits.py --sample A1 --reads A1_1.fa A1_2.fa --hits-dir 01.ARGs/A1 [04.VFs/A1 ...]
+
+- 每个 --hits-dir 中的 <sample>_1.us、<sample>_2.us 为两端的 diamond 结果（第一列为 read 名称）；
+- 读库索引 <read store>.idx 由 S01 的 FastqToFasta.py --index 生成，按名称键直接定位 read，
+  不再扫描整个读库；同一端的全部基因类型的 reads 汇总后按偏移顺序只读一遍；
+- 读库可以是普通 FASTA 或 BGZF（.fa.gz，按 .gzi 块索引定位）；缺少 .idx 时退回顺序扫描读库；
+- 每个目录写出 extracted.fa（read 重命名为 <sample>_<n>，R1 在前、R2 在后，各端按读库顺序，
+  与原流程的编号一致）以及 extracted.idmap（<sample>_<n>、端、原 read 名称）；
+- 去重后的读库（DerepPairs.py）中标题行的 SZ:i:N 原样写入 extracted.fa 的标题行；
+- --m8（BP --one-pass）时把两端的 diamond 结果中的 read 名称换成 <sample>_<n>，写出 extracted.m8，
+  BP2 直接以其计算丰度，不再重新 BLAST；不带 --m8 时删除目录中已有的 extracted.m8，
+  以免其中的编号与新的 extracted.fa 不一致。
+"""
+
+import os
+import zlib
+import gzip
+import struct
+import bisect
+import argparse
+import numpy as np
+
+INDEX_MAGIC = b"BPRIDX1\x00"
+SIZE_TAG = b"SZ:i:"
+
+
+def name_key(name):
+    """与 FastqToFasta.py 相同的 64 位名称键。"""
+    return zlib.crc32(name) << 32 | zlib.adler32(name)
+
+
+def load_index(path):
+    """读取 .idx，返回 (升序名称键, 对应偏移)。"""
+    with open(path, "rb") as f:
+        if f.read(len(INDEX_MAGIC)) != INDEX_MAGIC:
+            raise RuntimeError(f"Not a read index: {path}")
+        n = struct.unpack("<Q", f.read(8))[0]
+        keys = np.fromfile(f, dtype="<u8", count=n)
+        offsets = np.fromfile(f, dtype="<u8", count=n)
+    return keys, offsets
+
+
+class BgzfReader:
+    """按未压缩偏移随机读取 BGZF 文件（使用 bgzip 格式的 .gzi 块索引）。"""
+
+    def __init__(self, path):
+        self.handle = open(path, "rb")
+        self.blocks = [(0, 0)]  # (压缩偏移, 未压缩偏移)
+        with open(path + ".gzi", "rb") as f:
+            n = struct.unpack("<Q", f.read(8))[0]
+            for _ in range(n):
+                self.blocks.append(struct.unpack("<QQ", f.read(16)))
+        self.starts = [u for _, u in self.blocks]
+        self.block = -1
+        self.data = b""
+        self.pos = 0
+
+    def _load(self, block):
+        coffset = self.blocks[block][0]
+        self.handle.seek(coffset)
+        header = self.handle.read(18)
+        bsize = struct.unpack("<H", header[16:18])[0] + 1
+        self.data = zlib.decompress(self.handle.read(bsize - 18)[:-8], -15)
+        self.block = block
+
+    def seek(self, offset):
+        block = bisect.bisect_right(self.starts, offset) - 1
+        if block != self.block:
+            self._load(block)
+        self.pos = offset - self.starts[block]
+
+    def readline(self):
+        parts = []
+        while True:
+            end = self.data.find(b"\n", self.pos)
+            if end >= 0:
+                parts.append(self.data[self.pos:end + 1])
+                self.pos = end + 1
+                return b"".join(parts)
+            parts.append(self.data[self.pos:])
+            if self.block + 1 >= len(self.blocks):
+                self.pos = len(self.data)
+                return b"".join(parts)
+            self._load(self.block + 1)
+            self.pos = 0
+
+    def close(self):
+        self.handle.close()
+
+
+def size_attribute(header):
+    """取出标题行中的 SZ:i:N 属性（含前导空格），没有时返回空串。"""
+    for field in header.split()[1:]:
+        if field.startswith(SIZE_TAG):
+            return b" " + field
+    return b""
+
+
+def read_hit_names(us_file):
+    """读取 diamond 结果第一列的 read 名称（保持首次出现的顺序，去重）。"""
+    names = {}
+    with open(us_file, "rb") as f:
+        for line in f:
+            if line.strip():
+                names.setdefault(line.split(b"\t", 1)[0].split(None, 1)[0], None)
+    return list(names)
+
+
+def fetch_indexed(read_store, names):
+    """
+    按索引取出 reads。
+
+    返回:
+    - Dict[bytes, Tuple[int, bytes, bytes]]: read 名称 -> (偏移, 序列, SZ 属性)。
+    """
+    keys, offsets = load_index(read_store + ".idx")
+    wanted = np.array([name_key(name) for name in names], dtype=np.uint64)
+    lo = np.searchsorted(keys, wanted, side="left")
+    hi = np.searchsorted(keys, wanted, side="right")
+    # 名称键可能重复（不同名称的键冲突或读库中重名），逐个核对名称，同名时取读库中第一条
+    candidates = sorted(
+        (int(offset), name)
+        for name, a, b in zip(names, lo, hi)
+        for offset in offsets[a:b]
+    )
+    reader = BgzfReader(read_store) if read_store.endswith(".gz") else open(read_store, "rb")
+    records = {}
+    try:
+        for offset, name in candidates:
+            if name in records:
+                continue
+            reader.seek(offset)
+            header = reader.readline()
+            if header[1:].split(None, 1)[0] != name:
+                continue
+            records[name] = (offset, reader.readline().rstrip(b"\n"), size_attribute(header))
+    finally:
+        reader.close()
+    return records
+
+
+def fetch_scan(read_store, names):
+    """没有索引时顺序扫描读库（两行 FASTA），返回值与 fetch_indexed 相同（偏移为 read 序号）。"""
+    wanted = set(names)
+    records = {}
+    opener = gzip.open if read_store.endswith(".gz") else open
+    with opener(read_store, "rb") as f:
+        for i, header in enumerate(f):
+            seq = next(f, b"").rstrip(b"\n")
+            name = header[1:].split(None, 1)[0] if header[1:].strip() else b""
+            if name in wanted and name not in records:
+                records[name] = (i, seq, size_attribute(header))
+    return records
+
+
+def rename_hits(us_files, new_ids, output):
+    """
+    把各端 diamond 结果的第一列换成 extracted.fa 中的 ID，合并写出。
+
+    参数:
+    - us_files (List[str]): 各端的 diamond 结果。
+    - new_ids (List[Dict[bytes, bytes]]): 各端 read 名称 -> <sample>_<n>。
+    - output (str): 输出的 m8。
+    """
+    with open(output + ".tmp", "wb") as out:
+        for us_file, ids in zip(us_files, new_ids):
+            with open(us_file, "rb") as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    query, sep, rest = line.partition(b"\t")
+                    out.write(ids[query.split(None, 1)[0]] + sep + rest)
+    os.replace(output + ".tmp", output)
+
+
+def extract_hits(sample, read_stores, hits_dirs, write_m8=False):
+    """
+    参数:
+    - sample (str): 样品 ID。
+    - read_stores (List[str]): 各端的读库（R1、R2）。
+    - hits_dirs (List[str]): 各基因类型的样品目录。
+    - write_m8 (bool): 同时写出以新 ID 为查询的比对结果 extracted.m8。
+
+    返回:
+    - Dict[str, int]: 各目录抽取的 reads 数。
+    """
+    # 各目录、各端的比对 reads
+    hits = {
+        (hits_dir, mate): read_hit_names(os.path.join(hits_dir, f"{sample}_{mate}.us"))
+        for hits_dir in hits_dirs
+        for mate in range(1, len(read_stores) + 1)
+    }
+
+    # 每一端：全部目录的 reads 汇总后只读一遍读库
+    records = {}
+    for mate, read_store in enumerate(read_stores, start=1):
+        names = list(dict.fromkeys(name for hits_dir in hits_dirs for name in hits[hits_dir, mate]))
+        if os.path.exists(read_store + ".idx"):
+            records[mate] = fetch_indexed(read_store, names)
+        else:
+            records[mate] = fetch_scan(read_store, names)
+        missing = [name for name in names if name not in records[mate]]
+        if missing:
+            raise RuntimeError(f"{len(missing)} hit reads not found in {read_store}, e.g. {missing[0].decode()}")
+
+    counts = {}
+    for hits_dir in hits_dirs:
+        count = 0
+        new_ids = [{} for _ in read_stores]
+        with open(os.path.join(hits_dir, "extracted.fa.tmp"), "wb") as fa, \
+                open(os.path.join(hits_dir, "extracted.idmap.tmp"), "wb") as idmap:
+            for mate in range(1, len(read_stores) + 1):
+                for name in sorted(hits[hits_dir, mate], key=lambda n: records[mate][n][0]):
+                    count += 1
+                    new_id = f"{sample}_{count}".encode()
+                    new_ids[mate - 1][name] = new_id
+                    _, seq, size = records[mate][name]
+                    fa.write(b">" + new_id + size + b"\n" + seq + b"\n")
+                    idmap.write(new_id + b"\t" + str(mate).encode() + b"\t" + name + b"\n")
+        for output in ("extracted.fa", "extracted.idmap"):
+            os.replace(os.path.join(hits_dir, output + ".tmp"), os.path.join(hits_dir, output))
+        if write_m8:
+            us_files = [os.path.join(hits_dir, f"{sample}_{mate}.us") for mate in range(1, len(read_stores) + 1)]
+            rename_hits(us_files, new_ids, os.path.join(hits_dir, "extracted.m8"))
+        elif os.path.exists(os.path.join(hits_dir, "extracted.m8")):
+            # 以前 --one-pass 运行留下的比对，其 <sample>_<n> 与本次的 extracted.fa 不对应
+            os.remove(os.path.join(hits_dir, "extracted.m8"))
+        counts[hits_dir] = count
+    return counts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Extract reads with gene hits from the indexed read store")
+    parser.add_argument("--sample", required=True, help="Sample ID, also the prefix of the renamed reads")
+    parser.add_argument("--reads", nargs="+", required=True, help="Read store of each mate (.fa or BGZF .fa.gz)")
+    parser.add_argument("--hits-dir", nargs="+", required=True,
+                        help="Gene-type sample folders holding <sample>_1.us / <sample>_2.us")
+    parser.add_argument("--m8", action="store_true",
+                        help="Also write extracted.m8: the diamond hits with reads renamed as in extracted.fa")
+    args = parser.parse_args()
+
+    counts = extract_hits(args.sample, args.reads, args.hits_dir, write_m8=args.m8)
+    for hits_dir, count in counts.items():
+        print(f"{hits_dir}: {count} reads extracted")
@@ -0,0 +1,523 @@
+"""
+FASTQ(.gz) 转 FASTA，替代 Fq2fa.pl（gunzip -dc | 单线程 Perl 逐行处理）：
+
+    python3 FastqToFasta.py [-t 8] A1_1.fq.gz A1_1.fa [A1_2.fq.gz A1_2.fa ...]
+    python3 FastqToFasta.py -t 8 A1_1.fq.gz A1_1.fa.gz,A1_1.map.fifo A1_2.fq.gz A1_2.fa.gz,A1_2.map.fifo
+    python3 FastqToFasta.py -t 8 --stats A1.readstat.json --sample A1 A1_1.fq.gz A1_1.fa A1_2.fq.gz A1_2.fa
+
+- 多个 输入/输出 对（如 R1 与 R2）在不同进程中同时转换，线程数在各文件间平均分配；
+- BGZF 文件（bgzip 压缩）按块并行解压，zlib 解压时释放 GIL，可用满多个线程；
+- 普通 gzip 无法并行解压，优先通过 pigz -dc 流水线读取（读、解压、校验分线程），
+  没有 pigz 时使用 Python gzip；未压缩的 FASTQ 直接读取；
+- 每次处理 CHUNK_SIZE 字节的完整 reads，批量写出；
+- 一个输入可对应多个以逗号分隔的输出，解压一次同时写入所有输出，
+  输出可以是命名管道（FIFO），供 minimap2、diamond 等直接读取而不落盘；
+- 输出文件名以 .gz 结尾时写出 BGZF 压缩的 FASTA（多线程按块压缩，gzip 工具可直接读取），
+  并写出块索引 <output>.gzi（与 bgzip -i 格式相同），便于后续按块并行或随机读取。
+
+输出与 Fq2fa.pl 逐字节一致：每条 read 的标题行 "@" 换为 ">"，保留序列行，丢弃 "+" 与质量行。
+
+指定 --stats 时在同一次解压中统计 reads 数、碱基数、含 N 的 reads 数与长度分布，
+并检查 R1/R2 的 reads 数与 read 名称顺序是否一致，写入样品的统计文件（JSON）：
+
+    {"sample": "A1", "reads": 2n, "bases": ..., "reads_with_N": ..., "read_pairs": n,
+     "pairs_consistent": true, "length_hist": {"150": 2n}, "files": [每个输入文件的同样统计]}
+
+ProcessMeta.py 与 Tax S00（ReadStat.py）直接读取该文件，不再重新扫描 reads。
+
+指定 --index 时为每个输入的第一个非管道输出写出读库索引 <output>.idx，记录每条 read 的
+名称键与标题行在（未压缩）FASTA 中的偏移，S02 的 ExtractHits.py 据此直接定位比对上的 reads：
+
+    INDEX_MAGIC | n (uint64) | 名称键 uint64[n]（升序） | 偏移 uint64[n]
+
+指定 --subsample 时只保留一部分 read 对（快速概览 / 稀释）：参数小于 1 为保留比例，
+不小于 1 为目标 read 对数（先数一遍输入的行数换算为比例）。是否保留由 read 名称
+（去掉 /1、/2 后缀）的哈希决定，与顺序、线程数无关，R1、R2 在不同进程中选中相同的 read 对，
+同一输入重复运行结果相同。--stats 仍统计全部 reads，另记录 subsampled_reads 与实际保留比例
+subsample_fraction，ProcessMeta.py 据此把 16S 与细胞数外推到整个文库。
+"""
+
+import os
+import sys
+import gzip
+import json
+import stat
+import zlib
+import hashlib
+import shutil
+import struct
+import argparse
+import subprocess
+from array import array
+from itertools import accumulate
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+CHUNK_SIZE = 8 * 1024 ** 2
+WRITE_BUFFER = 16 * 1024 ** 2
+# BGZF 每批并行解压的块数（每块解压后不超过 64 KB）
+BGZF_BATCH = 128
+GZIP_MAGIC = b"\x1f\x8b"
+# 每个 BGZF 块的未压缩数据量（与 bgzip 相同，保证压缩后不超过 64 KB）
+BGZF_BLOCK_SIZE = 65280
+BGZF_EOF = bytes.fromhex("1f8b08040000000000ff0600424302001b0003000000000000000000")
+INDEX_MAGIC = b"BPRIDX1\x00"
+# 抽样哈希的取值范围（blake2b 4 字节摘要）
+SUBSAMPLE_SPACE = 2 ** 32
+
+
+def is_bgzf(path):
+    """判断文件是否为 BGZF：gzip 头带 FEXTRA 且第一个子字段为 'BC'。"""
+    with open(path, "rb") as f:
+        header = f.read(16)
+    return (
+        len(header) == 16 and header[:2] == GZIP_MAGIC and header[3] & 4
+        and header[12:14] == b"BC"
+    )
+
+
+def _inflate_blocks(blocks):
+    return b"".join(zlib.decompress(block, -15) for block in blocks)
+
+
+def read_bgzf(path, threads):
+    """按块并行解压 BGZF 文件，按原顺序逐批产出解压后的数据。"""
+    def batches():
+        with open(path, "rb") as f:
+            batch = []
+            while True:
+                header = f.read(18)
+                if len(header) < 18:
+                    break
+                # 固定头 12 字节 + XLEN；BC 子字段给出 BSIZE（块总长 - 1）
+                xlen = struct.unpack("<H", header[10:12])[0]
+                bsize = struct.unpack("<H", header[16:18])[0]
+                rest = f.read(bsize + 1 - 18)
+                # 去掉额外子字段、CRC32 与 ISIZE，只保留 deflate 数据
+                batch.append(rest[xlen - 6:-8])
+                if len(batch) == BGZF_BATCH:
+                    yield batch
+                    batch = []
+            if batch:
+                yield batch
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        pending = []
+        for batch in batches():
+            pending.append(pool.submit(_inflate_blocks, batch))
+            if len(pending) > threads * 2:
+                yield pending.pop(0).result()
+        for future in pending:
+            yield future.result()
+
+
+def read_stream(stream):
+    while True:
+        chunk = stream.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        yield chunk
+
+
+def read_chunks(path, threads):
+    """返回 FASTQ 解压后数据块的迭代器，按 BGZF > pigz > gzip > 未压缩 选择读取方式。"""
+    with open(path, "rb") as f:
+        compressed = f.read(2) == GZIP_MAGIC
+    if not compressed:
+        with open(path, "rb") as f:
+            yield from read_stream(f)
+    elif is_bgzf(path) and threads > 1:
+        yield from read_bgzf(path, threads)
+    elif shutil.which("pigz"):
+        process = subprocess.Popen(["pigz", "-dc", "-p", str(threads), path], stdout=subprocess.PIPE)
+        yield from read_stream(process.stdout)
+        if process.wait() != 0:
+            raise RuntimeError(f"pigz failed to decompress {path}")
+    else:
+        with gzip.open(path, "rb") as f:
+            yield from read_stream(f)
+
+
+class ReadStats:
+    """在转换过程中累计单个 FASTQ 文件的统计量。"""
+
+    def __init__(self):
+        self.reads = 0
+        self.subsampled = None
+        self.bases = 0
+        self.reads_with_n = 0
+        self.lengths = Counter()
+        # read 名称（去掉 /1、/2 后缀）按顺序的摘要，用于检查 R1/R2 是否一一对应
+        self.names = hashlib.md5()
+
+    def update(self, lines):
+        """累计一批 FASTQ 行（4 行一条 read，最后一条可以不完整）。"""
+        headers = lines[0::4]
+        seqs = lines[1::4]
+        lengths = list(map(len, seqs))
+        self.reads += len(headers)
+        self.bases += sum(lengths)
+        self.reads_with_n += sum(b"N" in seq for seq in seqs)
+        self.lengths.update(lengths)
+        names = [h.split(None, 1)[0] if h else h for h in headers]
+        names = [name[:-2] if name[-2:] in (b"/1", b"/2") else name for name in names]
+        self.names.update(b"\n".join(names) + b"\n" if names else b"")
+
+    def as_dict(self):
+        stats = {
+            "reads": self.reads,
+            "bases": self.bases,
+            "reads_with_N": self.reads_with_n,
+            "length_hist": {str(length): count for length, count in sorted(self.lengths.items())},
+            "names_md5": self.names.hexdigest(),
+        }
+        if self.subsampled is not None:
+            stats["subsampled_reads"] = self.subsampled
+        return stats
+
+
+def merge_stats(sample, files):
+    """
+    合并同一样品各输入文件的统计。
+
+    参数:
+    - sample (str): 样品 ID。
+    - files (List[dict]): 每个输入文件的统计（ReadStats.as_dict() 加 input 字段）。
+
+    返回:
+    - dict: 样品统计；恰好两个输入时检查双端一致性，否则 read_pairs 与 pairs_consistent 为 None。
+    """
+    lengths = Counter()
+    for file_stats in files:
+        lengths.update({int(k): v for k, v in file_stats["length_hist"].items()})
+    paired = len(files) == 2
+    consistent = paired and files[0]["reads"] == files[1]["reads"] and files[0]["names_md5"] == files[1]["names_md5"]
+    sample_stats = {
+        "sample": sample,
+        "reads": sum(f["reads"] for f in files),
+        "bases": sum(f["bases"] for f in files),
+        "reads_with_N": sum(f["reads_with_N"] for f in files),
+        "read_pairs": files[0]["reads"] if consistent else None,
+        "pairs_consistent": consistent if paired else None,
+        "length_hist": {str(length): count for length, count in sorted(lengths.items())},
+    }
+    if all("subsampled_reads" in f for f in files):
+        kept = sum(f["subsampled_reads"] for f in files)
+        sample_stats["subsampled_reads"] = kept
+        sample_stats["subsample_fraction"] = kept / sample_stats["reads"] if sample_stats["reads"] else 1.0
+    sample_stats["files"] = files
+    return sample_stats
+
+
+def fasta_lines(lines):
+    """把完整的 FASTQ 行（4 行一条 read）转换为 FASTA 的 标题/序列 行列表。"""
+    headers = [b">" + h[1:] if h[:1] == b"@" else h for h in lines[0::4]]
+    seqs = lines[1::4]
+    out = [None] * (len(headers) + len(seqs))
+    out[0::2] = headers
+    out[1:2 * len(seqs):2] = seqs
+    return out
+
+
+def subsample_threshold(subsample, input_file, threads=1):
+    """
+    把 --subsample 换算为哈希阈值。
+
+    参数:
+    - subsample (float): 小于 1 为保留比例，不小于 1 为目标 reads 数（每个输入文件）。
+    - input_file (str): 输入 FASTQ，按目标 reads 数抽样时先数一遍行数。
+
+    返回:
+    - int: 名称哈希小于该值的 read 被保留；None 表示保留全部 reads。
+    """
+    if subsample is None:
+        return None
+    if subsample < 1:
+        fraction = subsample
+    else:
+        lines = sum(chunk.count(b"\n") for chunk in read_chunks(input_file, threads))
+        fraction = subsample / (lines // 4) if lines >= 4 else 1.0
+    if fraction >= 1:
+        return None
+    return int(fraction * SUBSAMPLE_SPACE)
+
+
+def subsample_lines(lines, threshold):
+    """按 read 名称（去掉 /1、/2 后缀）的哈希抽取 FASTQ 行（4 行一条 read，最后一条可以不完整）。"""
+    kept = []
+    for i in range(0, len(lines), 4):
+        name = lines[i][1:].split(None, 1)
+        name = name[0] if name else b""
+        if name[-2:] in (b"/1", b"/2"):
+            name = name[:-2]
+        if int.from_bytes(hashlib.blake2b(name, digest_size=4).digest(), "big") < threshold:
+            kept.extend(lines[i:i + 4])
+    return kept
+
+
+def name_key(name):
+    """read 名称（第一个空白之前的部分）的 64 位键：crc32 与 adler32 拼接。"""
+    return zlib.crc32(name) << 32 | zlib.adler32(name)
+
+
+class ReadIndex:
+    """记录每条 read 标题行在 FASTA 中的偏移，关闭时按名称键排序写出 .idx。"""
+
+    def __init__(self, path):
+        self.path = path
+        self.keys = array("Q")
+        self.offsets = array("Q")
+        self.offset = 0
+
+    def update(self, fasta):
+        """累计一批 FASTA 行（标题/序列 交替，与写出的内容一致）。"""
+        starts = list(accumulate((len(line) + 1 for line in fasta), initial=self.offset))
+        self.offsets.extend(starts[0:len(fasta):2])
+        names = [header[1:].split(None, 1) for header in fasta[0::2]]
+        self.keys.extend(name_key(name[0] if name else b"") for name in names)
+        self.offset = starts[-1]
+
+    def close(self):
+        import numpy as np
+
+        keys = np.frombuffer(self.keys, dtype=np.uint64)
+        order = np.argsort(keys, kind="stable")
+        tmp_file = self.path + ".tmp"
+        with open(tmp_file, "wb") as f:
+            f.write(INDEX_MAGIC + struct.pack("<Q", len(keys)))
+            f.write(keys[order].astype("<u8").tobytes())
+            f.write(np.frombuffer(self.offsets, dtype=np.uint64)[order].astype("<u8").tobytes())
+        os.replace(tmp_file, self.path)
+
+
+def bgzf_blocks(data, level=6):
+    """把数据压缩为 BGZF 块，返回 [(未压缩长度, 块字节)]。"""
+    blocks = []
+    for start in range(0, len(data), BGZF_BLOCK_SIZE):
+        raw = data[start:start + BGZF_BLOCK_SIZE]
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+        deflated = compressor.compress(raw) + compressor.flush()
+        header = struct.pack("<BBBBIBBHBBHH", 31, 139, 8, 4, 0, 0, 255, 6, 66, 67, 2, len(deflated) + 25)
+        blocks.append((len(raw), header + deflated + struct.pack("<II", zlib.crc32(raw), len(raw))))
+    return blocks
+
+
+class BgzfWriter:
+    """多线程 BGZF 压缩写出，关闭时写入 EOF 块与 .gzi 块索引。"""
+
+    def __init__(self, path, threads, index_path=None):
+        self.handle = open(path, "wb")
+        self.threads = threads
+        self.pool = ThreadPoolExecutor(max_workers=threads)
+        self.pending = deque()
+        self.buffer = bytearray()
+        self.index_path = index_path
+        self.index = []  # 除第一个块外，每个块的 (压缩偏移, 未压缩偏移)
+        self.compressed_offset = 0
+        self.uncompressed_offset = 0
+
+    def write(self, data):
+        self.buffer += data
+        if len(self.buffer) >= CHUNK_SIZE:
+            self._submit()
+
+    def _submit(self):
+        data, self.buffer = bytes(self.buffer), bytearray()
+        self.pending.append(self.pool.submit(bgzf_blocks, data))
+        while len(self.pending) > self.threads * 2:
+            self._drain()
+
+    def _drain(self):
+        for raw_length, block in self.pending.popleft().result():
+            if self.compressed_offset:
+                self.index.append((self.compressed_offset, self.uncompressed_offset))
+            self.handle.write(block)
+            self.compressed_offset += len(block)
+            self.uncompressed_offset += raw_length
+
+    def close(self):
+        if self.buffer:
+            self._submit()
+        while self.pending:
+            self._drain()
+        self.pool.shutdown()
+        self.handle.write(BGZF_EOF)
+        self.handle.close()
+        if self.index_path:
+            with open(self.index_path, "wb") as f:
+                f.write(struct.pack("<Q", len(self.index)))
+                for offsets in self.index:
+                    f.write(struct.pack("<QQ", *offsets))
+
+
+class FastaOutput:
+    """
+    一个 FASTA 输出：普通文件与 BGZF 文件先写入 .tmp 再改名；命名管道直接写入。
+    """
+
+    def __init__(self, path, threads):
+        self.path = path
+        self.is_fifo = os.path.exists(path) and stat.S_ISFIFO(os.stat(path).st_mode)
+        self.target = path if self.is_fifo else path + ".tmp"
+        if path.endswith(".gz") and not self.is_fifo:
+            self.stream = BgzfWriter(self.target, threads, index_path=path + ".gzi")
+        else:
+            self.stream = open(self.target, "wb", buffering=WRITE_BUFFER)
+
+    def write(self, data):
+        self.stream.write(data)
+
+    def close(self, success=True):
+        self.stream.close()
+        if not self.is_fifo:
+            if success:
+                os.replace(self.target, self.path)
+            else:
+                os.remove(self.target)
+
+
+class FastaWriter:
+    """把同一份 FASTA 缓冲写出到一个或多个输出。"""
+
+    def __init__(self, paths, threads):
+        self.outputs = [FastaOutput(path, threads) for path in paths]
+
+    def write(self, lines, newline=True):
+        if lines:
+            data = b"\n".join(lines) + (b"\n" if newline else b"")
+            for output in self.outputs:
+                output.write(data)
+
+    def close(self, success=True):
+        for output in self.outputs:
+            output.close(success)
+
+
+def convert(input_file, output_files, threads=1, stats=None, index_path=None, subsample=None):
+    """
+    把一个 FASTQ(.gz) 转换为 FASTA。
+
+    参数:
+    - input_file (str): FASTQ 或 FASTQ.gz（gzip / BGZF）。
+    - output_files (List[str]): FASTA 输出，以 .gz 结尾时 BGZF 压缩，可以是命名管道。
+    - threads (int): 解压与压缩可用的线程数。
+    - stats (ReadStats): 不为 None 时同时累计统计量。
+    - index_path (str): 不为 None 时写出读库索引。
+    - subsample (float): 不为 None 时按 read 名称的哈希抽样，见 subsample_threshold。
+
+    返回:
+    - int: 写出的 reads 数。
+    """
+    threshold = subsample_threshold(subsample, input_file, threads)
+    if stats is not None and subsample is not None:
+        stats.subsampled = 0
+    writer = FastaWriter(output_files, threads)
+    index = ReadIndex(index_path) if index_path else None
+    reads = 0
+    rest = b""
+    success = False
+    try:
+        for chunk in read_chunks(input_file, threads):
+            lines = (rest + chunk).split(b"\n")
+            # 最后一个元素是不完整的行（数据恰好以换行结尾时为空串）
+            complete = (len(lines) - 1) // 4 * 4
+            kept = lines[:complete] if threshold is None else subsample_lines(lines[:complete], threshold)
+            fasta = fasta_lines(kept)
+            writer.write(fasta)
+            if index is not None:
+                index.update(fasta)
+            if stats is not None:
+                stats.update(lines[:complete])
+            reads += len(kept) // 4
+            rest = b"\n".join(lines[complete:])
+        # 文件末尾没有换行或最后一条 read 不完整时，与 Fq2fa.pl 一样输出已读到的标题与序列
+        lines = rest.split(b"\n")
+        newline = lines[-1] == b""
+        if newline:
+            lines.pop()
+        if lines:
+            kept = lines if threshold is None else subsample_lines(lines, threshold)
+            if kept:
+                fasta = fasta_lines(kept)
+                writer.write(fasta, newline=newline or len(kept) % 4 not in (1, 2))
+                if index is not None:
+                    index.update(fasta)
+            if stats is not None:
+                stats.update(lines)
+            reads += (len(kept) + 3) // 4
+        success = True
+    finally:
+        writer.close(success)
+    if index is not None:
+        index.close()
+    if stats is not None and subsample is not None:
+        stats.subsampled = reads
+    return reads
+
+
+def index_target(output_files):
+    """读库索引对应的输出：第一个不是命名管道的输出。"""
+    for path in output_files:
+        if not (os.path.exists(path) and stat.S_ISFIFO(os.stat(path).st_mode)):
+            return path
+    return None
+
+
+def _convert_pair(pair):
+    input_file, output_files, threads, collect, build_index, subsample = pair
+    stats = ReadStats() if collect else None
+    target = index_target(output_files) if build_index else None
+    reads = convert(input_file, output_files, threads, stats, index_path=target + ".idx" if target else None,
+                    subsample=subsample)
+    # 输出可以是 /dev/stdout（Kraken2 的进程替换），进度信息写到标准错误
+    print(f"{input_file} -> {', '.join(output_files)}: {reads} reads", file=sys.stderr)
+    return dict(input=input_file, **stats.as_dict()) if collect else None
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Convert FASTQ(.gz) files to FASTA; several input/output pairs are converted concurrently"
+    )
+    parser.add_argument("-t", "--threads", type=int, default=4,
+                        help="Total threads for decompression and compression (default: 4)")
+    parser.add_argument("--stats", default=None,
+                        help="Write read count, bases, N-containing reads, length histogram and pair consistency "
+                             "of the inputs to this JSON file")
+    parser.add_argument("--sample", default="", help="Sample ID recorded in --stats")
+    parser.add_argument("--index", action="store_true",
+                        help="Write a read offset index <output>.idx next to the first non-FIFO output of each input")
+    parser.add_argument("--subsample", type=float, default=None,
+                        help="Keep a deterministic, name-hashed subset of reads: a fraction (<1) or a target "
+                             "number of reads per input (>=1); mates of a pair are kept together")
+    parser.add_argument("files", nargs="+", metavar="IN OUT",
+                        help="Pairs of input FASTQ(.gz) and output FASTA; OUT may list several comma-separated "
+                             "files or FIFOs (.gz for BGZF-compressed output)")
+    args = parser.parse_args()
+
+    if len(args.files) % 2:
+        parser.error("files must be given as pairs of input FASTQ and output FASTA")
+    pairs = list(zip(args.files[0::2], args.files[1::2]))
+    threads = max(1, args.threads // len(pairs))
+    collect = args.stats is not None
+    if args.subsample is not None and args.subsample <= 0:
+        parser.error("--subsample must be positive")
+    jobs = [(input_file, outputs.split(","), threads, collect, args.index, args.subsample)
+            for input_file, outputs in pairs]
+    if len(jobs) == 1:
+        files = [_convert_pair(jobs[0])]
+    else:
+        with ProcessPoolExecutor(max_workers=len(jobs)) as pool:
+            files = list(pool.map(_convert_pair, jobs))
+
+    if collect:
+        sample_stats = merge_stats(args.sample, files)
+        tmp_file = args.stats + ".tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump(sample_stats, f, indent=1)
+        os.replace(tmp_file, args.stats)
+        if sample_stats["pairs_consistent"] is False:
+            print(f"Warning: {args.sample or 'inputs'}: R1/R2 read counts or read names differ", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
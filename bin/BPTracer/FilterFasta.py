@@ -37,12 +37,12 @@ def filter_blast_m8(m8_file, output_m8, length_threshold, identity_threshold, ev
     filtered_genes = set(filtered_df["query"])
     return filtered_genes
 
-def filter_fasta_by_genes(fasta_file, output_fasta, filtered_genes):
+def filter_fasta_by_genes(fasta_files, output_fasta, filtered_genes):
     """
     根据筛选的基因 ID 过滤 fasta 文件。
 
     参数：
-    - fasta_file (str): 输入的 fasta 文件路径。
+    - fasta_files (List[str]): 输入的 fasta 文件路径（Final.extracted.list 中各样品的 extracted.fa，按顺序读取）。
     - output_fasta (str): 输出的过滤后的 fasta 文件路径。
     - filtered_genes (set): 通过筛选的基因 ID 集合。
     """
@@ -51,7 +51,8 @@ def filter_fasta_by_genes(fasta_file, output_fasta, filtered_genes):
     # 提前加载所有记录以减少磁盘访问
     with open(output_fasta, "w") as out_fasta:
         count = SeqIO.write(
-            (record for record in SeqIO.parse(fasta_file, "fasta") if record.id in filtered_genes),
+            (record for fasta_file in fasta_files for record in SeqIO.parse(fasta_file, "fasta")
+             if record.id in filtered_genes),
             out_fasta,
             "fasta"
         )
@@ -64,7 +65,7 @@ def main(m8_file, fasta_file, output_m8, output_fasta, length_threshold=25, iden
 
     参数：
     - m8_file (str): 输入的 m8 文件路径。
-    - fasta_file (str): 输入的 fasta 文件路径。
+    - fasta_file (str | List[str]): 输入的 fasta 文件路径，可以是多个文件。
     - output_m8 (str): 输出的过滤后的 m8 文件路径。
     - output_fasta (str): 输出的过滤后的 fasta 文件路径。
     - length_threshold (int): 最小比对长度，默认 25。
@@ -75,13 +76,14 @@ def main(m8_file, fasta_file, output_m8, output_fasta, length_threshold=25, iden
     filtered_genes = filter_blast_m8(m8_file, output_m8, length_threshold, identity_threshold, evalue_threshold)
 
     # 筛选 fasta 文件
-    filter_fasta_by_genes(fasta_file, output_fasta, filtered_genes)
+    fasta_files = [fasta_file] if isinstance(fasta_file, str) else fasta_file
+    filter_fasta_by_genes(fasta_files, output_fasta, filtered_genes)
 
 if __name__ == "__main__":
     import argparse
     parser = argparse.ArgumentParser(description="Filter m8 and fasta files based on specified criteria")
     parser.add_argument("-m8", required=True, help="Input BLAST6 m8 file")
-    parser.add_argument("-fa", required=True, help="Input fasta file")
+    parser.add_argument("-fa", nargs="+", required=True, help="Input fasta file(s)")
     parser.add_argument("-o_m8", required=True, help="Output filtered m8 file")
     parser.add_argument("-o_fa", required=True, help="Output filtered fasta file")
     parser.add_argument("-l", type=int, default=25, help="Minimum alignment length (default: 25)")
@@ -18,6 +18,8 @@ def parse_arguments():
     -e: E值阈值，默认为1e-7。
     -id: 最小序列相似度，默认为80。
     -o: 输出文件路径，默认为当前目录。
+    --samples: 样品列表文件（每行一个样品名），只输出其中的样品，用于 BP2 --append。
+    -fa: 比对所用的 extracted.fa，标题行带 SZ:i:N（BP --derep 去重）时比对按 N 加权。
     """
     parser = argparse.ArgumentParser(description="ARG Identification Pipeline - Stage 2")
     parser.add_argument("-i", required=True, help="Input BLAST6 result file")
@@ -29,6 +31,8 @@ def parse_arguments():
     parser.add_argument("-e", type=float, default=1e-7, help="E-value threshold (default: 1e-7)")
     parser.add_argument("-id", type=float, default=80, help="Minimum identity (default: 80)")
     parser.add_argument("-o", default="./", help="Output Path")
+    parser.add_argument("--samples", default=None, help="Only report samples listed in this file (one per line)")
+    parser.add_argument("-fa", nargs="+", default=None, help="Queried FASTA file(s); SZ:i:N header attributes weight each hit by N")
     return parser.parse_args()
 
 def process_metadata_bak(meta_file):
@@ -87,14 +91,15 @@ def process_metadata(meta_file):
         if missing_columns:
             raise ValueError(f"Missing required columns in metadata: {missing_columns}")
         
-        # 只保留需要的列
-        df = df[required_columns]
+        # 只保留需要的列；SubsampleFraction（BP --subsample）可选，旧的元数据没有该列时视为 1
+        fraction = df["SubsampleFraction"].fillna(1.0) if "SubsampleFraction" in df.columns else 1.0
+        df = df[required_columns].assign(fraction=fraction)
         
         # 重命名列以便于访问
         df.rename(columns={"#ofReads": "reads", "#of16Sreads": "16s", "CellNumber": "cell_number"}, inplace=True)
         
         # 将样本名称作为索引并提取所需数据
-        sample_info = df.set_index("Name")[["reads", "16s", "cell_number"]].to_dict(orient="index")
+        sample_info = df.set_index("Name")[["reads", "16s", "cell_number", "fraction"]].to_dict(orient="index")
     except Exception as e:
         raise RuntimeError(f"Error processing metadata file: {e}")
     
@@ -102,6 +107,23 @@ def process_metadata(meta_file):
 
 
 
+def restrict_samples(sample_info, samples_file):
+    """
+    只保留样品列表文件中的样品。
+    参数:
+    - sample_info (dict): process_metadata 返回的样本信息字典。
+    - samples_file (str): 样品列表文件，每行一个样品名称。
+    返回:
+    - sample_info (dict): 过滤后的样本信息字典，保持元数据中的顺序。
+    """
+    with open(samples_file, "r") as f:
+        samples = {line.strip() for line in f if line.strip()}
+    missing = samples - set(sample_info)
+    if missing:
+        print(f"Warning: Samples not found in metadata: {sorted(missing)}")
+    return {sample: info for sample, info in sample_info.items() if sample in samples}
+
+
 def parse_ardb_files(ardb_fasta, ardb_structure):
     """
     解析ARDB数据库中的基因序列和分类信息。
@@ -148,7 +170,27 @@ def parse_ardb_files(ardb_fasta, ardb_structure):
     return gene_lengths, gene_structure
 
 
-def parse_blast6(blast_file, gene_lengths, length_threshold, identity_threshold, evalue_threshold, folder):
+def parse_query_sizes(fasta_files):
+    """
+    读取 FASTA 标题行中的 SZ:i:N 属性（去重读库中该序列出现的次数）。
+    参数:
+    - fasta_files (List[str]): 各样品的 extracted.fa（BP2 中为 Final.extracted.list 所列文件）。
+    返回:
+    - query_sizes (dict): 序列 ID -> N，只包含带该属性的序列。
+    """
+    query_sizes = {}
+    for fasta_file in fasta_files:
+        with open(fasta_file, "r") as f:
+            for line in f:
+                if line.startswith(">") and "SZ:i:" in line:
+                    fields = line[1:].split()
+                    for field in fields[1:]:
+                        if field.startswith("SZ:i:"):
+                            query_sizes[fields[0]] = int(field[5:])
+    return query_sizes
+
+
+def parse_blast6(blast_file, gene_lengths, length_threshold, identity_threshold, evalue_threshold, folder, query_sizes=None):
     """
     解析BLAST6格式的输出文件并过滤结果。
     参数:
@@ -157,6 +199,7 @@ def parse_blast6(blast_file, gene_lengths, length_threshold, identity_threshold,
     - length_threshold (int): 最小比对长度。
     - identity_threshold (float): 最小比对相似度。
     - evalue_threshold (float): E值阈值。
+    - query_sizes (dict): 序列 ID -> 出现次数，比对比例与次数按其加权；None 表示均为 1。
     返回:
     - sample_hits_rate (DataFrame): 样本中基因的比对比例表。
     - sample_hits_count (DataFrame): 样本中基因的比对次数表。
@@ -186,6 +229,12 @@ def parse_blast6(blast_file, gene_lengths, length_threshold, identity_threshold,
             axis=1
         )
 
+        # 去重的序列代表 N 条 reads
+        filtered_df["size"] = 1
+        if query_sizes:
+            filtered_df["size"] = filtered_df["query"].map(query_sizes).fillna(1).astype(int)
+            filtered_df["ratio"] = filtered_df["ratio"] * filtered_df["size"]
+
         # 按样本和基因分组，累加比对比例
         ratio_grouped = filtered_df.groupby(["core_query", "gene"])["ratio"].sum().reset_index()
 
@@ -193,7 +242,7 @@ def parse_blast6(blast_file, gene_lengths, length_threshold, identity_threshold,
         sample_hits_rate = ratio_grouped.pivot_table(index="core_query", columns="gene", values="ratio", fill_value=0)
 
         # 按样本和基因分组，统计比对次数
-        count_grouped = filtered_df.groupby(["core_query", "gene"]).size().reset_index(name="count")
+        count_grouped = filtered_df.groupby(["core_query", "gene"])["size"].sum().reset_index(name="count")
 
         # 生成计数表
         sample_hits_count = count_grouped.pivot_table(index="core_query", columns="gene", values="count", fill_value=0)
@@ -248,14 +297,17 @@ def calculate_normalized_values(sample_hits_rate,sample_hits_count, sample_info,
         reads = sample_info[sample].get("reads", 0)
         sixteen_s = sample_info[sample].get("16s", 0)
         cell_number = sample_info[sample].get("cell_number", 0)
+        # 抽样运行的比对只覆盖 fraction 的 reads，按比例外推到整个文库（16S 数与细胞数已在 ProcessMeta 中外推）
+        fraction = sample_info[sample].get("fraction", 1.0)
 
-        if reads <= 0 or sixteen_s <= 0 or cell_number <= 0:
-            print(f"Invalid metadata for sample {sample}: reads={reads}, 16s={sixteen_s}, cell_number={cell_number}")
+        if reads <= 0 or sixteen_s <= 0 or cell_number <= 0 or not 0 < fraction <= 1:
+            print(f"Invalid metadata for sample {sample}: reads={reads}, 16s={sixteen_s}, cell_number={cell_number}, "
+                  f"fraction={fraction}")
             continue
 
         # 遍历每个基因
         for gene in sample_hits_rate.columns:
-            ratio_sum = sample_hits_rate.at[sample, gene]
+            ratio_sum = sample_hits_rate.at[sample, gene] / fraction
             # 16S 正规化
             results["16s"][sample][gene] = ratio_sum / sixteen_s
 
@@ -264,7 +316,7 @@ def calculate_normalized_values(sample_hits_rate,sample_hits_count, sample_info,
         
         # 遍历每个基因        
         for gene in sample_hits_rate.columns:
-            count = sample_hits_count.at[sample, gene]
+            count = sample_hits_count.at[sample, gene] / fraction
             # PPM 正规化
             results["ppm"][sample][gene] = (count * 1e6) / reads
         
@@ -318,8 +370,11 @@ def write_results(output_prefix, results, sample_info, gene_structure, folder):
 def main():
     args = parse_arguments()
     sample_info = process_metadata(args.m)
+    if args.samples:
+        sample_info = restrict_samples(sample_info, args.samples)
     gene_lengths, gene_structure = parse_ardb_files(args.db, args.s)
-    sample_hits_rate, sample_hits_count = parse_blast6(args.i, gene_lengths, args.l, args.id, args.e, args.o)
+    query_sizes = parse_query_sizes(args.fa) if args.fa else None
+    sample_hits_rate, sample_hits_count = parse_blast6(args.i, gene_lengths, args.l, args.id, args.e, args.o, query_sizes)
     results = calculate_normalized_values(sample_hits_rate,sample_hits_count, sample_info, gene_structure, gene_lengths)  # 修复参数
     write_results(args.p, results, sample_info, gene_structure, args.o)
 
@@ -0,0 +1,52 @@
+import argparse
+import os
+import pandas as pd
+
+
+def merge_abundance(input_file, append_file, key_columns, output_file):
+    """
+    把新增样品的丰度列并入已有丰度表。
+
+    参数:
+    - input_file (str): 已有丰度表（如 OUT.ARGs.ppm.txt），不存在时直接使用新增表。
+    - append_file (str): 新增样品的丰度表，行键列与已有表相同。
+    - key_columns (int): 行键列数，其余列为样品列。
+    - output_file (str): 输出文件路径，可与 input_file 相同。
+
+    说明:
+    - 已有表中与新增表同名的样品列会被替换，重复追加同一批样品不会产生重复列。
+    - 按行键外连接，任一表中缺失的行以 0 填充。
+    """
+    new_df = pd.read_csv(append_file, sep="\t")
+    keys = new_df.columns[:key_columns].tolist()
+    if not os.path.exists(input_file):
+        merged_df = new_df
+    else:
+        old_df = pd.read_csv(input_file, sep="\t")
+        if old_df.columns[:key_columns].tolist() != keys:
+            raise ValueError(f"Key columns differ between {input_file} and {append_file}")
+        new_samples = new_df.columns[key_columns:].tolist()
+        old_df = old_df.drop(columns=[col for col in new_samples if col in old_df.columns])
+        merged_df = old_df.merge(new_df, on=keys, how="outer", sort=False)
+        sample_cols = merged_df.columns[key_columns:]
+        merged_df[sample_cols] = merged_df[sample_cols].fillna(0)
+
+    tmp_file = output_file + ".tmp"
+    merged_df.to_csv(tmp_file, sep="\t", index=False)
+    os.replace(tmp_file, output_file)
+    print(f"Merged {len(new_df.columns) - key_columns} samples into {output_file}")
+
+
+if __name__ == "__main__":
+    # -i 已有丰度表
+    # -a 新增样品的丰度表
+    # -k 行键列数（OUT.* 为 3，Tax.* 为 7）
+    # -o 输出文件，默认覆盖 -i
+    parser = argparse.ArgumentParser(description="Merge abundance columns of newly added samples into an existing table")
+    parser.add_argument("-i", "--input", required=True, help="Existing abundance table")
+    parser.add_argument("-a", "--append", required=True, help="Abundance table of newly added samples")
+    parser.add_argument("-k", "--keys", type=int, default=3, help="Number of leading key columns (default: 3)")
+    parser.add_argument("-o", "--output", default=None, help="Output file (default: overwrite --input)")
+    args = parser.parse_args()
+
+    merge_abundance(args.input, args.append, args.keys, args.output or args.input)
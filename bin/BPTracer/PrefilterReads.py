@@ -0,0 +1,266 @@
+"""
+翻译 k-mer 预过滤（BP --prefilter）：diamond 之前先去掉不可能比对上功能基因库的 reads。
+
+    python3 PrefilterReads.py --index Gene-ARG.seeds.npz --reads A1_1.fa A1_2.fa \
+        --out A1_1.cand.fa A1_2.cand.fa -p 8 --stats A1.prefilter.json
+
+- 索引由 BuildSeedIndex.py 从 Gene-*.faa 构建一次：约简字母表（11 个字母，与 diamond 相同的
+  Murphy 分组）上的间隔种子（默认 111101110111，与 diamond 的种子形状同类），哈希后写入位图；
+- 每条 read 做 6 框翻译，用 NumPy 对一批 reads 整体计算全部位置的种子并查位图，
+  命中的种子数不少于 --min-hits 的 read 为候选，原样写出（标题行中的 SZ:i:N 等保留）；
+- 批次在进程池中并行扫描，写出顺序与读库相同；
+- --truth 给出同一样品未过滤时的 diamond 结果（每端一个 .us），统计候选 reads 对真实比对
+  reads 的灵敏度，用于在基准样品上选择索引参数：
+
+    python3 PrefilterReads.py --index Gene-ARG.seeds.npz --reads A1_1.fa A1_2.fa \
+        --truth 01.ARGs/A1/A1_1.us 01.ARGs/A1/A1_2.us --stats A1.prefilter.json
+"""
+
+import os
+import sys
+import gzip
+import json
+import argparse
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+# 每批扫描的 reads 数
+BATCH_READS = 20000
+# 约简氨基酸字母表（diamond 默认的 Murphy 11 分组），每组一个编码
+REDUCED_ALPHABET = ["KREDQN", "C", "G", "H", "ILV", "M", "F", "Y", "W", "P", "STA"]
+ALPHABET_SIZE = len(REDUCED_ALPHABET)
+INVALID = 255
+# 标准遗传密码，密码子按 TCAG 顺序
+GENETIC_CODE = "FFLLSSSSYY**CC*WLLLLPPPPHHQQRRRRIIIMTTTTNNKKSSRRVVVVAAAADDEEGGGG"
+HASH_MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+
+
+def _aa_table():
+    """氨基酸字母 -> 约简编码（其他字符为 INVALID）。"""
+    table = np.full(256, INVALID, dtype=np.uint8)
+    for code, group in enumerate(REDUCED_ALPHABET):
+        for aa in group:
+            table[ord(aa)] = table[ord(aa.lower())] = code
+    return table
+
+
+AA_CODE = _aa_table()
+
+# 碱基 -> 0..3（ACGT），其他为 4
+BASE_CODE = np.full(256, 4, dtype=np.uint8)
+for _i, _base in enumerate("ACGT"):
+    BASE_CODE[ord(_base)] = BASE_CODE[ord(_base.lower())] = _i
+COMPLEMENT = np.array([3, 2, 1, 0, 4], dtype=np.uint8)
+
+# 以 5 进制编码的密码子（含 N 的密码子与终止密码子为 INVALID）-> 约简编码
+CODON_CODE = np.full(125, INVALID, dtype=np.uint8)
+for _a in range(4):
+    for _b in range(4):
+        for _c in range(4):
+            _aa = GENETIC_CODE["TCAG".index("ACGT"[_a]) * 16 + "TCAG".index("ACGT"[_b]) * 4 + "TCAG".index("ACGT"[_c])]
+            CODON_CODE[_a * 25 + _b * 5 + _c] = AA_CODE[ord(_aa)]
+
+
+def seed_offsets(shape):
+    """种子形状（如 111101110111）中参与编码的位置。"""
+    offsets = [i for i, c in enumerate(shape) if c == "1"]
+    if not offsets or set(shape) - {"0", "1"} or shape[0] != "1" or shape[-1] != "1":
+        raise ValueError(f"Invalid seed shape: {shape}")
+    return offsets
+
+
+def seed_hashes(residues, offsets, step, hash_bits):
+    """
+    计算残基序列上每个位置的种子哈希。
+
+    参数:
+    - residues (np.ndarray): 约简编码的残基（uint8，INVALID 为分隔或不可用）。
+    - offsets (List[int]): 种子位置。
+    - step (int): 相邻残基在数组中的间隔（蛋白为 1，核酸逐位置翻译时为 3）。
+    - hash_bits (int): 哈希位数。
+
+    返回:
+    - Tuple[np.ndarray, np.ndarray]: (有效种子的起始位置, 对应哈希值)。
+    """
+    span = (offsets[-1] + 1) * step - (step - 1)
+    n = len(residues) - span + 1
+    if n <= 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.uint64)
+    code = np.zeros(n, dtype=np.uint64)
+    valid = np.ones(n, dtype=bool)
+    for offset in offsets:
+        part = residues[offset * step:offset * step + n]
+        valid &= part != INVALID
+        code = code * np.uint64(ALPHABET_SIZE) + part
+    positions = np.flatnonzero(valid)
+    hashes = (code[positions] * HASH_MULTIPLIER) >> np.uint64(64 - hash_bits)
+    return positions, hashes
+
+
+def load_seed_index(path):
+    """读取 BuildSeedIndex.py 写出的索引，返回 (位图, 种子位置, 哈希位数)。"""
+    with np.load(path) as index:
+        return index["bits"], seed_offsets(str(index["shape"])), int(index["hash_bits"])
+
+
+# 进程池中共享的索引（fork 继承，不逐批传递）
+_INDEX = None
+
+
+def scan_batch(batch):
+    """
+    扫描一批 reads 的 6 框翻译。
+
+    参数:
+    - batch (Tuple[bytes, np.ndarray]): (以 N 分隔拼接的序列, 各 read 长度)。
+
+    返回:
+    - np.ndarray: 各 read 命中的种子数。
+    """
+    bits, offsets, hash_bits = _INDEX
+    sequence, lengths = batch
+    bases = BASE_CODE[np.frombuffer(sequence, dtype=np.uint8)]
+    # 每个位置所属的 read（分隔符计入前一条 read，含分隔符的种子都无效）
+    read_of = np.repeat(np.arange(len(lengths)), lengths + 1)
+    hits = np.zeros(len(lengths), dtype=np.int64)
+    for strand, owner in ((bases, read_of), (COMPLEMENT[bases][::-1], read_of[::-1])):
+        # 每个位置起始的密码子：同一读码框的氨基酸在数组中间隔 3
+        residues = CODON_CODE[strand[:-2] * 25 + strand[1:-1] * 5 + strand[2:]]
+        positions, hashes = seed_hashes(residues, offsets, 3, hash_bits)
+        found = (bits[hashes >> np.uint64(3)] >> (hashes & np.uint64(7)).astype(np.uint8)) & 1
+        hits += np.bincount(owner[positions[found.astype(bool)]], minlength=len(lengths))
+    return hits
+
+
+def read_batches(read_store):
+    """按批读取两行 FASTA 读库，返回 [(标题行, 序列)]。"""
+    opener = gzip.open if read_store.endswith(".gz") else open
+    batch = []
+    with opener(read_store, "rb") as f:
+        for header in f:
+            batch.append((header, next(f, b"\n").rstrip(b"\n")))
+            if len(batch) >= BATCH_READS:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+
+def read_hit_names(us_file):
+    """diamond 结果第一列的 read 名称集合。"""
+    with open(us_file, "rb") as f:
+        return {line.split(b"\t", 1)[0].split(None, 1)[0] for line in f if line.strip()}
+
+
+def prefilter(read_store, output, pool, workers, min_hits, truth=None):
+    """
+    过滤一端读库。
+
+    参数:
+    - read_store (str): 读库（两行 FASTA，可为 BGZF .fa.gz）。
+    - output (str): 候选 reads 输出；None 时只统计。
+    - pool (ProcessPoolExecutor): 扫描进程池，None 时在本进程扫描。
+    - workers (int): 进程数，用于限制排队的批次。
+    - min_hits (int): 候选 read 至少命中的种子数。
+    - truth (str): 未过滤时的 diamond 结果，不为 None 时统计灵敏度。
+
+    返回:
+    - dict: 该端的统计。
+    """
+    reads = candidates = 0
+    kept_names = set() if truth else None
+    out = open(output + ".tmp", "wb") if output else None
+    pending = deque()
+
+    def drain():
+        nonlocal reads, candidates
+        records, future = pending.popleft()
+        hits = future.result() if pool is not None else future
+        for (header, seq), n in zip(records, hits):
+            if n < min_hits:
+                continue
+            candidates += 1
+            if out is not None:
+                out.write(header + seq + b"\n")
+            if kept_names is not None:
+                kept_names.add(header[1:].split(None, 1)[0])
+        reads += len(records)
+
+    try:
+        for records in read_batches(read_store):
+            batch = (b"N".join(seq for _, seq in records) + b"N",
+                     np.fromiter((len(seq) for _, seq in records), dtype=np.int64, count=len(records)))
+            pending.append((records, pool.submit(scan_batch, batch) if pool is not None else scan_batch(batch)))
+            while len(pending) > workers * 2:
+                drain()
+        while pending:
+            drain()
+    finally:
+        if out is not None:
+            out.close()
+    if out is not None:
+        os.replace(output + ".tmp", output)
+
+    stats = {"reads": read_store, "total": reads, "candidates": candidates,
+             "candidate_fraction": round(candidates / reads, 6) if reads else 0.0}
+    if truth:
+        expected = read_hit_names(truth)
+        found = len(expected & kept_names)
+        stats.update(truth=truth, truth_reads=len(expected), truth_found=found,
+                     sensitivity=round(found / len(expected), 6) if expected else None)
+    return stats
+
+
+def main():
+    global _INDEX
+    parser = argparse.ArgumentParser(description="Keep only reads whose 6-frame translation shares a seed with the gene database")
+    parser.add_argument("--index", required=True, help="Seed index built by BuildSeedIndex.py")
+    parser.add_argument("--reads", nargs="+", required=True, help="Read store of each mate (two-line FASTA, .fa or .fa.gz)")
+    parser.add_argument("--out", nargs="+", default=None, help="Candidate FASTA for each mate (omit to only report)")
+    parser.add_argument("--truth", nargs="+", default=None,
+                        help="Unfiltered diamond output of each mate, to report the sensitivity of the prefilter")
+    parser.add_argument("--min-hits", type=int, default=1, help="Seed hits required to keep a read (default: 1)")
+    parser.add_argument("-p", "--threads", type=int, default=4, help="Scanning processes (default: 4)")
+    parser.add_argument("--stats", default=None, help="Write the summary to this JSON file")
+    args = parser.parse_args()
+
+    for option in ("out", "truth"):
+        if getattr(args, option) and len(getattr(args, option)) != len(args.reads):
+            parser.error(f"--{option} needs one file per --reads file")
+
+    _INDEX = load_seed_index(args.index)
+    workers = max(1, args.threads)
+    # 子进程 fork 继承 _INDEX（Python 3.14 起默认不再是 fork，这里显式指定）
+    pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("fork")) \
+        if workers > 1 else None
+    try:
+        mates = [
+            prefilter(read_store, args.out[i] if args.out else None, pool, workers, args.min_hits,
+                      args.truth[i] if args.truth else None)
+            for i, read_store in enumerate(args.reads)
+        ]
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    total = sum(m["total"] for m in mates)
+    candidates = sum(m["candidates"] for m in mates)
+    summary = {"index": args.index, "min_hits": args.min_hits, "total": total, "candidates": candidates,
+               "candidate_fraction": round(candidates / total, 6) if total else 0.0, "mates": mates}
+    if args.truth:
+        expected = sum(m["truth_reads"] for m in mates)
+        summary["sensitivity"] = round(sum(m["truth_found"] for m in mates) / expected, 6) if expected else None
+    if args.stats:
+        with open(args.stats + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=1)
+        os.replace(args.stats + ".tmp", args.stats)
+
+    print(f"{candidates} of {total} reads kept ({summary['candidate_fraction']:.2%})", file=sys.stderr)
+    if args.truth:
+        print(f"Sensitivity against unfiltered diamond hits: {summary['sensitivity']}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,14 @@
 import os
 import sys
+import json
 import subprocess
 import importlib.util
 import argparse
+import numpy as np
+import pandas as pd
+
+# USCMG diamond 结果每次读取的行数，限制内存占用
+CHUNK_ROWS = 2000000
 
 def load_config_module(config_name_or_path):
     """
@@ -49,7 +55,7 @@ def read_metadata(sample_id, meta_data_out, default_library_size):
 
     with open(meta_data_out, 'w') as meta_out:
         # 写入列头
-        meta_out.write("SampleID\tName\tLibrarySize\t#ofReads\t#of16Sreads\tCellNumber\n")
+        meta_out.write("SampleID\tName\tLibrarySize\t#ofReads\t#of16Sreads\tCellNumber\tSubsampleFraction\n")
 
         # 使用传入的样品 ID 生成元数据
         sample_name = f"{sample_id}"
@@ -76,51 +82,143 @@ def parse_coglist(coglist):
                 seqlen[tem[0]] = int(tem[2])
     return seq2OGs, seqlen
 
+def build_uscmg_index(seq2OGs, seqlen):
+    """
+    把 all_KO30_name.list 编码为整数索引，供 estimate_cell_number 向量化累加。
+
+    返回:
+    - seq_index (pd.Index): 序列名，位置即序列编号。
+    - seq_og (np.ndarray): 序列编号 -> KO 编号。
+    - og_names (List[str]): KO 编号 -> KO 名称。
+    - seq_length (np.ndarray): 序列编号 -> 序列长度。
+    """
+    seq_names = list(seq2OGs)
+    og_names = list(dict.fromkeys(seq2OGs.values()))
+    og_code = {og: i for i, og in enumerate(og_names)}
+    seq_og = np.fromiter((og_code[seq2OGs[sid]] for sid in seq_names), dtype=np.int64, count=len(seq_names))
+    seq_length = np.fromiter((seqlen[sid] for sid in seq_names), dtype=np.float64, count=len(seq_names))
+    return pd.Index(seq_names), seq_og, og_names, seq_length
+
+def read_derep_sizes(indir, sample):
+    """读取 DerepPairs.py 写出的 read 出现次数（只含 N > 1 的 read），未去重时返回 None。"""
+    sizes_file = os.path.join(indir, f"{sample}.derep.sizes.tsv")
+    if not os.path.exists(sizes_file) or os.path.getsize(sizes_file) == 0:
+        return None
+    sizes = pd.read_csv(sizes_file, sep="\t", header=None, names=["qseqid", "size"], dtype={"qseqid": str, "size": np.int64})
+    return sizes.drop_duplicates("qseqid").set_index("qseqid")["size"]
+
+def uscmg_coverage(blastx_files, seq_index, read_sizes=None):
+    """
+    分块读取 diamond 结果（tab 格式），按 sseqid 的整数编号累加比对长度。
+
+    参数:
+    - blastx_files (List[str]): diamond 结果文件，依次读取。
+    - seq_index (pd.Index): build_uscmg_index 返回的序列索引。
+    - read_sizes (pd.Series): 去重读库中 read 的出现次数，比对长度按其加权。
+
+    返回:
+    - seq_cov (np.ndarray): 每条序列的比对长度之和。
+    - seq_hits (np.ndarray): 每条序列的比对行数。
+    - first_seen (np.ndarray): 每条序列首次出现的行号，用于保持输出顺序。
+    """
+    n_seq = len(seq_index)
+    seq_cov = np.zeros(n_seq, dtype=np.float64)
+    seq_hits = np.zeros(n_seq, dtype=np.int64)
+    first_seen = np.full(n_seq, np.iinfo(np.int64).max, dtype=np.int64)
+    offset = 0
+    for blastx_file in blastx_files:
+        if os.path.getsize(blastx_file) == 0:
+            continue
+        reader = pd.read_csv(blastx_file, sep="\t", header=None, usecols=[0, 1, 3], names=["qseqid", "sseqid", "length"],
+                             dtype={"qseqid": str, "sseqid": str, "length": np.float64}, chunksize=CHUNK_ROWS)
+        for chunk in reader:
+            codes = seq_index.get_indexer(chunk["sseqid"])
+            known = codes >= 0
+            rows = np.flatnonzero(known) + offset
+            codes = codes[known]
+            length = chunk["length"].to_numpy()
+            if read_sizes is not None:
+                length = length * chunk["qseqid"].map(read_sizes).fillna(1).to_numpy()
+            seq_cov += np.bincount(codes, weights=length[known], minlength=n_seq)
+            seq_hits += np.bincount(codes, minlength=n_seq)
+            seen, first = np.unique(codes, return_index=True)
+            first_seen[seen] = np.minimum(first_seen[seen], rows[first])
+            offset += len(chunk)
+    return seq_cov, seq_hits, first_seen
+
 def count_reads(indir, sample):
+    # FastqToFasta.py --stats 在解压时已统计 reads 数，直接读取，不再扫描 FASTA
+    readstat = os.path.join(indir, f"{sample}.readstat.json")
+    if os.path.exists(readstat):
+        with open(readstat, 'r') as f:
+            return json.load(f)["reads"]
     file1 = os.path.join(indir, f"{sample}_1.fa")
     file2 = os.path.join(indir, f"{sample}_2.fa")
     if os.path.exists(file1) and os.path.exists(file2):
         num1 = int(subprocess.getoutput(f"grep '>' {file1} -c"))
         num2 = int(subprocess.getoutput(f"grep '>' {file2} -c"))
         return num1 + num2
+    elif os.path.exists(file1 + ".gz") and os.path.exists(file2 + ".gz"):
+        # --stream-reads 模式只保存 BGZF 压缩的读库
+        num1 = int(subprocess.getoutput(f"gzip -dc {file1}.gz | grep '>' -c"))
+        num2 = int(subprocess.getoutput(f"gzip -dc {file2}.gz | grep '>' -c"))
+        return num1 + num2
     else:
         raise RuntimeError(f"Input files missing for sample {sample}!")
 
+def subsample_fraction(indir, sample):
+    # FastqToFasta.py --subsample 时 readstat.json 记录实际保留的 reads 比例，未抽样时为 1
+    readstat = os.path.join(indir, f"{sample}.readstat.json")
+    if os.path.exists(readstat):
+        with open(readstat, 'r') as f:
+            return json.load(f).get("subsample_fraction", 1.0)
+    return 1.0
+
 def count_16s_reads(indir, sample, samplerlen, config):
+    # Stream16S.py 在 minimap2 输出时已完成统计，优先读取；旧结果目录中只有 SAM 时仍用 samtools 计数
+    summary_file = os.path.join(indir, f"{sample}.16s.json")
     sam_file = os.path.join(indir, f"{sample}.sam")
-    if os.path.exists(sam_file):
+    estimator = getattr(config, "BP_16S_ESTIMATOR", "paired")
+    if os.path.exists(summary_file):
+        with open(summary_file, 'r') as f:
+            summary = json.load(f)
+        if estimator == "coverage" or summary["properly_paired"] is None:
+            return round(summary["coverage"], 12)
+        num_16s = summary["properly_paired"]
+    elif os.path.exists(sam_file):
         num_16s = int(subprocess.getoutput(f"{config.BP_SAMTOOLS_SOFTWARE} view -f 3 {sam_file} | wc -l"))
-        # 保留12位小数
-        return round(num_16s * samplerlen[sample] / 1432, 12)
     else:
-        raise RuntimeError(f"SAM file missing for sample {sample}!")
+        raise RuntimeError(f"16S alignment summary missing for sample {sample}!")
+    # 保留12位小数
+    return round(num_16s * samplerlen[sample] / 1432, 12)
 
-def estimate_cell_number(indir, outdir, sample, seq2OGs, seqlen):
-    blastx_file = os.path.join(indir, f"{sample}.uscmg.blastx.txt")
+def estimate_cell_number(indir, outdir, sample, uscmg_index):
+    # 直接读取 R1/R2 两个 diamond 结果；旧结果目录中只有合并后的 uscmg.blastx.txt
+    blastx_files = [os.path.join(indir, f"{sample}.uscmg_{r}.dmd") for r in (1, 2)]
+    if not all(os.path.exists(f) for f in blastx_files):
+        blastx_files = [os.path.join(indir, f"{sample}.uscmg.blastx.txt")]
     ko_averagecov_file = os.path.join(outdir, f"{sample}.uscmg.ko_averagecov.txt")
 
-    if os.path.exists(blastx_file):
-        seqcov = {}
-        with open(blastx_file, 'r') as f:
-            for line in f:
-                tem = line.strip().split("\t")
-                seqcov[tem[1]] = seqcov.get(tem[1], 0) + float(tem[3])
-
-        kocov = {}
-        for sid, coverage in seqcov.items():
-            if sid in seq2OGs:
-                og = seq2OGs[sid]
-                if og not in kocov:
-                    kocov[og] = {}
-                kocov[og][sid] = kocov[og].get(sid, 0) + coverage
+    if os.path.exists(blastx_files[0]):
+        seq_index, seq_og, og_names, seq_length = uscmg_index
+        seq_cov, seq_hits, first_seen = uscmg_coverage(blastx_files, seq_index, read_derep_sizes(indir, sample))
+
+        # 每个 KO：Σ 序列覆盖长度 / 序列长度，以及被比对到的序列数
+        hit = seq_hits > 0
+        ko_ave = np.bincount(seq_og[hit], weights=seq_cov[hit] / seq_length[hit], minlength=len(og_names))
+        ko_seqnum = np.bincount(seq_og[hit], minlength=len(og_names))
+        ko_first = np.full(len(og_names), np.iinfo(np.int64).max, dtype=np.int64)
+        np.minimum.at(ko_first, seq_og[hit], first_seen[hit])
 
         avgKOcopy = 0
         KOcount = 0
         with open(ko_averagecov_file, 'w') as ko_out:
-            for og, seq_coverage in kocov.items():
-                seqnum = len(seq_coverage)
-                ave = sum(cov / seqlen[sid] for sid, cov in seq_coverage.items())
-                ko_out.write(f"{og}\t{ave:.6f}\t{seqnum}\n")
+            # KO 按其序列在比对结果中首次出现的顺序输出
+            for k in np.argsort(ko_first, kind="stable"):
+                if ko_seqnum[k] == 0:
+                    continue
+                ave = float(ko_ave[k])
+                ko_out.write(f"{og_names[k]}\t{ave:.6f}\t{ko_seqnum[k]}\n")
                 avgKOcopy += ave
                 KOcount += 1
 
@@ -132,17 +230,18 @@ def estimate_cell_number(indir, outdir, sample, seq2OGs, seqlen):
     else:
         raise RuntimeError("BLASTx file missing!")
 
-def update_metadata(meta_data_out, metainfo, sampleid, hashreads, hash16s, cellnum):
+def update_metadata(meta_data_out, metainfo, sampleid, hashreads, hash16s, cellnum, fractions):
     with open(meta_data_out, 'w') as meta_out:  # 写模式，覆盖文件
         # 写入列头
-        meta_out.write("SampleID\tName\tLibrarySize\t#ofReads\t#of16Sreads\tCellNumber\n")
+        meta_out.write("SampleID\tName\tLibrarySize\t#ofReads\t#of16Sreads\tCellNumber\tSubsampleFraction\n")
 
         # 直接获取唯一的样品 ID
         sample_id = list(metainfo.keys())[0]
 
         # 写入该样品的信息
         meta_out.write(f"{metainfo[sample_id]}\t{hashreads[sampleid[sample_id]]}\t"
-                       f"{hash16s[sampleid[sample_id]]:.12f}\t{cellnum[sampleid[sample_id]]:.12f}\n")
+                       f"{hash16s[sampleid[sample_id]]:.12f}\t{cellnum[sampleid[sample_id]]:.12f}\t"
+                       f"{fractions[sampleid[sample_id]]:.12f}\n")
 
 def parse_args():
     parser = argparse.ArgumentParser(description="BPtracer analysis pipeline for processing metadata.")
@@ -165,19 +264,23 @@ def main():
 
     # 解析 COG 列表
     seq2OGs, seqlen = parse_coglist(args.coglist)
+    uscmg_index = build_uscmg_index(seq2OGs, seqlen)
 
     # 计算 Reads、16S 数和细胞数
     hashreads = {}
     hash16s = {}
     cellnum = {}
+    fractions = {}
 
     sample = args.sample_id
+    # #ofReads 为整个文库的 reads 数；抽样运行时 16S 数与细胞数按保留比例外推到整个文库
+    fractions[sample] = subsample_fraction(args.indir, sample)
     hashreads[sample] = count_reads(args.indir, sample)
-    hash16s[sample] = count_16s_reads(args.indir, sample, samplerlen, config)
-    cellnum[sample] = estimate_cell_number(args.indir, args.outdir, sample, seq2OGs, seqlen)
+    hash16s[sample] = round(count_16s_reads(args.indir, sample, samplerlen, config) / fractions[sample], 12)
+    cellnum[sample] = round(estimate_cell_number(args.indir, args.outdir, sample, uscmg_index) / fractions[sample], 12)
 
     # 更新元数据文件
-    update_metadata(args.meta_data_out, metainfo, sampleid, hashreads, hash16s, cellnum)
+    update_metadata(args.meta_data_out, metainfo, sampleid, hashreads, hash16s, cellnum, fractions)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
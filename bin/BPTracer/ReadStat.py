@@ -0,0 +1,52 @@
+import os
+import json
+import argparse
+import pandas as pd
+
+
+def load_readstat(path):
+    """读取 FastqToFasta.py --stats 写出的样品统计文件。"""
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def readstat_table(stat_files, output_file):
+    """
+    把各样品的统计文件汇总为 FastqStat.jar 格式的 stat.main.xls，供 ProcessStat.py 使用。
+
+    参数:
+    - stat_files (List[str]): 各样品的 <sample>.readstat.json。
+    - output_file (str): 输出表格路径。
+
+    说明:
+    - Total_Reads 为 R1 与 R2 的 reads 数之和，与 FastqStat.jar 相同；
+    - 附加 Pairs_Consistent 列，R1/R2 的 reads 数或 read 名称不一致的样品为 False。
+    """
+    rows = []
+    for path in stat_files:
+        stats = load_readstat(path)
+        sample = stats["sample"] or os.path.basename(path).split(".")[0]
+        rows.append({
+            "#Sample_ID": sample,
+            "Total_Reads": stats["reads"],
+            "Total_Bases": stats["bases"],
+            "Total_Reads_with_Ns": stats["reads_with_N"],
+            "Pairs_Consistent": stats["pairs_consistent"],
+        })
+    df = pd.DataFrame(rows, columns=["#Sample_ID", "Total_Reads", "Total_Bases", "Total_Reads_with_Ns", "Pairs_Consistent"])
+    df.to_csv(output_file, sep="\t", index=False)
+    inconsistent = df.loc[df["Pairs_Consistent"] == False, "#Sample_ID"].tolist()  # noqa: E712
+    if inconsistent:
+        print(f"Warning: R1/R2 reads differ for {', '.join(map(str, inconsistent))}")
+    print(f"Read statistics of {len(df)} samples written to {output_file}")
+
+
+if __name__ == "__main__":
+    # -i 各样品的 readstat.json（BP S01 生成，位于 00.DataStat/<sample>/）
+    # -o 输出表格，默认 stat.main.xls
+    parser = argparse.ArgumentParser(description="Summarize per-sample read statistics recorded during FASTQ decoding")
+    parser.add_argument("-i", "--input", nargs="+", required=True, help="Per-sample <sample>.readstat.json files")
+    parser.add_argument("-o", "--output", default="stat.main.xls", help="Output table (default: stat.main.xls)")
+    args = parser.parse_args()
+
+    readstat_table(args.input, args.output)
@@ -0,0 +1,93 @@
+"""
+记录单条命令的运行统计，由 BPtracer --metrics 生成的脚本调用：
+
+    python3 RunMetrics.py -o shell/metrics/<script>.jsonl -s <script> [--sample A1] -- '<command>'
+
+命令通过 bash -c 执行，退出码原样返回，因此不影响脚本原有的 set -e 等行为。
+统计来自 os.wait4 返回的 rusage（包含命令的全部子进程）：
+- wall: 墙钟时间（秒）；user / sys: 用户态与内核态 CPU 时间（秒）；
+- max_rss_kb: 最大常驻内存（KB，取所有子进程中的最大值）；
+- read_bytes / write_bytes: 块设备读写字节数（ru_inblock / ru_oublock × 512），
+  命中页缓存的读取不计入。
+每条命令追加一行 JSON；同一次脚本执行的记录共享 BPTRACER_RUN_ID 环境变量。
+"""
+
+import os
+import sys
+import json
+import time
+import shlex
+import argparse
+import subprocess
+
+# 解释器后面的第一个参数才是真正的工具名，如 python3 GeneAbundance.py
+INTERPRETERS = {"python", "python3", "perl", "bash", "sh", "Rscript", "java"}
+
+
+def tool_name(command):
+    """从命令行中提取工具名（可执行文件或脚本的文件名）。"""
+    try:
+        tokens = shlex.split(command, comments=True)
+    except ValueError:
+        tokens = command.split()
+    for token in tokens:
+        name = os.path.basename(token)
+        if "=" in token and not token.startswith("/"):
+            continue  # VAR=value 前缀
+        if name in INTERPRETERS or token.startswith("-"):
+            continue
+        return name
+    return os.path.basename(tokens[0]) if tokens else ""
+
+
+def run(command):
+    """执行命令并返回 (退出码, 统计 dict)。"""
+    start = time.time()
+    process = subprocess.Popen(["bash", "-c", command])
+    _, status, usage = os.wait4(process.pid, 0)
+    wall = time.time() - start
+    process.returncode = os.waitstatus_to_exitcode(status)
+    metrics = {
+        "start": round(start, 3),
+        "wall": round(wall, 3),
+        "user": round(usage.ru_utime, 3),
+        "sys": round(usage.ru_stime, 3),
+        "max_rss_kb": usage.ru_maxrss,
+        "read_bytes": usage.ru_inblock * 512,
+        "write_bytes": usage.ru_oublock * 512,
+        "returncode": process.returncode,
+    }
+    return process.returncode, metrics
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a command and append its runtime metrics as JSONL")
+    parser.add_argument("-o", "--output", required=True, help="Metrics JSONL file")
+    parser.add_argument("-s", "--script", required=True, help="Name of the calling script")
+    parser.add_argument("--sample", default="", help="Sample ID of the calling script")
+    parser.add_argument("command", nargs=argparse.REMAINDER, help="Command line, after --")
+    args = parser.parse_args()
+
+    command = " ".join(args.command[1:] if args.command[:1] == ["--"] else args.command)
+    returncode, metrics = run(command)
+
+    record = {
+        "run_id": os.environ.get("BPTRACER_RUN_ID", ""),
+        "script": args.script,
+        "sample": args.sample,
+        "tool": tool_name(command),
+        "command": command,
+    }
+    record.update(metrics)
+    try:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+    except OSError as e:
+        print(f"Warning: cannot write metrics to {args.output}: {e}", file=sys.stderr)
+
+    sys.exit(returncode if returncode >= 0 else 128 - returncode)
+
+
+if __name__ == "__main__":
+    main()
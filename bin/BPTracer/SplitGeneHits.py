@@ -0,0 +1,73 @@
+"""
+拆分合并库（Gene-ALL.dmnd）的 diamond 结果：
+
+    python3 SplitGeneHits.py -i A1.genes.us --sample A1 --outdir <BP 输出目录> --type ARGs:01.ARGs --type MGEs:02.MGEs ...
+
+合并库的 subject ID 带类型前缀（ARGs|xxx，由 BuildGeneDB.py 添加），query 名称带 /1、/2
+后缀（由 TagMates.py 添加）。每个 read 在每种基因类型中只保留第一条（得分最高的）比对，
+与单库搜索时的 -k 1 相同；但合并库搜索每个 read 只报告 BP_GENE_COMBINED_MAX_TARGETS 条比对，
+若其中没有某类型的比对（名额被得分更高的其他类型占满），该类型就没有这个 read，
+而单库搜索会报告它；BP_GENE_COMBINED_MAX_TARGETS = 0 时两者一致。去掉前缀与后缀后写入 <outdir>/<基因目录>/<sample>/<sample>_1.us 与 _2.us，
+后续抽取与合并步骤与单库模式一致。
+"""
+
+import os
+import argparse
+
+TYPE_SEP = "|"
+
+
+def split_hits(hits_file, sample, outdir, type_dirs):
+    """
+    参数:
+    - hits_file (str): 合并库的 diamond 结果（tab 格式）。
+    - sample (str): 样品 ID。
+    - outdir (str): BP 输出目录。
+    - type_dirs (Dict[str, str]): 基因类型 -> 结果目录（如 ARGs -> 01.ARGs）。
+
+    返回:
+    - Dict[str, int]: 各基因类型保留的比对数。
+    """
+    handles = {}
+    for gene_type, gene_dir in type_dirs.items():
+        sample_dir = os.path.join(outdir, gene_dir, sample)
+        os.makedirs(sample_dir, exist_ok=True)
+        for mate in ("1", "2"):
+            handles[gene_type, mate] = open(os.path.join(sample_dir, f"{sample}_{mate}.us"), "w")
+
+    kept = dict.fromkeys(type_dirs, 0)
+    # diamond 按 query 顺序输出，同一 query 的比对按得分降序排列
+    current, seen = None, set()
+    try:
+        with open(hits_file, "r") as f:
+            for line in f:
+                query, subject, rest = line.split("\t", 2)
+                gene_type, subject = subject.split(TYPE_SEP, 1)
+                if gene_type not in type_dirs:
+                    continue
+                if query != current:
+                    current, seen = query, set()
+                if gene_type in seen:
+                    continue
+                seen.add(gene_type)
+                read, mate = query.rsplit("/", 1)
+                handles[gene_type, mate].write(f"{read}\t{subject}\t{rest}")
+                kept[gene_type] += 1
+    finally:
+        for handle in handles.values():
+            handle.close()
+    return kept
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Demultiplex diamond hits against the combined gene database by gene type and mate")
+    parser.add_argument("-i", "--input", required=True, help="diamond output against Gene-ALL.dmnd")
+    parser.add_argument("--sample", required=True, help="Sample ID")
+    parser.add_argument("--outdir", required=True, help="BP output folder holding 01.ARGs ... 05.SGs")
+    parser.add_argument("--type", action="append", required=True, metavar="TYPE:DIR",
+                        help="Gene type and its result folder, e.g. ARGs:01.ARGs (repeatable)")
+    args = parser.parse_args()
+
+    type_dirs = dict(item.split(":", 1) for item in args.type)
+    kept = split_hits(args.input, args.sample, args.outdir, type_dirs)
+    print("\t".join(f"{gene_type}: {n}" for gene_type, n in kept.items()))
@@ -0,0 +1,152 @@
+"""
+从管道读取 minimap2 的 SAM 或 PAF 输出，流式统计 16S 比对，替代落盘的完整 SAM
+与 samtools view -f 3 | wc -l：
+
+    minimap2 -ax sr gg85.mmi A1_1.fa A1_2.fa | python3 Stream16S.py --sample A1 -o A1.16s.json
+
+只处理比对上的记录，写出小的统计文件：
+- properly_paired: FLAG 同时含 0x1 与 0x2 的记录数，与 samtools view -f 3 的计数相同（PAF 输入时为 null）；
+- mapped: 比对上的主比对（不含 secondary / supplementary）数；
+- coverage: 每条主比对的 参考覆盖长度 / 参考序列长度 之和，即按长度归一化的 16S 拷贝数估计；
+- references: 被比对到的参考序列数。
+ProcessMeta.py 读取该文件计算 #of16Sreads（算法由 config.BP_16S_ESTIMATOR 选择）。
+
+去重后的读库（BP --derep）标题行带 SZ:i:N，minimap2 -y 将其作为 SAM 标签输出，
+各计数按 N 加权，结果与未去重时一致。
+"""
+
+import os
+import re
+import sys
+import json
+import argparse
+
+CIGAR_OP = re.compile(rb"(\d+)([MIDNSHP=X])")
+# 消耗参考序列的 CIGAR 操作
+REF_OPS = frozenset(b"MDN=X")
+SIZE_TAG = b"\tSZ:i:"
+
+
+def reference_span(cigar):
+    """由 CIGAR 计算比对覆盖的参考长度。"""
+    return sum(int(length) for length, op in CIGAR_OP.findall(cigar) if op[0] in REF_OPS)
+
+
+def read_size(line):
+    """SAM 记录的 SZ:i:N 标签（去重读库的序列对出现次数），没有时为 1。"""
+    start = line.find(SIZE_TAG)
+    if start < 0:
+        return 1
+    start += len(SIZE_TAG)
+    end = start
+    while end < len(line) and line[end] in b"0123456789":
+        end += 1
+    return int(line[start:end])
+
+
+def count_16s(stream, mapped_sam=None):
+    """
+    统计 SAM / PAF 流。
+
+    参数:
+    - stream: 二进制输入流。
+    - mapped_sam: 不为 None 时把 SAM 头与比对上的记录写入该二进制流。
+
+    返回:
+    - dict: 统计结果。
+
+    异常:
+    - ValueError: SAM 记录的参考序列在头中没有 @SQ 长度（头被截断或缺失）。
+    """
+    ref_length = {}
+    hit_refs = set()
+    records = properly_paired = mapped = 0
+    coverage = 0.0
+    fmt = None
+
+    for line in stream:
+        if line[:1] == b"@":
+            # SAM 头：记录参考序列长度
+            fmt = "sam"
+            if line.startswith(b"@SQ"):
+                fields = dict(field.split(b":", 1) for field in line.rstrip(b"\n").split(b"\t")[1:] if b":" in field)
+                ref_length[fields[b"SN"]] = int(fields[b"LN"])
+            if mapped_sam is not None:
+                mapped_sam.write(line)
+            continue
+
+        fields = line.split(b"\t", 12)
+        if fmt is None:
+            fmt = "paf" if len(fields) > 4 and fields[4] in (b"+", b"-") else "sam"
+        records += 1
+
+        if fmt == "paf":
+            # PAF：tname tlen tstart tend 位于第 6-9 列，tp:A:P 标记主比对
+            if b"tp:A:S" in line:
+                continue
+            target, tlen, tstart, tend = fields[5], int(fields[6]), int(fields[7]), int(fields[8])
+            mapped += 1
+            coverage += (tend - tstart) / tlen
+            hit_refs.add(target)
+            continue
+
+        flag = int(fields[1])
+        if flag & 4:
+            continue  # 未比对上
+        size = read_size(line)
+        if flag & 3 == 3:
+            properly_paired += size
+        if mapped_sam is not None:
+            mapped_sam.write(line)
+        if flag & 0x900:
+            continue  # secondary / supplementary
+        target = fields[2]
+        if target not in ref_length:
+            # 没有 @SQ 长度时无法计算覆盖度；跳过会低估 16S 拷贝数，因此直接报错
+            raise ValueError(
+                f"reference {target.decode(errors='replace')} has no @SQ LN in the SAM header "
+                f"(run minimap2 with -a and keep the header, or pass PAF)"
+            )
+        mapped += size
+        coverage += reference_span(fields[5]) / ref_length[target] * size
+        hit_refs.add(target)
+
+    return {
+        "format": fmt or "sam",
+        "records": records,
+        "properly_paired": properly_paired if fmt != "paf" else None,
+        "mapped": mapped,
+        "coverage": round(coverage, 12),
+        "references": len(hit_refs),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize minimap2 16S alignments (SAM or PAF) streamed from stdin")
+    parser.add_argument("-i", "--input", default="-", help="SAM/PAF file, '-' for stdin (default)")
+    parser.add_argument("-o", "--output", required=True, help="Summary JSON file")
+    parser.add_argument("--sample", default="", help="Sample ID recorded in the summary")
+    parser.add_argument("--mapped-sam", default=None, help="Also keep the header and mapped SAM records in this file")
+    args = parser.parse_args()
+
+    stream = sys.stdin.buffer if args.input == "-" else open(args.input, "rb")
+    mapped_sam = open(args.mapped_sam, "wb") if args.mapped_sam else None
+    try:
+        summary = count_16s(stream, mapped_sam)
+    except ValueError as e:
+        sys.exit(f"Error: {args.sample}: {e}")
+    finally:
+        if mapped_sam is not None:
+            mapped_sam.close()
+    summary = dict(sample=args.sample, **summary)
+
+    tmp_file = args.output + ".tmp"
+    with open(tmp_file, "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=1)
+    os.replace(tmp_file, args.output)
+    print(f"16S: {summary['properly_paired']} properly paired records, {summary['mapped']} primary hits, "
+          f"coverage {summary['coverage']:.3f}")
+
+
+if __name__ == "__main__":
+    main()
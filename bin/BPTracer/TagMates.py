@@ -0,0 +1,45 @@
+"""
+把双端读库合并为一个 FASTA 流写到标准输出，read 名称（第一个空白之前的部分）后加 /1、/2：
+
+    python3 TagMates.py A1_1.fa A1_2.fa | diamond blastx -q /dev/stdin ...
+
+R1、R2 的 read 名称通常相同，加上后缀后才能在一次 diamond 搜索中区分两端；
+SplitGeneHits.py 拆分结果时去掉后缀。支持 .gz（含 BGZF）读库。
+"""
+
+import sys
+import gzip
+import argparse
+
+def open_fasta(path):
+    return gzip.open(path, "rb") if path.endswith(".gz") else open(path, "rb")
+
+
+def tag_mates(fasta_files, out):
+    """
+    依次输出各读库，第 i 个文件的 read 名称加后缀 /i。
+
+    参数:
+    - fasta_files (List[str]): 读库文件。
+    - out: 二进制输出流。
+    """
+    for mate, path in enumerate(fasta_files, start=1):
+        suffix = f"/{mate}".encode()
+        with open_fasta(path) as f:
+            for line in f:
+                if line[:1] == b">":
+                    name = line[1:].split(None, 1)[0] if line[1:].strip() else b""
+                    line = b">" + name + suffix + b"\n"
+                out.write(line)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Concatenate paired FASTA files with /1 and /2 appended to read names")
+    parser.add_argument("fasta", nargs="+", help="Read store files in mate order (plain or .gz)")
+    args = parser.parse_args()
+
+    try:
+        tag_mates(args.fasta, sys.stdout.buffer)
+        sys.stdout.buffer.flush()
+    except BrokenPipeError:
+        sys.exit(1)
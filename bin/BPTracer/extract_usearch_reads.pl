@@ -20,7 +20,12 @@ while(<I>){
 }
 close I;
 
-die "$!" unless open(II,"$ARGV[1]");
+# BGZF/gzip 压缩的读库（--stream-reads）通过 gunzip 读取
+if($ARGV[1] =~ /\.gz$/){
+	die "$!" unless open(II,"gunzip -dc $ARGV[1]|");
+}else{
+	die "$!" unless open(II,"$ARGV[1]");
+}
 die "$!" unless open(T,">$ARGV[2]");
 
 ##Process fasta files to extracted all those sequences in the fasta 
@@ -4,6 +4,73 @@ from bptracer.BaseRunner import BaseRunner
 from bptracer.fileManager import mkdir
 #from bptracer import config
 
+
+def read_store(config, id):
+    """
+    返回 S01 保存的 FASTA 读库 (_1, _2) 路径。
+
+    流式模式（BP_STREAM_READS）下读库为 BGZF 压缩的 {id}_1.fa.gz / {id}_2.fa.gz，
+    去重（BP_DEREP_READS）时为 {id}_1.derep.fa / {id}_2.derep.fa，否则为未压缩的 {id}_1.fa / {id}_2.fa。
+    """
+    datadir = os.path.join(config.BP_OUTPUT_PATH, "00.DataStat", str(id))
+    if config.BP_STREAM_READS:
+        suffix = ".fa.gz"
+    elif config.BP_DEREP_READS:
+        suffix = ".derep.fa"
+    else:
+        suffix = ".fa"
+    return os.path.join(datadir, f"{id}_1{suffix}"), os.path.join(datadir, f"{id}_2{suffix}")
+
+
+def readstat_path(config, id):
+    """返回 S01 在解压时写出的样品 reads 统计文件 00.DataStat/{id}/{id}.readstat.json。"""
+    return os.path.join(config.BP_OUTPUT_PATH, "00.DataStat", str(id), f"{id}.readstat.json")
+
+
+def seed_index(geneDBDiamond):
+    """返回 diamond 库对应的预过滤种子索引（Gene-ARG.dmnd -> Gene-ARG.seeds.npz）。"""
+    return os.path.splitext(geneDBDiamond)[0] + ".seeds.npz"
+
+
+def prefilter_command(config, id, reads, index):
+    """
+    预过滤（BP_PREFILTER）：返回 (过滤命令, 各端送入 diamond 的查询, 清理命令)；未开启时查询即为读库。
+
+    过滤命令连同注释行以换行结尾，拼接在 diamond 命令之前；清理命令以换行开头，拼接在其后。
+    未开启时两者均为空串，生成的脚本与不预过滤时逐行相同。
+    """
+    if not config.BP_PREFILTER:
+        return "", list(reads), ""
+    queries = [f".//{id}_{mate}.cand.fa" for mate in range(1, len(reads) + 1)]
+    cmd = (f"# 种子预过滤（--prefilter）：只把种子命中足够的 reads 送入 diamond\n        "
+           f"{config.BP_PREFILTER_SOFTWARE} --index {index} --reads {' '.join(reads)} --out {' '.join(queries)} "
+           f"-p {config.BP_DIAMOND_THREADS} --min-hits {config.BP_PREFILTER_MIN_HITS} --stats .//{id}.prefilter.json\n        ")
+    return cmd, queries, f"\n        rm -f {' '.join(queries)}"
+
+
+def diamond_thresholds(config):
+    """
+    S02 diamond 的阈值参数：默认为宽松的 -e 10 --id 60，由 BP2 的 BLAST 复核；
+    单遍模式（BP_ONE_PASS）直接使用最终的 E 值与相似度阈值。
+    """
+    if not config.BP_ONE_PASS:
+        return "-e 10 --id 60"
+    return f"-e {config.BP_EVALUE_THRESHOLD} --id {config.BP_IDENTITY_THRESHOLD} {config.BP_ONE_PASS_DIAMOND_OPTIONS}".rstrip()
+
+
+def extract_hits_option(config):
+    """单遍模式下 ExtractHits.py 同时写出 extracted.m8。"""
+    return " --m8" if config.BP_ONE_PASS else ""
+
+
+def subsample_option(config):
+    """返回 FastqToFasta.py 的抽样参数（BP_SUBSAMPLE 为 None 时为空串）。"""
+    subsample = getattr(config, "BP_SUBSAMPLE", None)
+    if subsample is None:
+        return ""
+    return f" --subsample {int(subsample) if subsample >= 1 else subsample}"
+
+
 # RawdataStat
 class RawdataStat(BaseRunner):
     def build_command(self):
@@ -12,24 +79,103 @@ class RawdataStat(BaseRunner):
         file1 = self.params.get('file1')
         file2 = self.params.get('file2')
 
+        if config.BP_STREAM_READS:
+            return self.build_stream_command()
+
+        # 去重（--derep）：DerepPairs.py 把完全相同的 read 对合并写入 {id}_[12].derep.fa 并建立索引，
+        # 成功后删除未去重的读库；minimap2 -y 把 SZ:i:N 带入 SAM
+        derep = config.BP_DEREP_READS
+        index_option = ("" if derep else " --index") + subsample_option(config)
+        fa1, fa2 = (f".//{os.path.basename(fa)}" for fa in read_store(config, id))
+        derep_cmd = (f"{config.BP_DEREP_SOFTWARE} --sample {id} -1 .//{id}_1.fa -2 .//{id}_2.fa -o {fa1} {fa2} --index "
+                     f"&& rm -f .//{id}_1.fa .//{id}_2.fa || exit 1") if derep else ""
+        minimap2_options = "-ax sr -y" if derep else "-ax sr"
+
         cmd = textwrap.dedent(rf"""
         cd {config.BP_OUTPUT_PATH}; mkdir -p 00.DataStat/{id}; cd 00.DataStat/{id}
         
-        {config.BP_FQ2FA_SOFTWARE} {file1} .//{id}_1.fa
-        {config.BP_FQ2FA_SOFTWARE} {file2} .//{id}_2.fa
-        # Using minimap2 to search 16s
-        {config.BP_MINIMAP2} -ax sr {config.BP_16S_DATABASE} .//{id}_1.fa .//{id}_2.fa >.//{id}.sam
+        {config.BP_FQ2FA_SOFTWARE} -t {config.BP_FQ2FA_THREADS}{index_option} --stats .//{id}.readstat.json --sample {id} {file1} .//{id}_1.fa {file2} .//{id}_2.fa
+        {derep_cmd}
+        # Using minimap2 to search 16s (alignments are summarized on the fly, no SAM is written)
+        {config.BP_MINIMAP2} {minimap2_options} {config.BP_16S_DATABASE} {fa1} {fa2} | {config.BP_16S_SOFTWARE} --sample {id} -o .//{id}.16s.json
         
         # Using Diamond to search USCMGs  (Universal single-copy genes)
-        {config.BP_USCMG_SOFTWARE} -q .//{id}_1.fa -d {config.BP_USCMG_DATABASE} -o .//{id}.uscmg_1.dmd -f tab  -p 20  -e 3 --id 0.45 --max-target-seqs 1
-        {config.BP_USCMG_SOFTWARE} -q .//{id}_2.fa -d {config.BP_USCMG_DATABASE} -o .//{id}.uscmg_2.dmd -f tab  -p 20  -e 3 --id 0.45 --max-target-seqs 1
-        cat .//{id}.uscmg_1.dmd .//{id}.uscmg_2.dmd > .//{id}.uscmg.blastx.txt
+        {config.BP_USCMG_SOFTWARE} -q {fa1} -d {config.BP_USCMG_DATABASE} -o .//{id}.uscmg_1.dmd -f tab  -p {config.BP_USCMG_THREADS}  -e 3 --id 0.45 --max-target-seqs 1
+        {config.BP_USCMG_SOFTWARE} -q {fa2} -d {config.BP_USCMG_DATABASE} -o .//{id}.uscmg_2.dmd -f tab  -p {config.BP_USCMG_THREADS}  -e 3 --id 0.45 --max-target-seqs 1
         
         # Obtain Metadata
         python3 {config.BIN_PATH}/BPTracer/ProcessMeta.py --indir ./ --outdir ./ --sample_id {id} --meta_data_out meta_data_online.txt  --coglist {config.BP_USCMG_LIST} --config {config.CONFIG_SCRIPT}
         """)
         return cmd
 
+    def build_stream_command(self):
+        """
+        流式模式：FASTQ 只解压一次，FASTA 经命名管道同时送入 minimap2 与两个 diamond，
+        磁盘上只保留 BGZF 压缩的读库与 16S 比对统计。
+        """
+        config = self.params.get('config')
+        id = self.params.get('id')
+        file1 = self.params.get('file1')
+        file2 = self.params.get('file2')
+        fifos = f".//{id}_1.map.fifo .//{id}_2.map.fifo .//{id}_1.uscmg.fifo .//{id}_2.uscmg.fifo"
+        uscmg_threads = max(1, config.BP_USCMG_THREADS // 2)
+
+        cmd = textwrap.dedent(rf"""
+        cd {config.BP_OUTPUT_PATH}; mkdir -p 00.DataStat/{id}; cd 00.DataStat/{id}
+        rm -f {fifos}
+        mkfifo {fifos}
+
+        # Using minimap2 to search 16s (alignments are summarized on the fly, no SAM is written)
+        {config.BP_MINIMAP2} -ax sr {config.BP_16S_DATABASE} .//{id}_1.map.fifo .//{id}_2.map.fifo | {config.BP_16S_SOFTWARE} --sample {id} -o .//{id}.16s.json &
+        map_pid=$!
+
+        # Using Diamond to search USCMGs  (Universal single-copy genes)
+        {config.BP_USCMG_SOFTWARE} -q .//{id}_1.uscmg.fifo -d {config.BP_USCMG_DATABASE} -o .//{id}.uscmg_1.dmd -f tab  -p {uscmg_threads}  -e 3 --id 0.45 --max-target-seqs 1 &
+        uscmg1_pid=$!
+        {config.BP_USCMG_SOFTWARE} -q .//{id}_2.uscmg.fifo -d {config.BP_USCMG_DATABASE} -o .//{id}.uscmg_2.dmd -f tab  -p {uscmg_threads}  -e 3 --id 0.45 --max-target-seqs 1 &
+        uscmg2_pid=$!
+
+        # Decode once: FASTA goes to the FIFOs above and to the BGZF read store
+        {config.BP_FQ2FA_SOFTWARE} -t {config.BP_FQ2FA_THREADS} --index{subsample_option(config)} --stats .//{id}.readstat.json --sample {id} {file1} .//{id}_1.fa.gz,.//{id}_1.map.fifo,.//{id}_1.uscmg.fifo {file2} .//{id}_2.fa.gz,.//{id}_2.map.fifo,.//{id}_2.uscmg.fifo &
+        fq2fa_pid=$!
+        wait $fq2fa_pid || exit 1
+        wait $map_pid || exit 1
+        wait $uscmg1_pid || exit 1
+        wait $uscmg2_pid || exit 1
+        rm -f {fifos}
+
+        # Obtain Metadata
+        python3 {config.BIN_PATH}/BPTracer/ProcessMeta.py --indir ./ --outdir ./ --sample_id {id} --meta_data_out meta_data_online.txt  --coglist {config.BP_USCMG_LIST} --config {config.CONFIG_SCRIPT}
+        """)
+        return cmd
+
+    def resources(self):
+        config = self.params.get('config')
+        mem = config.BP_RAWSTAT_MEMORY
+        file1 = self.params.get('file1')
+        if config.BP_DEREP_READS and not config.BP_STREAM_READS and os.path.isfile(file1):
+            # DerepPairs.py 的摘要数组与两个读库索引随 read 对数增长，按 R1 FASTQ 的大小估计
+            mem += os.path.getsize(file1) / 1024 ** 3 * config.BP_DEREP_MEMORY_PER_GB
+        return {"cpu": config.BP_USCMG_THREADS, "mem": mem}
+
+    def inputs(self):
+        return [self.params.get('file1'), self.params.get('file2')]
+
+    def outputs(self):
+        config = self.params.get('config')
+        id = self.params.get('id')
+        outdir = os.path.join(config.BP_OUTPUT_PATH, "00.DataStat", str(id))
+        outputs = list(read_store(config, id)) + [fa + ".idx" for fa in read_store(config, id)] + [
+            readstat_path(config, id),
+            os.path.join(outdir, f"{id}.16s.json"),
+            os.path.join(outdir, f"{id}.uscmg_1.dmd"),
+            os.path.join(outdir, f"{id}.uscmg_2.dmd"),
+            os.path.join(outdir, "meta_data_online.txt"),
+        ]
+        if config.BP_DEREP_READS and not config.BP_STREAM_READS:
+            outputs += [os.path.join(outdir, f"{id}.derep.json"), os.path.join(outdir, f"{id}.derep.sizes.tsv")]
+        return outputs
+
 
 class GeneAnno(BaseRunner):
     def build_command(self):
@@ -40,26 +186,104 @@ class GeneAnno(BaseRunner):
         geneType = self.params.get('geneType')
         
         genePath, geneDBDiamond, geneDB , geneStructure  = get_gene_path(geneType,config)
+        fa1, fa2 = read_store(config, id)
+        prefilter_cmd, (query1, query2), cleanup_cmd = prefilter_command(config, id, (fa1, fa2), seed_index(geneDBDiamond))
 
         cmd = textwrap.dedent(rf"""
         cd {config.BP_OUTPUT_PATH}; mkdir -p {genePath}/{id}; cd {genePath}/{id}
         # 链接统计文件
         #find {config.BP_OUTPUT_PATH}/00.DataStat/{id}/ -type f ! -name "*.fq" ! -name "*.fastaq" ! -name "*.fq.gz" ! -name "*.fastaq.gz" -exec ln -s {{}} ./ \;
         
-        # 功能基因比对
-        {config.BP_DIAMOND_SOFTWARE} -d {geneDBDiamond} -q {config.BP_OUTPUT_PATH}/00.DataStat/{id}/{id}_1.fa -o .//{id}_1.us -e 10 -p 40 -k 1 --id 60
-        {config.BP_DIAMOND_SOFTWARE} -d {geneDBDiamond} -q {config.BP_OUTPUT_PATH}/00.DataStat/{id}/{id}_2.fa -o .//{id}_2.us -e 10 -p 40 -k 1 --id 60
-        {config.BP_EXTREA_SOFTWARE} .//{id}_1.us {config.BP_OUTPUT_PATH}/00.DataStat/{id}/{id}_1.fa .//{id}.extract_1.fa
-        {config.BP_EXTREA_SOFTWARE} .//{id}_2.us {config.BP_OUTPUT_PATH}/00.DataStat/{id}/{id}_2.fa .//{id}.extract_2.fa
+        {prefilter_cmd}# 功能基因比对
+        {config.BP_DIAMOND_SOFTWARE} -d {geneDBDiamond} -q {query1} -o .//{id}_1.us -p {config.BP_DIAMOND_THREADS} -k 1 {diamond_thresholds(config)}
+        {config.BP_DIAMOND_SOFTWARE} -d {geneDBDiamond} -q {query2} -o .//{id}_2.us -p {config.BP_DIAMOND_THREADS} -k 1 {diamond_thresholds(config)}{cleanup_cmd}
+        #{config.BP_EXTREA_SOFTWARE} .//{id}_1.us {fa1} .//{id}.extract_1.fa
+        #{config.BP_EXTREA_SOFTWARE} .//{id}_2.us {fa2} .//{id}.extract_2.fa
         
         # 初步抽取基因
         #python3 {config.BP_MERGEFA_SOFTWARE} ./ ./ meta-data.txt .//meta_data_online.txt .//extracted.fa  {config.BP_USCMG_LIST} --config {config.CONFIG_SCRIPT}
         #python3 {config.BP_MERGEFA_SOFTWARE} --indir {config.BP_OUTPUT_PATH}/00.DataStat/{id} --outdir ./ --sample_id {id} --meta_data_out meta_data_online.txt --extracted_fasta extracted.fa  --coglist {config.BP_USCMG_LIST} --config {config.CONFIG_SCRIPT}
-        python3 {config.BIN_PATH}/BPTracer/MergeFastaRename.py  --outdir ./ --sample_id {id} --extracted_fasta extracted.fa
+        #python3 {config.BIN_PATH}/BPTracer/MergeFastaRename.py  --outdir ./ --sample_id {id} --extracted_fasta extracted.fa
+        # 按 S01 的读库索引直接抽取比对上的 reads，写出 extracted.fa 与 extracted.idmap（--one-pass 时另有 extracted.m8）
+        {config.BP_EXTRACT_HITS_SOFTWARE} --sample {id} --reads {fa1} {fa2} --hits-dir ./{extract_hits_option(config)}
+        """)
+        return cmd
+
+    def resources(self):
+        config = self.params.get('config')
+        return {"cpu": config.BP_DIAMOND_THREADS, "mem": config.BP_GENEANNO_MEMORY}
+
+    def inputs(self):
+        return list(read_store(self.params.get('config'), self.params.get('id')))
+
+    def outputs(self):
+        config = self.params.get('config')
+        id = self.params.get('id')
+        genePath, _, _, _ = get_gene_path(self.params.get('geneType'), config)
+        outputs = ["extracted.fa", "extracted.m8"] if config.BP_ONE_PASS else ["extracted.fa"]
+        return [os.path.join(config.BP_OUTPUT_PATH, genePath, str(id), name) for name in outputs]
+
+
+
+class GeneAnnoCombined(BaseRunner):
+    """
+    合并库模式（--combined-db）：每个样品只做一次 diamond 搜索。
+    R1、R2 经 TagMates.py 合并为一个查询（经命名管道送入 diamond，TagMates 失败时脚本失败），
+    比对 Gene-ALL.dmnd（含全部基因类型），再由 SplitGeneHits.py 按类型与两端拆分到 01.ARGs … 05.SGs，
+    最后由 ExtractHits.py 一次抽取全部类型的 reads。
+
+    每个 read 最多报告 BP_GENE_COMBINED_MAX_TARGETS 条比对：若得分更高的其他类型比对占满名额，
+    该 read 在较少见类型中的最佳比对会丢失，与逐库 -k 1 不同；设为 0 时报告全部比对，结果一致。
+    """
+    def build_command(self):
+        config = self.params.get('config')
+        id = self.params.get('id')
+        geneTypes = self.params.get('geneTypes')
+
+        fa1, fa2 = read_store(config, id)
+        genePaths = [get_gene_path(gtype, config)[0] for gtype in geneTypes]
+        type_options = " ".join(f"--type {gtype}:{genePath}" for gtype, genePath in zip(geneTypes, genePaths))
+        hits_dirs = " ".join(f"{config.BP_OUTPUT_PATH}/{genePath}/{id}" for genePath in genePaths)
+        prefilter_cmd, (query1, query2), cleanup_cmd = prefilter_command(
+            config, id, (fa1, fa2), seed_index(config.BP_GENE_COMBINED_DATABASE)
+        )
+
+        cmd = textwrap.dedent(rf"""
+        cd {config.BP_OUTPUT_PATH}; mkdir -p 00.DataStat/{id}; cd 00.DataStat/{id}
+
+        {prefilter_cmd}# 功能基因比对：两端 reads 一次搜索合并库
+        rm -f .//{id}.mates.fifo
+        mkfifo .//{id}.mates.fifo
+        python3 {config.BIN_PATH}/BPTracer/TagMates.py {query1} {query2} > .//{id}.mates.fifo &
+        tag_pid=$!
+        {config.BP_DIAMOND_SOFTWARE} -d {config.BP_GENE_COMBINED_DATABASE} -q .//{id}.mates.fifo -o .//{id}.genes.us -p {config.BP_DIAMOND_THREADS} -k {config.BP_GENE_COMBINED_MAX_TARGETS} {diamond_thresholds(config)} || {{ kill $tag_pid 2>/dev/null; exit 1; }}
+        wait $tag_pid || exit 1
+        rm -f .//{id}.mates.fifo{cleanup_cmd}
+        python3 {config.BIN_PATH}/BPTracer/SplitGeneHits.py -i .//{id}.genes.us --sample {id} --outdir {config.BP_OUTPUT_PATH} {type_options}
+
+        # 按读库索引一次抽取全部基因类型的 reads
+        {config.BP_EXTRACT_HITS_SOFTWARE} --sample {id} --reads {fa1} {fa2} --hits-dir {hits_dirs}{extract_hits_option(config)}
         """)
         return cmd
-    
-    
+
+    def resources(self):
+        config = self.params.get('config')
+        return {"cpu": config.BP_DIAMOND_THREADS, "mem": config.BP_GENEANNO_MEMORY}
+
+    def inputs(self):
+        return list(read_store(self.params.get('config'), self.params.get('id')))
+
+    def outputs(self):
+        config = self.params.get('config')
+        id = self.params.get('id')
+        outputs = ["extracted.fa", "extracted.m8"] if config.BP_ONE_PASS else ["extracted.fa"]
+        return [
+            os.path.join(config.BP_OUTPUT_PATH, get_gene_path(gtype, config)[0], str(id), name)
+            for gtype in self.params.get('geneTypes')
+            for name in outputs
+        ]
+
+
 def get_gene_path(geneType, config):
     if geneType == "ARGs":
         genePath = "01.ARGs"
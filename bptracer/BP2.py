@@ -2,9 +2,214 @@
 import subprocess
 import textwrap
 from bptracer.BaseRunner import BaseRunner
+from bptracer import hostResource
+from bptracer import aligner as aligners
 import os
+import math
+import hashlib
+from array import array
+import filecmp
+import numpy as np
 import pandas as pd
 import glob
+from concurrent.futures import ThreadPoolExecutor
+
+
+# 已并入 Final.* / OUT.* 结果表的样品清单（--append 模式据此判断新增样品）
+COHORT_SAMPLES = "Cohort.samples.list"
+
+
+def read_cohort_samples(final_extracted_path, geneType):
+    """
+    读取某基因类型目录下已并入结果表的样品 ID 集合。
+
+    旧版本生成的结果没有 Cohort.samples.list，此时从 OUT.{geneType}.ppm.txt
+    的表头（第 4 列起为样品列）推断；两者都不存在时返回空集合。
+    """
+    cohort_file = os.path.join(final_extracted_path, COHORT_SAMPLES)
+    if os.path.exists(cohort_file):
+        with open(cohort_file, "r") as f:
+            return {line.strip() for line in f if line.strip()}
+    ppm_table = os.path.join(final_extracted_path, f"OUT.{geneType}.ppm.txt")
+    if os.path.exists(ppm_table):
+        with open(ppm_table, "r") as f:
+            return set(f.readline().rstrip("\n").split("\t")[3:])
+    return set()
+
+
+def replace_if_changed(tmp_path, path):
+    """
+    用临时文件替换目标文件；内容相同时保留原文件及其修改时间，
+    使 --resume 不会因为重新生成了相同的分块而重跑 BLAST。
+    """
+    if os.path.exists(path) and filecmp.cmp(tmp_path, path, shallow=False):
+        os.remove(tmp_path)
+    else:
+        os.replace(tmp_path, path)
+
+
+def scan_fasta(path):
+    """
+    扫描一个 FASTA 文件中每条序列的位置与残基数（NumPy 向量化，可在多个线程中同时执行）。
+
+    返回:
+    - Tuple[np.ndarray, np.ndarray, int]: (各序列标题行的字节偏移, 各序列的残基数, 文件大小)。
+    """
+    data = np.fromfile(path, dtype=np.uint8)
+    if data.size == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), 0
+    ends = np.flatnonzero(data == ord("\n"))
+    if ends.size == 0 or ends[-1] != data.size - 1:
+        ends = np.append(ends, data.size)  # 最后一行没有换行
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    header = data[np.minimum(starts, data.size - 1)] == ord(">")
+    seq_length = np.where(header, 0, ends - starts)
+    first = np.flatnonzero(header)
+    if first.size == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), int(data.size)
+    return starts[first].astype(np.int64), np.add.reduceat(seq_length, first).astype(np.int64), int(data.size)
+
+
+def plan_chunks(residues, target):
+    """
+    按残基数把按顺序排列的序列切成连续的分块，各分块残基数尽量相等。
+
+    参数:
+    - residues (np.ndarray): 各序列的残基数。
+    - target (float): 每个分块的目标残基数。
+
+    返回:
+    - List[Tuple[int, int]]: 各分块的序列下标范围 [start, end)。
+    """
+    if residues.size == 0:
+        return []
+    total = int(residues.sum())
+    n_chunks = max(1, min(residues.size, math.ceil(total / target)))
+    # 在累计残基数跨过 total * k / n 的位置切分
+    cuts = np.searchsorted(np.cumsum(residues), total * np.arange(1, n_chunks) / n_chunks, side="left") + 1
+    bounds = np.unique(np.concatenate(([0], cuts, [residues.size])))
+    return list(zip(bounds[:-1].tolist(), bounds[1:].tolist()))
+
+
+def write_chunk(path, segments):
+    """
+    把若干文件的字节区间依次写入一个分块（先写 .tmp，内容不变时保留原文件）。
+
+    参数:
+    - path (str): 分块文件。
+    - segments (List[Tuple[str, int, int]]): (文件, 起始偏移, 结束偏移)。
+    """
+    with open(path + ".tmp", "wb") as out:
+        for filepath, start, end in segments:
+            with open(filepath, "rb") as f:
+                f.seek(start)
+                data = f.read(end - start)
+            out.write(data)
+            if data and not data.endswith(b"\n"):
+                out.write(b"\n")
+    replace_if_changed(path + ".tmp", path)
+
+
+def digest_fasta(path):
+    """
+    逐行读取一个 FASTA 文件，记录每条序列的位置、残基数与序列摘要，不在内存中保留序列本身。
+
+    返回:
+    - Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]: (各序列标题行的字节偏移, 各序列的结束偏移,
+      各序列的残基数, 各序列的 16 字节 blake2b 摘要)。
+    """
+    starts, ends, residues = array("q"), array("q"), array("q")
+    digests = bytearray()
+    h = None
+    length = offset = 0
+    with open(path, "rb") as f:
+        for line in f:
+            if line.startswith(b">"):
+                if h is not None:
+                    ends.append(offset)
+                    residues.append(length)
+                    digests += h.digest()
+                starts.append(offset)
+                h = hashlib.blake2b(digest_size=16)
+                length = 0
+            elif h is not None:
+                seq = line.rstrip(b"\n")
+                h.update(seq)
+                length += len(seq)
+            offset += len(line)
+    if h is not None:
+        ends.append(offset)
+        residues.append(length)
+        digests += h.digest()
+    return (np.array(starts, dtype=np.int64), np.array(ends, dtype=np.int64), np.array(residues, dtype=np.int64),
+            np.frombuffer(bytes(digests), dtype="V16"))
+
+
+def dedup_fasta(paths, workers):
+    """
+    跨样品查找完全相同的序列：按文件顺序，每种序列第一次出现的记录作为代表。
+
+    各文件在线程池中流式读取，每条序列只保留摘要与字节偏移（与 scan_fasta 相同的数组形式），
+    内存与序列总长度无关。
+
+    参数:
+    - paths (List[str]): 各样品的 extracted.fa，按顺序处理。
+    - workers (int): 并行读取文件的线程数。
+
+    返回:
+    - Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]: 按文件顺序排列的全部序列的
+      (所在文件下标, 标题行偏移, 结束偏移, 残基数, 代表序列的下标)；代表序列的代表为其自身。
+    """
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        scans = list(pool.map(digest_fasta, paths))
+    if not scans:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, empty, empty, empty
+    file_of = np.repeat(np.arange(len(scans)), [len(r) for _, _, r, _ in scans])
+    record_start, record_end, residues, digests = (np.concatenate(column) for column in zip(*scans))
+    if digests.size == 0:
+        return file_of, record_start, record_end, residues, np.empty(0, dtype=np.int64)
+    # return_index 为每种摘要第一次出现的位置
+    _, first, inverse = np.unique(digests, return_index=True, return_inverse=True)
+    return file_of, record_start, record_end, residues, first[inverse.ravel()]
+
+
+def write_dedup_map(path, fasta_files, file_of, rep_of):
+    """
+    再次流式读取含重复序列的文件，把每条重复序列写为一行 "代表 ID<TAB>ID"。
+
+    只在内存中保留有重复的代表序列的 ID。
+
+    参数:
+    - path (str): dedup.map。
+    - fasta_files (List[str]): dedup_fasta 的输入文件。
+    - file_of, rep_of (np.ndarray): dedup_fasta 返回的所在文件下标与代表下标。
+
+    返回:
+    - int: 重复序列数。
+    """
+    is_duplicate = rep_of != np.arange(rep_of.size)
+    has_duplicate = np.zeros(rep_of.size, dtype=bool)
+    has_duplicate[rep_of[is_duplicate]] = True
+    involved = set(np.unique(file_of[is_duplicate | has_duplicate]).tolist())
+    first_record = np.searchsorted(file_of, np.arange(len(fasta_files)))
+    rep_ids = {}
+    with open(path + ".tmp", "wb") as out:
+        for k, fasta_file in enumerate(fasta_files):
+            if k not in involved:
+                continue
+            i = int(first_record[k]) - 1
+            with open(fasta_file, "rb") as f:
+                for line in f:
+                    if not line.startswith(b">"):
+                        continue
+                    i += 1
+                    if has_duplicate[i]:
+                        rep_ids[i] = line[1:].split(None, 1)[0]
+                    elif is_duplicate[i]:
+                        out.write(rep_ids[rep_of[i]] + b"\t" + line[1:].split(None, 1)[0] + b"\n")
+    os.replace(path + ".tmp", path)
+    return int(is_duplicate.sum())
 
 
 def get_gene_path(geneType, config):
@@ -36,74 +241,148 @@ def get_gene_path(geneType, config):
         
 class ExtractedFaFiles(BaseRunner):
     def process_files(self):
+        """
+        把各样品的 extracted.fa 直接切分为残基数均衡的 BLAST 分块 temp.N.fa。
+
+        各文件在线程池中同时扫描；分块大小 = BP_BLAST_CHUNK_SECONDS × BP_BLAST_RESIDUES_PER_SECOND
+        × 线程数，再在全部分块间平均，使各分块的 BLAST 耗时接近；分块按字节区间从各样品文件直接写出，
+        不再生成合并的 Final.extracted.fa。
+
+        BP_BLAST_DEDUP 时跨样品去除完全相同的序列，每种序列只有一个代表进入分块（仍按字节区间写出），
+        代表与其他相同序列的 ID 写入 Final.dedup.map，由 CatBlastFiles 把比对结果展开回每条序列；
+        各文件流式读取，只保留每条序列的摘要与偏移。
+        参与的 extracted.fa 列表写入 Final.extracted.list，供过滤与丰度计算读取原始序列。
+
+        BP_ONE_PASS（--one-pass）时不分块：m8 列表直接为各样品 S02 写出的 extracted.m8。
+
+        append=True 时只处理 Cohort.samples.list 中尚未包含的样品：分块为 append.N.fa，
+        分块列表写入 Append.{geneType}.m8.list，新增样品写入 Append.samples.list.pending。
+        """
         config = self.params.get('config')
         geneType = self.params.get('geneType')
         thread = self.params.get('thread')
+        append = self.params.get('append', False)
         genePath, geneDB, geneStructure  = get_gene_path(geneType,config)
+        prefix, chunk_prefix = ("Append", "append") if append else ("Final", "temp")
         
         #config.SHELL_PATH
         #config.BP_OUTPUT_PATH
         #config.BP_BLAST_SOFTWARE
-        #config.BP_EXTRACTEDFA_WINDOW
         #config.BP_BLASTARG_DATABASE
         
         # 设定Gene种类以及输出路径
         final_extracted_path = os.path.join(config.BP_OUTPUT_PATH,genePath)
-        final_extracted_file = os.path.join(final_extracted_path,"Final.extracted.fa")
-        
-        # 合并所有 extracted.fa 文件.
-        with open(final_extracted_file, "w") as final_out:
-            for filepath in glob.glob(os.path.join(final_extracted_path, "**/extracted.fa"), recursive=True):
-                with open(filepath, "r") as infile:
-                    for line in infile:
-                        final_out.write(line)
-        print(f"所有{genePath}中的 extracted.fa 文件已合并到 {final_extracted_file}")
-        
-        
-        # 分割 Final.extracted.fa 文件
+
+        # 样品 ID 即 extracted.fa 所在目录名；append 模式跳过已并入结果表的样品
+        cohort_samples = read_cohort_samples(final_extracted_path, geneType) if append else set()
+        cohort_file = os.path.join(final_extracted_path, COHORT_SAMPLES)
+        if cohort_samples and not os.path.exists(cohort_file):
+            # 旧版本结果：先登记由结果表推断的样品，追加步骤只在其后补上新增样品
+            with open(cohort_file, "w") as f:
+                for sample in sorted(cohort_samples):
+                    f.write(sample + "\n")
+        extracted_files = [
+            (os.path.basename(os.path.dirname(filepath)), filepath)
+            for filepath in sorted(glob.glob(os.path.join(final_extracted_path, "**/extracted.fa"), recursive=True))
+        ]
+        extracted_files = [(sample, filepath) for sample, filepath in extracted_files if sample not in cohort_samples]
+        self.samples = [sample for sample, _ in extracted_files]
+        with open(os.path.join(final_extracted_path, f"{prefix}.samples.list.pending"), "w") as f:
+            for sample in self.samples:
+                f.write(sample + "\n")
+        if append:
+            print(f"{genePath} 已包含 {len(cohort_samples)} 个样品，本次追加 {len(self.samples)} 个样品")
+
+        with open(os.path.join(final_extracted_path, f"{prefix}.extracted.list"), "w") as f:
+            for _, filepath in extracted_files:
+                f.write(filepath + "\n")
+
+        self.final_extracted_path = final_extracted_path
+        if config.BP_ONE_PASS:
+            # 单遍模式：S02 的 diamond 已按最终阈值输出各样品的比对（extracted.m8），不再分块 BLAST
+            self.split_fa = []
+            self.split_m8 = [os.path.join(os.path.dirname(filepath), "extracted.m8") for _, filepath in extracted_files]
+            missing = [path for path in self.split_m8 if not os.path.exists(path)]
+            if missing:
+                raise FileNotFoundError(
+                    f"{missing[0]} 不存在：--one-pass 需要 BPtracer BP --one-pass 生成的 S02 比对结果"
+                )
+            # extracted.m8 在 extracted.fa 之后写出；更旧时为以前的运行留下的，编号与 extracted.fa 不对应
+            stale = [m8 for m8, (_, fa) in zip(self.split_m8, extracted_files)
+                     if os.path.getmtime(m8) < os.path.getmtime(fa)]
+            if stale:
+                raise RuntimeError(
+                    f"{stale[0]} 比 extracted.fa 旧：请用 BPtracer BP --one-pass 重新运行该样品的 S02"
+                )
+            self.file_counter = 0
+            print(f"{genePath}：单遍模式，直接使用 {len(self.split_m8)} 个样品 S02 的比对结果，跳过 BLAST 分块。")
+            self.write_m8_list(prefix)
+            return
+
+        # 按残基数切分：目标为单个分块 BLAST 约 BP_BLAST_CHUNK_SECONDS 秒
+        target = config.BP_BLAST_CHUNK_SECONDS * config.BP_BLAST_RESIDUES_PER_SECOND * max(1, int(thread))
+        workers = max(1, min(len(extracted_files), hostResource.detect_cores()))
         self.split_fa = []
         self.split_m8 = []
-        with open(final_extracted_file, "r") as infile:
-            sequence_counter = 0
-            file_counter = 0
-            split_file = None
-            
-            for line in infile:
-                if line.startswith(">"):  # 序列 ID
-                    if sequence_counter %  config.BP_EXTRACTEDFA_WINDOW == 0:
-                        # 关闭之前的分割文件
-                        if split_file:
-                            split_file.close()
-                        
-                        # 创建新的分割文件, 并将内容保存到全局变量中
-                        split_fa = os.path.join(final_extracted_path, f"temp.{file_counter}.fa")
-                        split_m8 = os.path.join(final_extracted_path, f"temp.{file_counter}.fa.m8")
-                        self.split_fa.append(split_fa)
-                        self.split_m8.append(split_m8)
-                        
-                        split_file = open(split_fa, "w")
-                        file_counter += 1
-                    sequence_counter += 1
-                split_file.write(line)
-            if split_file:
-                split_file.close()
-        print(f"文件已分割为 {file_counter} 个部分，每部分最多包含 {config.BP_EXTRACTEDFA_WINDOW} 序列。")
+        jobs = []
+
+        def add_chunk(content):
+            split_fa = os.path.join(final_extracted_path, f"{chunk_prefix}.{len(self.split_fa)}.fa")
+            self.split_fa.append(split_fa)
+            self.split_m8.append(split_fa + ".m8")
+            jobs.append((split_fa, content))
+
+        fasta_files = [filepath for _, filepath in extracted_files]
+        if config.BP_BLAST_DEDUP:
+            # 跨样品去重：分块只包含代表序列
+            file_of, record_start, record_end, residues, rep_of = dedup_fasta(fasta_files, workers)
+            selected = np.flatnonzero(rep_of == np.arange(rep_of.size))
+            dedup_map = os.path.join(final_extracted_path, f"{prefix}.dedup.map")
+            write_dedup_map(dedup_map, fasta_files, file_of, rep_of)
+            print(f"{rep_of.size} 条序列中有 {selected.size} 种不同的序列，只比对代表序列，对应关系见 {dedup_map}")
+        else:
+            # 并行扫描各样品的 extracted.fa：每条序列的字节偏移与残基数
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                scans = list(pool.map(scan_fasta, fasta_files))
+            residues = np.concatenate([r for _, r, _ in scans]) if scans else np.empty(0, dtype=np.int64)
+            file_of = np.repeat(np.arange(len(scans)), [len(r) for _, r, _ in scans])
+            record_start = np.concatenate([s for s, _, _ in scans]) if scans else np.empty(0, dtype=np.int64)
+            # 每条序列的结束偏移：同一文件中的下一条序列，或文件末尾
+            record_end = np.concatenate([np.append(s[1:], size) for s, _, size in scans]) if scans else record_start
+            selected = np.arange(residues.size)
+
+        residues = residues[selected]
+        chunks = plan_chunks(residues, target)
+        for first, last in chunks:
+            # 同一文件中连续的序列合并为一个字节区间
+            records = selected[first:last]
+            breaks = (np.flatnonzero((np.diff(file_of[records]) != 0) | (np.diff(records) != 1)) + 1).tolist()
+            add_chunk([
+                (fasta_files[file_of[records[a]]], int(record_start[records[a]]), int(record_end[records[b - 1]]))
+                for a, b in zip([0] + breaks, breaks + [len(records)])
+            ])
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(lambda job: write_chunk(*job), jobs))
+        file_counter = len(chunks)
+        if file_counter:
+            chunk_residues = [int(residues[first:last].sum()) for first, last in chunks]
+            print(f"{len(residues)} 条序列（{int(residues.sum())} 个残基）已分割为 {file_counter} 个分块，"
+                  f"每块 {min(chunk_residues)} - {max(chunk_residues)} 个残基。")
+        else:
+            print(f"{genePath} 中没有需要比对的序列。")
         
-        # 输出文件路径
-        output_file = os.path.join(final_extracted_path,f"Final.{geneType}.m8.list")
+        self.write_m8_list(prefix)
+        self.file_counter = file_counter
 
-        # 将路径逐行写入文件
+    def write_m8_list(self, prefix):
+        """把各 m8 文件路径逐行写入 {prefix}.{geneType}.m8.list，供 CatBlastFiles 合并。"""
+        geneType = self.params.get('geneType')
+        output_file = os.path.join(self.final_extracted_path, f"{prefix}.{geneType}.m8.list")
         with open(output_file, "w") as f:
             for path in self.split_m8:
                 f.write(path + "\n")
         print(f"所有 {geneType}.m8 文件路径已保存到 {output_file}")
-        
-        
-        
-        # 定义全局变量
-        self.final_extracted_path = final_extracted_path
-        self.final_extracted_file = final_extracted_file
-        self.file_counter = file_counter
     
     def build_command(self, index):
         """生成针对单个分割文件的命令。"""
@@ -116,12 +395,33 @@ class ExtractedFaFiles(BaseRunner):
         split_fa = self.split_fa[index]
         split_m8 = self.split_m8[index]
         #output_m8 = os.path.join(self.final_extracted_path, f"temp.{index}.fa.m8")
+        # 比对后端（BP_ALIGNER）：blastx、diamond 或 mmseqs，均输出 12 列 m8
+        aligner = aligners.get_aligner(config.BP_ALIGNER, config)
+        if config.BP_BLAST_CACHE:
+            # 缓存命中的序列直接取结果，只比对未命中的序列
+            max_gb = f" --max-gb {config.BP_BLAST_CACHE_MAX_GB}" if config.BP_BLAST_CACHE_MAX_GB else ""
+            blast = (f"{config.BP_BLAST_CACHE_SOFTWARE} run --cache {config.BP_BLAST_CACHE}{max_gb} "
+                     f"--db {aligner.database(geneDB)} -q {split_fa} -o {split_m8} -- "
+                     f"{aligner.command('{query}', '{out}', geneDB, thread)}")
+        else:
+            blast = aligner.command(split_fa, split_m8, geneDB, thread)
         cmd = textwrap.dedent(rf"""
         cd {self.final_extracted_path}
-        {config.BP_BLAST_SOFTWARE} -query {split_fa} -out {split_m8} -db {geneDB} -evalue 1e-7 -num_threads {thread} -outfmt 6 -max_target_seqs 1
+        {blast}
+        {aligner.postprocess(split_m8)}
         """).strip()
         return cmd
 
+    def resources(self, index):
+        config = self.params.get('config')
+        return {"cpu": self.params.get('thread'), "mem": aligners.get_aligner(config.BP_ALIGNER, config).memory()}
+
+    def inputs(self, index):
+        return [self.split_fa[index]]
+
+    def outputs(self, index):
+        return [self.split_m8[index]]
+
 
 
 #class CatBlastFiles(BaseRunner):
@@ -192,12 +492,15 @@ class CatBlastFiles(BaseRunner):
         """处理 m8 文件列表，检查路径有效性"""
         config = self.params.get('config')
         geneType = self.params.get('geneType')
+        append = self.params.get('append', False)
         genePath, geneDB, geneStructure = get_gene_path(geneType, config)
+        self.prefix = "Append" if append else "Final"
 
         # 初始化路径
         self.final_extracted_path = os.path.join(config.BP_OUTPUT_PATH, genePath)
         self.final_output_file = os.path.join(self.final_extracted_path, f"Final.{geneType}.blast.m8")
-        self.output_m8_list_path = os.path.join(self.final_extracted_path, f"Final.{geneType}.m8.list")
+        self.batch_output_file = os.path.join(self.final_extracted_path, f"{self.prefix}.{geneType}.blast.m8")
+        self.output_m8_list_path = os.path.join(self.final_extracted_path, f"{self.prefix}.{geneType}.m8.list")
         self.script_path = os.path.join(config.SHELL_PATH, f"S04.{geneType}_merge.sh")
 
         # 读取 m8 文件列表
@@ -206,8 +509,14 @@ class CatBlastFiles(BaseRunner):
         except Exception as e:
             raise FileNotFoundError(f"无法读取 {self.output_m8_list_path} 文件: {e}")
 
-        # 获取所有路径
+        # 获取所有路径；查询序列为参与本次比对的各样品 extracted.fa
         self.m8_paths = m8_list[0].tolist()
+        with open(os.path.join(self.final_extracted_path, f"{self.prefix}.extracted.list"), "r") as f:
+            self.fa_paths = [line.strip() for line in f if line.strip()]
+        # 跨样品去重时分块只含代表序列，合并时按 dedup.map 展开回每条序列；
+        # 单遍模式直接合并各样品 S02 的比对，没有去重
+        self.dedup_map = os.path.join(self.final_extracted_path, f"{self.prefix}.dedup.map") \
+            if config.BP_BLAST_DEDUP and not config.BP_ONE_PASS else None
 
         ## 检查路径有效性
         #for path in self.m8_paths:
@@ -225,15 +534,14 @@ class CatBlastFiles(BaseRunner):
         if not hasattr(self, 'm8_paths') or not self.m8_paths:
             raise RuntimeError("process_files 方法尚未执行，无法生成命令。")
 
-        # 合并命令列表
-        cmd = [f"cd {self.final_extracted_path}"]
+        if self.params.get('append', False):
+            return self.build_append_command()
+
+        # 合并命令列表；任一步失败即退出，避免把样品登记为已并入
+        cmd = ["set -e", f"cd {self.final_extracted_path}"]
 
         # 合并 m8 文件的命令
-        for idx, m8_path in enumerate(self.m8_paths):
-            if idx == 0:  # 第一个文件，使用 >
-                cmd.append(f"cat {m8_path} > {self.final_output_file}")
-            else:  # 其余文件，使用 >>
-                cmd.append(f"cat {m8_path} >> {self.final_output_file}")
+        cmd += self.merge_m8_command(self.final_output_file)
 
         # 添加后续 Python 脚本命令
         cmd.append(textwrap.dedent(rf"""
@@ -251,7 +559,7 @@ class CatBlastFiles(BaseRunner):
         # -l: 过滤阈值（最小长度）
         # -id: 过滤阈值（最小相似度）
         # -e: 过滤阈值（最大 E 值）
-        python3 {config.BIN_PATH}/BPTracer/FilterFasta.py  -m8 {self.final_extracted_path}/Final.{geneType}.blast.m8 -fa {self.final_extracted_path}/Final.extracted.fa -o_m8 {self.final_extracted_path}/Final.{geneType}.blast.m8.fil -o_fa {self.final_extracted_path}/Final.extracted.fa.fil  -l {config.BP_LENGTH_THRESHOLD} -id {config.BP_IDENTITY_THRESHOLD} -e {config.BP_EVALUE_THRESHOLD}
+        python3 {config.BIN_PATH}/BPTracer/FilterFasta.py  -m8 {self.final_extracted_path}/Final.{geneType}.blast.m8 -fa {" ".join(self.fa_paths)} -o_m8 {self.final_extracted_path}/Final.{geneType}.blast.m8.fil -o_fa {self.final_extracted_path}/Final.extracted.fa.fil  -l {config.BP_LENGTH_THRESHOLD} -id {config.BP_IDENTITY_THRESHOLD} -e {config.BP_EVALUE_THRESHOLD}
         """).strip())
 
         cmd.append(textwrap.dedent(rf"""
@@ -266,6 +574,7 @@ class CatBlastFiles(BaseRunner):
         # -l: 过滤阈值（最小长度）
         # -id: 过滤阈值（最小相似度）
         # -e: 过滤阈值（最大 E 值）
+        # -fa: 查询序列（Final.extracted.list 中各样品的 extracted.fa），标题行的 SZ:i:N（BP --derep）为比对权重
         python3 {config.BIN_PATH}/BPTracer/GeneAbundance.py \
             -i {self.final_output_file} \
             -m Final.meta_data_online.txt \
@@ -275,10 +584,95 @@ class CatBlastFiles(BaseRunner):
             -o {self.final_extracted_path} \
             -l {config.BP_LENGTH_THRESHOLD} \
             -id {config.BP_IDENTITY_THRESHOLD} \
-            -e   {config.BP_EVALUE_THRESHOLD}
+            -e   {config.BP_EVALUE_THRESHOLD} \
+            -fa {" ".join(self.fa_paths)}
         """).strip())
         
         cmd.append(textwrap.dedent(rf"""
+        # TaxSource
+        python3 {config.BIN_PATH}/BPTracer/GeneAddTax.py  {config.BP_TAX_DATABASE} {self.final_extracted_path}/OUT.{geneType}.ppm.txt  {self.final_extracted_path}/Tax.{geneType}.ppm.txt
+        """).strip())
+        cmd.append(self.summary_command())
+
+        # 记录已并入结果表的样品，供后续 --append 使用
+        cmd.append(f"mv {self.final_extracted_path}/Final.samples.list.pending {self.final_extracted_path}/{COHORT_SAMPLES}")
+        return cmd
+
+    def build_append_command(self):
+        """
+        生成 --append 模式的合并命令：只统计新增样品，再把新列并入已有结果表。
+
+        新增样品的 BLAST 结果与过滤结果追加到 Final.* 文件末尾；全部步骤成功后
+        才把新增样品写入 Cohort.samples.list，失败时可直接重新执行。
+        """
+        config = self.params.get('config')
+        geneType = self.params.get('geneType')
+        genePath, geneDB, geneStructure = get_gene_path(geneType, config)
+        path = self.final_extracted_path
+
+        cmd = ["set -e", f"cd {path}"]
+        cmd += self.merge_m8_command(self.batch_output_file)
+
+        cmd.append(textwrap.dedent(rf"""
+        # 合并元数据（每个样品一行，开销很小）
+        python3 {config.BIN_PATH}/BPTracer/MergeMeta.py -p {config.BP_OUTPUT_PATH}/00.DataStat -n meta_data_online.txt  -o Final.meta_data_online.txt
+
+        # 只过滤新增样品的比对结果与序列
+        python3 {config.BIN_PATH}/BPTracer/FilterFasta.py  -m8 {self.batch_output_file} -fa {" ".join(self.fa_paths)} -o_m8 {path}/Append.{geneType}.blast.m8.fil -o_fa {path}/Append.extracted.fa.fil  -l {config.BP_LENGTH_THRESHOLD} -id {config.BP_IDENTITY_THRESHOLD} -e {config.BP_EVALUE_THRESHOLD}
+
+        # 只计算新增样品的丰度
+        # --samples: 限定写入结果表的样品列表
+        python3 {config.BIN_PATH}/BPTracer/GeneAbundance.py \
+            -i {self.batch_output_file} \
+            -m Final.meta_data_online.txt \
+            -p Append.{geneType} \
+            -db {geneDB} \
+            -s {geneStructure} \
+            -o {path} \
+            -l {config.BP_LENGTH_THRESHOLD} \
+            -id {config.BP_IDENTITY_THRESHOLD} \
+            -e   {config.BP_EVALUE_THRESHOLD} \
+            -fa {" ".join(self.fa_paths)} \
+            --samples {path}/Append.samples.list.pending
+        python3 {config.BIN_PATH}/BPTracer/GeneAddTax.py  {config.BP_TAX_DATABASE} {path}/Append.{geneType}.ppm.txt  {path}/Tax.Append.{geneType}.ppm.txt
+
+        # 把新增样品的列并入已有结果表
+        # -k: 行键列数（OUT.* 为 Gene/Subtype/Type，Tax.* 另含 Species/TaxID/Taxonomy/Lineage）
+        python3 {config.BIN_PATH}/BPTracer/MergeAbundance.py -i {path}/OUT.{geneType}.ppm.txt -a {path}/Append.{geneType}.ppm.txt -k 3
+        python3 {config.BIN_PATH}/BPTracer/MergeAbundance.py -i {path}/OUT.{geneType}.16s.txt -a {path}/Append.{geneType}.16s.txt -k 3
+        python3 {config.BIN_PATH}/BPTracer/MergeAbundance.py -i {path}/OUT.{geneType}.cell_number.txt -a {path}/Append.{geneType}.cell_number.txt -k 3
+        python3 {config.BIN_PATH}/BPTracer/MergeAbundance.py -i {path}/Tax.{geneType}.ppm.txt -a {path}/Tax.Append.{geneType}.ppm.txt -k 7
+        """).strip())
+        cmd.append(self.summary_command())
+
+        cmd.append(textwrap.dedent(rf"""
+        # 追加到 Final.* 文件并登记新增样品
+        cat {self.batch_output_file} >> {self.final_output_file}
+        cat {path}/Append.{geneType}.blast.m8.fil >> {path}/Final.{geneType}.blast.m8.fil
+        cat {path}/Append.extracted.fa.fil >> {path}/Final.extracted.fa.fil
+        cat {path}/Append.samples.list.pending >> {path}/{COHORT_SAMPLES}
+        """).strip())
+        return cmd
+
+    def merge_m8_command(self, output_file):
+        """合并各分块的 m8；去重时由 ExpandHits.py 把代表序列的比对展开到全部相同的序列。"""
+        config = self.params.get('config')
+        if self.dedup_map:
+            return [f"python3 {config.BIN_PATH}/BPTracer/ExpandHits.py --map {self.dedup_map} -o {output_file} "
+                    f"{' '.join(self.m8_paths)}"]
+        cmd = []
+        for idx, m8_path in enumerate(self.m8_paths):
+            if idx == 0:  # 第一个文件，使用 >
+                cmd.append(f"cat {m8_path} > {output_file}")
+            else:  # 其余文件，使用 >>
+                cmd.append(f"cat {m8_path} >> {output_file}")
+        return cmd
+
+    def summary_command(self):
+        """由 OUT.* / Tax.* 丰度表生成 Type、Subtype 与各分类层级的汇总表。"""
+        config = self.params.get('config')
+        geneType = self.params.get('geneType')
+        return textwrap.dedent(rf"""
         # ppm
         python3 {config.BIN_PATH}/BPTracer/GenerateSubTable.py --input  {self.final_extracted_path}/OUT.{geneType}.ppm.txt --output  {self.final_extracted_path}/OUT.{geneType}.ppm.Type.txt --group_by Type
         python3 {config.BIN_PATH}/BPTracer/GenerateSubTable.py --input  {self.final_extracted_path}/OUT.{geneType}.ppm.txt --output  {self.final_extracted_path}/OUT.{geneType}.ppm.Subtype.txt --group_by Subtype
@@ -288,11 +682,190 @@ class CatBlastFiles(BaseRunner):
         # cellNumber
         python3 {config.BIN_PATH}/BPTracer/GenerateSubTable.py --input  {self.final_extracted_path}/OUT.{geneType}.cell_number.txt --output  {self.final_extracted_path}/OUT.{geneType}.cell_number.Type.txt --group_by Type
         python3 {config.BIN_PATH}/BPTracer/GenerateSubTable.py --input  {self.final_extracted_path}/OUT.{geneType}.cell_number.txt --output  {self.final_extracted_path}/OUT.{geneType}.cell_number.Subtype.txt --group_by Subtype
-        
+
         # TaxSource
-        python3 {config.BIN_PATH}/BPTracer/GeneAddTax.py  {config.BP_TAX_DATABASE} {self.final_extracted_path}/OUT.{geneType}.ppm.txt  {self.final_extracted_path}/Tax.{geneType}.ppm.txt
         python3 {config.BIN_PATH}/BPTracer/GenerateTaxTable.py  -i {self.final_extracted_path}/Tax.{geneType}.ppm.txt -p Tax.{geneType}
+        """).strip()
+
+    def resources(self):
+        config = self.params.get('config')
+        return {"cpu": 1, "mem": config.BP_MERGE_MEMORY}
+
+    def inputs(self):
+        return self.m8_paths + self.fa_paths + ([self.dedup_map] if self.dedup_map else [])
+
+    def outputs(self):
+        geneType = self.params.get('geneType')
+        if self.params.get('append', False):
+            # 追加模式直接更新已有结果表，不参与 --resume 判断
+            return []
+        return [self.final_output_file] + [
+            os.path.join(self.final_extracted_path, name) for name in (
+                f"OUT.{geneType}.ppm.txt",
+                f"OUT.{geneType}.16s.txt",
+                f"OUT.{geneType}.cell_number.txt",
+                f"Tax.{geneType}.ppm.txt",
+            )
+        ]
+
+
+# BPtracer concordance 的输出目录（位于各基因类型目录下）
+CONCORDANCE_DIR = "Concordance"
+
+
+class ConcordanceAlign(BaseRunner):
+    """
+    BPtracer concordance：用一个比对后端重新比对已有的 BP2 分块，并按 S04 的方式计算丰度。
+
+    结果写入 {基因类型目录}/Concordance/{后端}/：合并后的 {geneType}.blast.m8、
+    OUT.{geneType}.*.txt，以及记录比对开始与结束时间的 align.time。
+    """
+
+    def process_files(self):
+        """读取 BP2 生成的分块列表，选出参与比较的分块。"""
+        config = self.params.get('config')
+        geneType = self.params.get('geneType')
+        genePath, _, _ = get_gene_path(geneType, config)
+        self.final_extracted_path = os.path.join(config.BP_OUTPUT_PATH, genePath)
+        self.output_path = os.path.join(self.final_extracted_path, CONCORDANCE_DIR, self.params.get('aligner'))
+
+        m8_list = os.path.join(self.final_extracted_path, f"Final.{geneType}.m8.list")
+        if not os.path.exists(m8_list):
+            raise FileNotFoundError(f"{m8_list} 不存在，请先运行 BPtracer BP2 生成分块")
+        with open(m8_list, "r") as f:
+            split_fa = [line.strip()[:-len(".m8")] for line in f if line.strip()]
+        chunks = self.params.get('chunks')
+        missing = [i for i in chunks if not 0 <= i < len(split_fa)]
+        if missing:
+            raise ValueError(f"{geneType} 只有 {len(split_fa)} 个分块，没有分块 {missing}")
+        self.split_fa = [split_fa[i] for i in chunks]
+        self.split_m8 = [os.path.join(self.output_path, os.path.basename(fa) + ".m8") for fa in self.split_fa]
+        with open(os.path.join(self.final_extracted_path, "Final.extracted.list"), "r") as f:
+            self.fa_paths = [line.strip() for line in f if line.strip()]
+        dedup_map = os.path.join(self.final_extracted_path, "Final.dedup.map")
+        self.dedup_map = dedup_map if os.path.exists(dedup_map) else None
+        self.merged_m8 = os.path.join(self.output_path, f"{geneType}.blast.m8")
+
+    def build_command(self):
+        config = self.params.get('config')
+        geneType = self.params.get('geneType')
+        thread = self.params.get('thread')
+        _, geneDB, geneStructure = get_gene_path(geneType, config)
+        aligner = aligners.get_aligner(self.params.get('aligner'), config)
+
+        cmd = [f"mkdir -p {self.output_path}", f"cd {self.output_path}", "date +%s.%N > align.time"]
+        for fa, m8 in zip(self.split_fa, self.split_m8):
+            cmd.append(aligner.command(fa, m8, geneDB, thread))
+            if aligner.postprocess(m8):
+                cmd.append(aligner.postprocess(m8))
+        cmd.append("date +%s.%N >> align.time")
+        if self.dedup_map:
+            cmd.append(f"python3 {config.BIN_PATH}/BPTracer/ExpandHits.py --map {self.dedup_map} -o {self.merged_m8} "
+                       f"{' '.join(self.split_m8)}")
+        else:
+            cmd.append(f"cat {' '.join(self.split_m8)} > {self.merged_m8}")
+        cmd.append(textwrap.dedent(rf"""
+        python3 {config.BIN_PATH}/BPTracer/MergeMeta.py -p {config.BP_OUTPUT_PATH}/00.DataStat -n meta_data_online.txt  -o Concordance.meta_data_online.txt
+        python3 {config.BIN_PATH}/BPTracer/GeneAbundance.py \
+            -i {self.merged_m8} \
+            -m Concordance.meta_data_online.txt \
+            -p OUT.{geneType} \
+            -db {geneDB} \
+            -s {geneStructure} \
+            -o {self.output_path} \
+            -l {config.BP_LENGTH_THRESHOLD} \
+            -id {config.BP_IDENTITY_THRESHOLD} \
+            -e   {config.BP_EVALUE_THRESHOLD} \
+            -fa {" ".join(self.fa_paths)}
         """).strip())
-                
         return cmd
 
+    def resources(self):
+        config = self.params.get('config')
+        memory = aligners.get_aligner(self.params.get('aligner'), config).memory()
+        return {"cpu": self.params.get('thread'), "mem": max(memory, config.BP_MERGE_MEMORY)}
+
+    def inputs(self):
+        return self.split_fa + self.fa_paths
+
+    def outputs(self):
+        geneType = self.params.get('geneType')
+        return [self.merged_m8, os.path.join(self.output_path, f"OUT.{geneType}.ppm.txt")]
+
+
+class ConcordanceCompare(BaseRunner):
+    """
+    BPtracer concordance：比较两个后端的丰度与最佳比对，
+    写出 Concordance/{geneType}.{A}.vs.{B}.tsv（每个基因的 ppm 差值）及同名 .json 汇总。
+    """
+
+    def report_file(self):
+        runs = self.params.get('runs')
+        names = [run.params.get('aligner') for run in runs]
+        return os.path.join(runs[0].final_extracted_path, CONCORDANCE_DIR,
+                            f"{self.params.get('geneType')}.{names[0]}.vs.{names[1]}.tsv")
+
+    def build_command(self):
+        config = self.params.get('config')
+        geneType = self.params.get('geneType')
+        runs = self.params.get('runs')  # 两个 ConcordanceAlign
+        names = [run.params.get('aligner') for run in runs]
+        return textwrap.dedent(rf"""
+        python3 {config.BIN_PATH}/BPTracer/CompareAbundance.py \
+            --names {" ".join(names)} \
+            --ppm {" ".join(os.path.join(run.output_path, f"OUT.{geneType}.ppm.txt") for run in runs)} \
+            --m8 {" ".join(run.merged_m8 for run in runs)} \
+            --time {" ".join(os.path.join(run.output_path, "align.time") for run in runs)} \
+            -o {self.report_file()}
+        """).strip()
+
+    def inputs(self):
+        return [path for run in self.params.get('runs') for path in run.outputs()]
+
+    def outputs(self):
+        return [self.report_file()]
+
+
+class BP2Runner(BaseRunner):
+    """
+    BPtracer all 中的 BP2 任务。
+
+    BP2 的分块数取决于各样品 S02 产出的 extracted.fa，生成依赖图时尚不可知，
+    因此整个 BP2 作为一个任务：在 BP S02 全部完成后调用 BPtracer BP2 --auto-run，
+    由其生成并执行 S03/S04 脚本，所用核数与内存限定在本任务声明的资源之内。
+    """
+
+    def build_command(self):
+        config = self.params.get('config')
+        fqlist = os.path.realpath(self.params.get('fqlist'))
+        gene_types = self.params.get('gene_types')
+        options = " ".join(self.params.get('options', []))
+
+        cmd = textwrap.dedent(rf"""
+        python3 {config.MAIN_SCRIPT} BP2 --file {fqlist} --pwd {config.OUTPUT_PATH} --GeneType {','.join(gene_types)} --thread {self.params.get('thread')} --print {self.params.get('print', 'F')} --auto-run --cores {config.ALL_BP2_CORES} --mem {config.ALL_BP2_MEMORY} {options}
+        """)
+        return cmd
+
+    def resources(self):
+        config = self.params.get('config')
+        return {"cpu": config.ALL_BP2_CORES, "mem": config.ALL_BP2_MEMORY}
+
+    def inputs(self):
+        config = self.params.get('config')
+        return [
+            os.path.join(config.BP_OUTPUT_PATH, get_gene_path(geneType, config)[0], str(id), "extracted.fa")
+            for geneType in self.params.get('gene_types')
+            for id in self.params.get('samples')
+        ]
+
+    def outputs(self):
+        config = self.params.get('config')
+        outputs = []
+        for geneType in self.params.get('gene_types'):
+            final_extracted_path = os.path.join(config.BP_OUTPUT_PATH, get_gene_path(geneType, config)[0])
+            outputs += [
+                os.path.join(final_extracted_path, f"Final.{geneType}.blast.m8"),
+                os.path.join(final_extracted_path, f"OUT.{geneType}.ppm.txt"),
+                os.path.join(final_extracted_path, f"Tax.{geneType}.ppm.txt"),
+            ]
+        return outputs
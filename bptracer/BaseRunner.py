@@ -1,8 +1,13 @@
 import os
+import asyncio
 import subprocess
 from typing import List, Dict
 from concurrent.futures import ThreadPoolExecutor
 
+from bptracer import manifest
+from bptracer import metrics
+from bptracer.asyncExecutor import AsyncExecutor, log_path
+
 
 class BaseRunner:
     """
@@ -46,6 +51,43 @@ class BaseRunner:
         """
         raise NotImplementedError("Subclasses should implement this method.")
 
+    def resources(self, **kwargs) -> Dict[str, float]:
+        """
+        声明该任务运行所需的资源，供 --auto-run 调度器按主机预算打包任务。
+
+        参数:
+        - **kwargs: 动态参数，与 build_command 相同。
+
+        返回:
+        - Dict[str, float]: {"cpu": CPU 核数, "mem": 内存 GB}。
+          默认单核、1 GB，子类应按实际命令中的线程数与内存占用覆盖。
+        """
+        return {"cpu": 1, "mem": 1}
+
+    def inputs(self, **kwargs) -> List[str]:
+        """
+        声明该任务读取的输入文件，写入脚本清单供 --resume 判断是否需要重跑。
+
+        参数:
+        - **kwargs: 动态参数，与 build_command 相同。
+
+        返回:
+        - List[str]: 输入文件路径列表，默认为空。
+        """
+        return []
+
+    def outputs(self, **kwargs) -> List[str]:
+        """
+        声明该任务产出的输出文件（哨兵文件），全部存在且不早于输入时可跳过该任务。
+
+        参数:
+        - **kwargs: 动态参数，与 build_command 相同。
+
+        返回:
+        - List[str]: 输出文件路径列表，默认为空（即总是重跑）。
+        """
+        return []
+
     def print_command(self, should_print=False, **kwargs):
             """
             打印生成的命令或脚本内容，便于调试。
@@ -77,15 +119,27 @@ class BaseRunner:
         参数:
         - script_path (str): 脚本文件的保存路径。
         - **kwargs: 动态参数，传递给 build_command。
+
+        同时在脚本旁写入清单 <script>.manifest.json，记录输入、输出、命令哈希与配置哈希。
+        配置中 METRICS_ENABLED 为 True（--metrics）时，每条命令套上运行统计（见 metrics 模块）。
         """
         self.script_path = script_path
         cmd = self.build_command(**kwargs)
+        text = "\n".join(cmd) if isinstance(cmd, list) else cmd
+        config = self.params.get('config')
+        if getattr(config, "METRICS_ENABLED", False):
+            sample = self.params.get('id')
+            text = metrics.instrument(text, script_path, config, sample=sample if isinstance(sample, str) else None)
 
         with open(script_path, "w", encoding="utf-8") as script_file:
-            if isinstance(cmd, list):
-                script_file.write("\n".join(cmd) + "\n")
-            else:
-                script_file.write(cmd + "\n")
+            script_file.write(text + "\n")
+        manifest.write_manifest(
+            script_path,
+            inputs=self.inputs(**kwargs),
+            outputs=self.outputs(**kwargs),
+            command=text,
+            config=config,
+        )
         print(f"Script written to: {script_path}")
 
     def run_command(self, **kwargs):
@@ -99,7 +153,8 @@ class BaseRunner:
             if not os.path.exists(self.script_path):
                 raise FileNotFoundError(f"Script file not found: {self.script_path}")
             print(f"Executing script: {self.script_path}")
-            subprocess.run(f"bash {self.script_path}", shell=True, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+            if not self.run_script(self.script_path):
+                raise RuntimeError(f"Script execution failed: {self.script_path}")
         else:  # 直接执行命令
             cmd = self.build_command(**kwargs)
             if isinstance(cmd, list):
@@ -110,20 +165,19 @@ class BaseRunner:
 
     def _run_single_command(self, cmd: str):
         """
-        执行单条命令并处理其输出。
+        执行单条命令，输出直接写到当前终端，不在内存中缓存。
 
         参数:
         - cmd (str): 待执行的命令。
         """
         if not cmd:
             raise ValueError("build_command did not return a valid command!")
-        result = subprocess.run(cmd, shell=True, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-        if result.returncode == 0:
+        try:
+            subprocess.run(cmd, shell=True, check=True)
             print(f"Command executed successfully: {cmd}")
-        else:
+        except subprocess.CalledProcessError:
             print(f"Command execution failed: {cmd}")
-            print(f"Standard Output: {result.stdout}")
-            print(f"Standard Error: {result.stderr}")
+            raise
 
     def run_scripts_parallel_bak(self, script_paths: List[str], script_params: List[Dict], max_workers: int = 3):
         """
@@ -147,27 +201,40 @@ class BaseRunner:
         with ThreadPoolExecutor(max_workers=max_workers) as executor:
             executor.map(lambda args: _generate_and_run(*args), zip(script_paths, script_params))
         
+    def run_script(self, script_path: str) -> bool:
+        """
+        执行单个已生成的脚本文件，stdout 与 stderr 写入 <shell>/logs/<script>.log。
+
+        参数:
+        - script_path (str): 脚本文件路径。
+
+        返回:
+        - bool: 脚本是否执行成功。
+        """
+        log_file = log_path(script_path)
+        try:
+            os.makedirs(os.path.dirname(log_file), exist_ok=True)
+            print(f"Running script: {script_path} (log: {log_file})")
+            with open(log_file, "wb") as log:
+                result = subprocess.run(["bash", script_path], stdin=subprocess.DEVNULL, stdout=log, stderr=subprocess.STDOUT)
+            if result.returncode == 0:
+                print(f"Successfully executed script: {script_path}")
+                return True
+            print(f"Script execution failed: {script_path}, see {log_file}")
+        except Exception as e:
+            print(f"Error executing script {script_path}: {e}")
+        return False
+
     def run_scripts_parallel(self, script_paths: List[str], max_workers: int = 3):
         """
-        并行运行已生成的脚本文件。
+        并行运行已生成的脚本文件（AsyncExecutor），输出写入各自的日志文件。
 
         参数:
         - script_paths (List[str]): 已生成的脚本路径列表。
-        - max_workers (int): 最大并行线程数，默认为 3。
-        """
-        def _run_script(script_path):
-            try:
-                print(f"Running script: {script_path}")
-                command = f"bash {script_path}"
-                result = subprocess.run(command, shell=True, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-                if result.returncode == 0:
-                    print(f"Successfully executed script: {script_path}")
-                else:
-                    print(f"Script execution failed: {script_path}")
-                    print(f"Standard Output: {result.stdout}")
-                    print(f"Standard Error: {result.stderr}")
-            except Exception as e:
-                print(f"Error executing script {script_path}: {e}")
+        - max_workers (int): 最大并行脚本数，默认为 3。
 
-        with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            executor.map(_run_script, script_paths)
+        返回:
+        - Dict[str, bool]: 脚本 -> 是否执行成功。
+        """
+        executor = AsyncExecutor(max_workers=max_workers)
+        return asyncio.run(executor.run_all(script_paths))
@@ -13,11 +13,28 @@ class HGTRunner(BaseRunner):
         cmd = textwrap.dedent(rf"""
         cd {config.HGT_OUTPUT_PATH}; mkdir -p {id}; cd {id}
         # Homology-based search with  waafle_search
-        python {config.BIN_PATH}/WAAFLE/waafle/waafle_search.py {file1} {config.BP_HGT_DATABASE}  --threads 60 --out {id}.blastout
+        python {config.BIN_PATH}/WAAFLE/waafle/waafle_search.py {file1} {config.BP_HGT_DATABASE}  --threads {config.HGT_THREADS} --out {id}.blastout
         # Gene calling with waafle_genecaller
         python {config.BIN_PATH}/WAAFLE/waafle/waafle_genecaller.py {id}.blastout
         # Identify candidate LGT events with waafle_orgscorer
         python {config.BIN_PATH}/WAAFLE/waafle/waafle_orgscorer.py {file1}  {id}.blastout {id}.gff {config.BP_HGT_STRUCTURE}
         # rm {id}.blastout {id}.gff
         """)
-        return cmd
\ No newline at end of file
+        return cmd
+
+    def resources(self):
+        config = self.params.get('config')
+        return {"cpu": config.HGT_THREADS, "mem": config.HGT_MEMORY}
+
+    def inputs(self):
+        return [self.params.get('file1')]
+
+    def outputs(self):
+        config = self.params.get('config')
+        id = self.params.get('id')
+        # waafle_orgscorer 以 contig 文件名第一个 "." 之前的部分作为输出前缀
+        basename = os.path.basename(self.params.get('file1')).split(".")[0]
+        return [
+            os.path.join(config.HGT_OUTPUT_PATH, str(id), f"{id}.blastout"),
+            os.path.join(config.HGT_OUTPUT_PATH, str(id), f"{basename}.lgt.tsv"),
+        ]
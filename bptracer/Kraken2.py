@@ -9,6 +9,16 @@ class FastqStatRunner(BaseRunner):
         fqName = self.params.get('fqlist')   
         fqlist = os.path.realpath(fqName)
         statpath = os.path.join(config.OUTPUT_PATH,"FastqStat")
+        stats = self.params.get('stats')
+        if stats:
+            # BPtracer all：直接汇总 BP S01 解压时写出的 readstat.json，不再扫描 FASTQ
+            cmd = textwrap.dedent(rf"""
+            mkdir -p {statpath}
+            cd {statpath}
+            python3 {config.BIN_PATH}/BPTracer/ReadStat.py -i {' '.join(stats)} -o stat.main.xls
+            python {config.Kraken2_MAPPING_SOFTWARE}/mybin/ProcessStat.py
+            """)
+            return cmd
         cmd = textwrap.dedent(rf"""
         mkdir -p {statpath}
         cd {statpath}
@@ -16,6 +26,20 @@ class FastqStatRunner(BaseRunner):
         python {config.Kraken2_MAPPING_SOFTWARE}/mybin/ProcessStat.py
         """)
         return cmd
+
+    def resources(self):
+        config = self.params.get('config')
+        if self.params.get('stats'):
+            return {"cpu": 1, "mem": 1}
+        return {"cpu": 1, "mem": config.FASTQSTAT_MEMORY}
+
+    def inputs(self):
+        return self.params.get('stats') or [os.path.realpath(self.params.get('fqlist'))]
+
+    def outputs(self):
+        config = self.params.get('config')
+        statpath = os.path.join(config.OUTPUT_PATH, "FastqStat")
+        return [os.path.join(statpath, "stat.main.xls"), os.path.join(statpath, "stat.main.sample.xls")]
                               
 
 class Kraken2Runner(BaseRunner):
@@ -25,11 +49,20 @@ class Kraken2Runner(BaseRunner):
         id = self.params.get('id')
         file1 = self.params.get('file1')
         file2 = self.params.get('file2')
-
+        # 输入为 BP S01 解压出的 FASTA 时（BPtracer all）不加 --gzip-compressed
+        compressed = "--gzip-compressed " if self.params.get('compressed', True) else ""
+        # --subsample：FastqToFasta.py 按 read 名称的哈希抽样后经进程替换送入 Kraken2，与 BP S01 选中相同的 read 对
+        subsample = self.params.get('subsample')
+        if subsample is not None:
+            subsample = int(subsample) if subsample >= 1 else subsample
+            file1, file2 = (
+                f"<({config.BP_FQ2FA_SOFTWARE} -t 2 --subsample {subsample} {fq} /dev/stdout)" for fq in (file1, file2)
+            )
+            compressed = ""
 
         cmd = textwrap.dedent(rf"""
         cd {config.Kraken2_OUTPUT_PATH}
-        {config.Kraken2_MAPPING_SOFTWARE}/kraken2 --db {config.Kraken2_DATABASE} --threads {config.Kraken2_THREADS} --quick --report-zero-counts --gzip-compressed --paired --output {id}.readinfo --report {id}.report {file1} {file2}
+        {config.Kraken2_MAPPING_SOFTWARE}/kraken2 --db {config.Kraken2_DATABASE} --threads {config.Kraken2_THREADS} --quick --report-zero-counts {compressed}--paired --output {id}.readinfo --report {id}.report {file1} {file2}
         python {config.Kraken2_MAPPING_SOFTWARE}/kreport2mpa.py -r {id}.report -o {id}.mpa
         python {config.Kraken2_MAPPING_SOFTWARE}/est_abundance.py -t 1 -k {config.Kraken2_DATABASE}/database150mers.kmer_distrib -i {id}.report -o {id}.report.D -l D
         python {config.Kraken2_MAPPING_SOFTWARE}/est_abundance.py -t 1 -k {config.Kraken2_DATABASE}/database150mers.kmer_distrib -i {id}.report -o {id}.report.P -l P
@@ -41,6 +74,20 @@ class Kraken2Runner(BaseRunner):
         # rm {id}.readinfo {id}.report
         """)
         return cmd
+
+    def resources(self):
+        config = self.params.get('config')
+        return {"cpu": config.Kraken2_THREADS, "mem": config.Kraken2_MEMORY}
+
+    def inputs(self):
+        return [self.params.get('file1'), self.params.get('file2')]
+
+    def outputs(self):
+        config = self.params.get('config')
+        id = self.params.get('id')
+        return [os.path.join(config.Kraken2_OUTPUT_PATH, f"{id}.mpa")] + [
+            os.path.join(config.Kraken2_OUTPUT_PATH, f"{id}.report.{level}") for level in "DPCOFGS"
+        ]
     
     
 class Kraken2Runner2(BaseRunner):
@@ -98,4 +145,19 @@ class Kraken2Runner2(BaseRunner):
         python  {config.Kraken2_MAPPING_SOFTWARE}/mybin/kraken2-combineSample-TaxID.py -i {id_list_G}  -l Genus    -n {id_list3} --taxonomy {config.Kraken2_DATABASE}/Kraken2.Taxonomy.refseq_240720.txt -o TaxIDAbu.G
         python  {config.Kraken2_MAPPING_SOFTWARE}/mybin/kraken2-combineSample-TaxID.py -i {id_list_S}  -l Species  -n {id_list3} --taxonomy {config.Kraken2_DATABASE}/Kraken2.Taxonomy.refseq_240720.txt -o TaxIDAbu.S
         """)
-        return cmd
\ No newline at end of file
+        return cmd
+
+    def resources(self):
+        config = self.params.get('config')
+        return {"cpu": 1, "mem": config.Kraken2_MERGE_MEMORY}
+
+    def inputs(self):
+        config = self.params.get('config')
+        return [
+            os.path.join(config.Kraken2_OUTPUT_PATH, f"{id}.report.{level}")
+            for id in self.params.get('id_list') for level in "DPCOFGS"
+        ]
+
+    def outputs(self):
+        config = self.params.get('config')
+        return [os.path.join(config.Kraken2_OUTPUT_PATH, f"taxonomy.{level}") for level in "DPCOFGS"]
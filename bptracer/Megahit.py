@@ -1,3 +1,4 @@
+import os
 import subprocess
 import textwrap
 from bptracer import config
@@ -11,11 +12,24 @@ class MegahitRunner(BaseRunner):
 
         cmd = textwrap.dedent(rf"""
         cd {config.Megahit_OUTPUT_PATH}
-        {config.BIN_PATH}/megahit/megahit -1 {file1} -2 {file2} --min-contig-len 500 -t 40 -o ./{id}
+        {config.BIN_PATH}/megahit/megahit -1 {file1} -2 {file2} --min-contig-len 500 -t {config.Megahit_THREADS} -m {config.Megahit_MEMORY * 1024 ** 3} -o ./{id}
         perl {config.BIN_PATH}/BPTracer/renamefa.pl ./{id}/final.contigs.fa {id} {id}.contig.ok.fa
         perl {config.BIN_PATH}/BPTracer/deal_fa.pl -format 3 {id}.contig.ok.fa | perl -e 'while(<>){{chomp;@a=split; if($a[1] > 10000){{$a[1]=10000;}} print "$a[0]\t$a[1]\n";}}' > {id}.contig.ok.fa.chrlist
         #perl {config.BIN_PATH}/BPTracer/fa_fq_len_bar.pl {id}.contig.ok.fa.chrlist {id}.contig.length.pdf contig
         rm -r {config.Megahit_OUTPUT_PATH}/{id}/
         perl {config.BIN_PATH}/BPTracer/deal_fa.pl {id}.contig.ok.fa -len 2000 -format 6 -type 1 > {id}.contig.ok.2k.fa
         """)
-        return cmd
\ No newline at end of file
+        return cmd
+
+    def resources(self):
+        return {"cpu": config.Megahit_THREADS, "mem": config.Megahit_MEMORY}
+
+    def inputs(self):
+        return [self.params.get('file1'), self.params.get('file2')]
+
+    def outputs(self):
+        id = self.params.get('id')
+        return [
+            os.path.join(config.Megahit_OUTPUT_PATH, f"{id}.contig.ok.fa"),
+            os.path.join(config.Megahit_OUTPUT_PATH, f"{id}.contig.ok.2k.fa"),
+        ]
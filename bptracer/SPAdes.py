@@ -1,3 +1,4 @@
+import os
 import subprocess
 import textwrap
 from bptracer import config
@@ -19,5 +20,16 @@ class SPAdesRunner(BaseRunner):
         perl {config.BIN_PATH}/BPTracer/deal_fa.pl {id}.contig.ok.fa -len 2000 -format 6 -type 1 > {id}.contig.ok.2k.fa
         """)
         return cmd
-    
-    
+
+    def resources(self):
+        return {"cpu": config.SPAdes_THREADS, "mem": config.SPAdes_MEMORY}
+
+    def inputs(self):
+        return [self.params.get('file1'), self.params.get('file2')]
+
+    def outputs(self):
+        id = self.params.get('id')
+        return [
+            os.path.join(config.SPAdes_OUTPUT_PATH, f"{id}.contig.ok.fa"),
+            os.path.join(config.SPAdes_OUTPUT_PATH, f"{id}.contig.ok.2k.fa"),
+        ]
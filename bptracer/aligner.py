@@ -0,0 +1,119 @@
+"""
+BP2 S03 的比对后端（BP_ALIGNER / BPtracer BP2 --aligner）。
+
+各后端把核酸查询序列翻译比对到功能基因蛋白库，输出与 blastx -outfmt 6 相同的 12 列 m8
+（qseqid sseqid pident length mismatch gapopen qstart qend sstart send evalue bitscore），
+每条查询只保留一个目标，下游的 ExpandHits / FilterFasta / GeneAbundance 无需区分后端：
+- blastx：NCBI BLAST+，默认，与既有结果一致；
+- diamond-more-sensitive / diamond-ultra-sensitive：DIAMOND blastx，库为同名的 .dmnd；
+- mmseqs：MMseqs2 easy-search，库为同名的 .mmseqs（mmseqs createdb 生成），不存在时直接读取 .faa；
+  --max-accept 按预过滤顺序而不是得分截断，因此接受 BP_MMSEQS_MAX_ACCEPT 个目标，再按 bitscore 只保留最佳的一个。
+
+换用更快的后端前，可用 BPtracer concordance 在同一分块上比较两个后端的丰度差异。
+"""
+
+import os
+
+# MMseqs2 输出与 BLAST outfmt 6 相同的列（pident 为百分比）
+MMSEQS_FORMAT = "query,target,pident,alnlen,mismatch,gapopen,qstart,qend,tstart,tend,evalue,bits"
+
+
+class Aligner:
+    """
+    比对后端基类。子类实现 command，必要时覆盖 database 与 memory。
+
+    参数:
+    - config: 配置模块。
+    """
+
+    name = "aligner"
+
+    def __init__(self, config):
+        self.config = config
+
+    def database(self, gene_faa: str) -> str:
+        """由功能基因的 .faa 路径得到本后端使用的数据库路径。"""
+        return gene_faa
+
+    def command(self, query: str, out: str, gene_faa: str, threads: int) -> str:
+        """
+        返回比对一个分块的命令。
+
+        参数:
+        - query (str): 查询 FASTA（可为 {query} 占位符，由 BlastCache.py 替换）。
+        - out (str): 输出 m8（可为 {out} 占位符）。
+        - gene_faa (str): 功能基因的 .faa 路径。
+        - threads (int): 线程数。
+        """
+        raise NotImplementedError("Subclasses should implement this method.")
+
+    def memory(self) -> float:
+        """单个分块比对所需的内存（GB）。"""
+        return self.config.BP_BLAST_MEMORY
+
+    def postprocess(self, out: str) -> str:
+        """比对后整理输出 m8 的命令（如每条查询只保留最佳比对），不需要时为空串。"""
+        return ""
+
+
+class BlastxAligner(Aligner):
+    name = "blastx"
+
+    def command(self, query, out, gene_faa, threads):
+        return (f"{self.config.BP_BLAST_SOFTWARE} -query {query} -out {out} -db {self.database(gene_faa)} "
+                f"-evalue 1e-7 -num_threads {threads} -outfmt 6 -max_target_seqs 1")
+
+
+class DiamondAligner(Aligner):
+    """DIAMOND blastx；sensitivity 为 --more-sensitive 或 --ultra-sensitive。"""
+
+    def __init__(self, config, sensitivity):
+        super().__init__(config)
+        self.sensitivity = sensitivity
+        self.name = f"diamond-{sensitivity}"
+
+    def database(self, gene_faa):
+        return os.path.splitext(gene_faa)[0] + ".dmnd"
+
+    def command(self, query, out, gene_faa, threads):
+        return (f"{self.config.BP_DIAMOND_SOFTWARE} -q {query} -o {out} -d {self.database(gene_faa)} "
+                f"-e 1e-7 -p {threads} -k 1 --max-hsps 1 --outfmt 6 --{self.sensitivity}")
+
+    def memory(self):
+        return self.config.BP_GENEANNO_MEMORY
+
+
+class MMseqsAligner(Aligner):
+    name = "mmseqs"
+
+    def database(self, gene_faa):
+        target = os.path.splitext(gene_faa)[0] + ".mmseqs"
+        return target if os.path.exists(target + ".dbtype") else gene_faa
+
+    def command(self, query, out, gene_faa, threads):
+        return (f"{self.config.BP_MMSEQS_SOFTWARE} easy-search {query} {self.database(gene_faa)} {out} {out}.tmp "
+                f"-e 1e-7 -s {self.config.BP_MMSEQS_SENSITIVITY} --max-accept {self.config.BP_MMSEQS_MAX_ACCEPT} "
+                f"--threads {threads} --format-output {MMSEQS_FORMAT} --remove-tmp-files 1 -v 1")
+
+    def memory(self):
+        return self.config.BP_MMSEQS_MEMORY
+
+    def postprocess(self, out):
+        # 按查询分组、bitscore 降序排列，每条查询只保留第一行，与 -max_target_seqs 1 / -k 1 一致
+        return (f"sort -s -t $'\\t' -k1,1 -k12,12gr {out} | awk -F '\\t' '$1 != q {{print; q = $1}}' > {out}.best "
+                f"&& mv {out}.best {out}")
+
+
+ALIGNERS = {
+    "blastx": BlastxAligner,
+    "diamond-more-sensitive": lambda config: DiamondAligner(config, "more-sensitive"),
+    "diamond-ultra-sensitive": lambda config: DiamondAligner(config, "ultra-sensitive"),
+    "mmseqs": MMseqsAligner,
+}
+
+
+def get_aligner(name: str, config) -> Aligner:
+    """按名称创建比对后端。"""
+    if name not in ALIGNERS:
+        raise ValueError(f"Unsupported aligner: {name} (choose from {', '.join(ALIGNERS)})")
+    return ALIGNERS[name](config)
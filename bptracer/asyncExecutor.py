@@ -0,0 +1,131 @@
+"""
+基于 asyncio 的脚本执行器，供 --auto-run 使用。
+
+每个脚本的 stdout 与 stderr 直接重定向到日志文件 <shell>/logs/<script>.log，
+由操作系统写入磁盘，Python 进程不缓存子进程输出，因此 diamond、kraken2、
+SPAdes 等大量输出的工具也不会占用调度进程的内存。每个脚本只对应一个
+协程与一个子进程，排队中的脚本几乎没有开销。
+"""
+
+import os
+import time
+import asyncio
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+LOG_DIR = "logs"
+LOG_SUFFIX = ".log"
+# 运行期间打印整体状态的间隔（秒）
+STATUS_INTERVAL = 60
+
+
+def log_path(script_path: str) -> str:
+    """返回脚本对应的日志文件路径：脚本所在目录下的 logs/<script>.log。"""
+    script_path = os.path.abspath(script_path)
+    return os.path.join(os.path.dirname(script_path), LOG_DIR, os.path.basename(script_path) + LOG_SUFFIX)
+
+
+def format_elapsed(seconds: float) -> str:
+    """把秒数格式化为 1h02m03s 形式。"""
+    seconds = int(seconds)
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    if hours:
+        return f"{hours}h{minutes:02d}m{seconds:02d}s"
+    if minutes:
+        return f"{minutes}m{seconds:02d}s"
+    return f"{seconds}s"
+
+
+class AsyncExecutor:
+    """
+    AsyncExecutor 以协程方式执行脚本，并记录每个脚本的实时状态。
+
+    状态:
+    - queued: 已提交，等待并发名额；
+    - running: 正在运行；
+    - finished / failed: 退出码为 0 / 非 0。
+
+    参数:
+    - max_workers (int): 最大并发脚本数，None 表示不限制（由调用方控制并发，如 TaskGraph）。
+    - status_interval (float): 打印整体状态的间隔（秒）。
+    """
+
+    def __init__(self, max_workers: Optional[int] = None, status_interval: float = STATUS_INTERVAL):
+        self.max_workers = max_workers
+        self.status_interval = status_interval
+        # script_path -> {"state": str, "start": float, "end": float, "returncode": int, "log": str}
+        self.state = OrderedDict()
+        self._semaphore = None
+
+    async def run_script(self, script_path: str) -> bool:
+        """
+        执行单个脚本，输出写入日志文件。
+
+        返回:
+        - bool: 脚本是否执行成功。
+        """
+        record = {"state": "queued", "start": None, "end": None, "returncode": None, "log": log_path(script_path)}
+        self.state[script_path] = record
+        if self.max_workers and self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_workers)
+
+        if self._semaphore is not None:
+            async with self._semaphore:
+                return await self._execute(script_path, record)
+        return await self._execute(script_path, record)
+
+    async def _execute(self, script_path: str, record: Dict) -> bool:
+        os.makedirs(os.path.dirname(record["log"]), exist_ok=True)
+        record["state"] = "running"
+        record["start"] = time.time()
+        print(f"Running script: {script_path} (log: {record['log']})")
+        with open(record["log"], "wb") as log:
+            try:
+                process = await asyncio.create_subprocess_exec(
+                    "bash", script_path,
+                    stdin=asyncio.subprocess.DEVNULL, stdout=log, stderr=asyncio.subprocess.STDOUT,
+                )
+                returncode = await process.wait()
+            except OSError as e:
+                log.write(f"Error executing script {script_path}: {e}\n".encode())
+                returncode = -1
+        record["end"] = time.time()
+        record["returncode"] = returncode
+        elapsed = format_elapsed(record["end"] - record["start"])
+        if returncode == 0:
+            record["state"] = "finished"
+            print(f"Successfully executed script: {script_path} ({elapsed})")
+            return True
+        record["state"] = "failed"
+        print(f"Script execution failed: {script_path} (exit {returncode}, {elapsed}), see {record['log']}")
+        return False
+
+    def summary(self) -> str:
+        """返回一行整体状态：各状态脚本数与运行最久的脚本。"""
+        counts = {"queued": 0, "running": 0, "finished": 0, "failed": 0}
+        now = time.time()
+        longest = None
+        for script_path, record in self.state.items():
+            counts[record["state"]] += 1
+            if record["state"] == "running" and (longest is None or record["start"] < longest[1]):
+                longest = (script_path, record["start"])
+        line = ", ".join(f"{key}: {value}" for key, value in counts.items())
+        if longest is not None:
+            line += f"; longest running {os.path.basename(longest[0])} ({format_elapsed(now - longest[1])})"
+        return line
+
+    async def report_status(self):
+        """每隔 status_interval 秒打印一次整体状态，直到被取消。"""
+        while True:
+            await asyncio.sleep(self.status_interval)
+            print(f"[auto-run] {self.summary()}")
+
+    async def run_all(self, script_paths: List[str]) -> Dict[str, bool]:
+        """并发执行全部脚本，返回 脚本 -> 是否成功 的 dict。"""
+        reporter = asyncio.ensure_future(self.report_status())
+        try:
+            results = await asyncio.gather(*(self.run_script(script_path) for script_path in script_paths))
+        finally:
+            reporter.cancel()
+        return dict(zip(script_paths, results))
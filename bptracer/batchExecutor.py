@@ -0,0 +1,337 @@
+"""
+集群调度后端（--executor slurm|sge）。
+
+TaskGraph 中每个阶段的脚本按资源需求分组，每组提交为一个数组作业（array job），
+而不是逐个提交上千个脚本：
+- 组内脚本路径写入 shell/array/<stage>.<k>.list，由驱动脚本按数组下标取出执行；
+- 每组按自身的 CPU/内存需求申请资源；
+- 某组脚本的上游所在的全部数组作业作为其依赖（Slurm afterok / SGE -hold_jid）；
+- 脚本输出写入 shell/logs/<script>.log，成功后写完成标记，与本地执行一致，可配合 --resume；
+- 驱动脚本在执行前检查上游脚本的完成标记，上游未完成时不执行（SGE 的 -hold_jid 在上游失败后
+  也会放行下游）；
+- 等待期间通过 sacct / qacct 检查已结束任务的状态，一旦有脚本失败，取消依赖它的全部数组作业，
+  与本地执行跳过失败脚本的下游一致。
+
+提交、查询与取消命令（sbatch/squeue/sacct/scancel、qsub/qstat/qacct/qdel）取自配置，
+测试时可换成本地的替身脚本。
+"""
+
+import os
+import math
+import time
+import shlex
+import subprocess
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from bptracer import manifest
+from bptracer.asyncExecutor import LOG_DIR, LOG_SUFFIX
+
+ARRAY_DIR = "array"
+# sacct 中视为失败的作业状态
+SLURM_FAILED_STATES = {"FAILED", "CANCELLED", "TIMEOUT", "OUT_OF_MEMORY", "NODE_FAIL", "BOOT_FAIL", "DEADLINE",
+                       "PREEMPTED"}
+
+
+class BatchBackend:
+    """
+    集群调度后端基类。子类实现 submit 与 active_jobs。
+
+    参数:
+    - config: 配置模块。
+    - max_workers (int): 每个数组作业同时运行的最大任务数，None 表示不限制。
+    """
+
+    name = "batch"
+    # 驱动脚本中数组下标的环境变量，以及下标对应 list 文件第一行时的取值
+    task_id_var = ""
+    first_index = 0
+
+    def __init__(self, config, max_workers: Optional[int] = None):
+        self.config = config
+        self.max_workers = max_workers
+        self.array_dir = os.path.join(config.SHELL_PATH, ARRAY_DIR)
+        self.log_dir = os.path.join(config.SHELL_PATH, LOG_DIR)
+
+    def submit(self, job_name: str, driver: str, n_tasks: int, resources: Dict[str, float],
+               depends: List[str]) -> str:
+        """提交一个数组作业，返回作业 ID。"""
+        raise NotImplementedError("Subclasses should implement this method.")
+
+    def active_jobs(self, job_ids: List[str]) -> set:
+        """返回仍在队列中（排队或运行）的作业 ID 集合。"""
+        raise NotImplementedError("Subclasses should implement this method.")
+
+    def failed_tasks(self, job_ids: List[str]) -> Dict[str, List[int]]:
+        """返回 作业 ID -> 已结束且失败的数组下标列表（读取调度系统的记账信息）。"""
+        raise NotImplementedError("Subclasses should implement this method.")
+
+    def cancel(self, job_ids: List[str]):
+        """取消作业。"""
+        raise NotImplementedError("Subclasses should implement this method.")
+
+    def call(self, command: str, check: bool = True) -> str:
+        """执行调度命令并返回标准输出。"""
+        result = subprocess.run(command, shell=True, check=check, stdout=subprocess.PIPE, text=True)
+        return result.stdout.strip()
+
+    def write_array(self, array_name: str, scripts: List[str], upstream: List[List[str]]) -> str:
+        """
+        写出脚本列表、上游列表与驱动脚本，返回驱动脚本路径。
+
+        参数:
+        - array_name (str): 数组作业名称。
+        - scripts (List[str]): 组内脚本。
+        - upstream (List[List[str]]): 与 scripts 一一对应的上游脚本。
+        """
+        os.makedirs(self.array_dir, exist_ok=True)
+        os.makedirs(self.log_dir, exist_ok=True)
+        list_file = os.path.join(self.array_dir, f"{array_name}.list")
+        depends_file = os.path.join(self.array_dir, f"{array_name}.depends")
+        with open(list_file, "w", encoding="utf-8") as f:
+            for script_path in scripts:
+                f.write(os.path.abspath(script_path) + "\n")
+        with open(depends_file, "w", encoding="utf-8") as f:
+            for deps in upstream:
+                f.write(" ".join(os.path.abspath(dep) for dep in deps) + "\n")
+
+        driver = os.path.join(self.array_dir, f"{array_name}.sh")
+        line = f"${self.task_id_var}" if self.first_index == 1 else f"$((${self.task_id_var} + 1))"
+        with open(driver, "w", encoding="utf-8") as f:
+            f.write("\n".join([
+                "#!/bin/bash",
+                f"# {array_name}: {len(scripts)} scripts listed in {list_file}",
+                f'script=$(sed -n "{line}p" {list_file})',
+                f'log={self.log_dir}/$(basename "$script"){LOG_SUFFIX}',
+                f'for dep in $(sed -n "{line}p" {depends_file}); do',
+                '    if [ ! -f "$dep.done" ]; then echo "Upstream script did not finish: $dep" > "$log"; exit 1; fi',
+                'done',
+                'rm -f "$script.done"',
+                'bash "$script" > "$log" 2>&1',
+                "rc=$?",
+                'if [ $rc -eq 0 ] && [ -f "$script.manifest.json" ]; then cp "$script.manifest.json" "$script.done"; fi',
+                "exit $rc",
+            ]) + "\n")
+        return driver
+
+    def run(self, graph, resume: bool = False, wait: bool = True) -> Dict[str, list]:
+        """
+        把依赖图提交为数组作业。
+
+        参数:
+        - graph (TaskGraph): 依赖图。
+        - resume (bool): 跳过已是最新、且上游也全部跳过的脚本。
+        - wait (bool): 是否等待全部作业离开队列后再返回。
+
+        返回:
+        - Dict[str, list]: {"submitted": [作业 ID], "up_to_date": [...], "finished": [...], "failed": [...],
+          "skipped": [...]}；skipped 为因上游失败而被取消、未执行的脚本。
+        """
+        skipped = set()
+        if resume:
+            for script_path, task in graph.tasks.items():
+                if all(dep in skipped for dep in task["depends"]) and manifest.is_up_to_date(script_path):
+                    skipped.add(script_path)
+
+        # 阶段内按资源需求分组：(stage, cpu, mem) -> 脚本列表
+        groups = OrderedDict()
+        for stage_name, stage_scripts in graph.stages().items():
+            for script_path in stage_scripts:
+                if script_path in skipped:
+                    continue
+                task_resources = graph.tasks[script_path]["resources"]
+                key = (stage_name, task_resources["cpu"], task_resources["mem"])
+                groups.setdefault(key, []).append(script_path)
+
+        job_of = {}
+        submitted = []
+        # 作业 ID -> 组内脚本 / 直接依赖的作业
+        scripts_of = {}
+        depends_of = {}
+        for k, ((stage_name, cpu, mem), scripts) in enumerate(groups.items()):
+            depends = sorted({
+                job_of[dep]
+                for script_path in scripts
+                for dep in graph.tasks[script_path]["depends"]
+                if dep in job_of
+            })
+            array_name = f"{stage_name}.{k}"
+            upstream = [graph.tasks[script_path]["depends"] for script_path in scripts]
+            driver = self.write_array(array_name, scripts, upstream)
+            job_id = self.submit(array_name, driver, len(scripts), {"cpu": cpu, "mem": mem}, depends)
+            print(f"[{self.name}] {array_name}: {len(scripts)} scripts, {cpu} cores, {mem} GB -> job {job_id}"
+                  + (f" (after {','.join(depends)})" if depends else ""))
+            for script_path in scripts:
+                job_of[script_path] = job_id
+            submitted.append(job_id)
+            scripts_of[job_id] = scripts
+            depends_of[job_id] = depends
+
+        status = {"submitted": submitted, "up_to_date": sorted(skipped), "finished": [], "failed": [], "skipped": []}
+        if not wait or not submitted:
+            return status
+
+        cancelled = self.wait(submitted, scripts_of, depends_of)
+        for script_path, job_id in job_of.items():
+            if os.path.exists(manifest.stamp_path(script_path)):
+                status["finished"].append(script_path)
+            elif job_id in cancelled:
+                status["skipped"].append(script_path)
+            else:
+                status["failed"].append(script_path)
+        print(f"[{self.name}] finished: {len(status['finished'])}, up to date: {len(skipped)}, "
+              f"failed: {len(status['failed'])}, skipped: {len(status['skipped'])}")
+        return status
+
+    def wait(self, submitted: List[str], scripts_of: Dict[str, List[str]], depends_of: Dict[str, List[str]]) -> set:
+        """
+        等待全部作业离开队列；发现失败的任务时报告对应脚本，并取消依赖该作业的全部下游作业。
+
+        返回:
+        - set: 被取消的作业 ID。
+        """
+        downstream = {job_id: set() for job_id in submitted}
+        for job_id in submitted:
+            for dep in depends_of[job_id]:
+                downstream[dep].add(job_id)
+
+        def _descendants(job_id):
+            found = set()
+            stack = [job_id]
+            while stack:
+                for child in downstream[stack.pop()]:
+                    if child not in found:
+                        found.add(child)
+                        stack.append(child)
+            return found
+
+        poll_interval = getattr(self.config, "BATCH_POLL_INTERVAL", 60)
+        cancelled = set()
+        # 已离开队列且已检查过记账信息的作业
+        settled = set()
+        reported = set()
+        while True:
+            active = self.active_jobs(submitted)
+            pending_check = [job_id for job_id in submitted if job_id not in cancelled and job_id not in settled]
+            for job_id, indexes in self.failed_tasks(pending_check).items():
+                for index in indexes:
+                    script_path = scripts_of[job_id][index - self.first_index]
+                    if script_path not in reported:
+                        reported.add(script_path)
+                        print(f"[{self.name}] Script execution failed: {script_path} (job {job_id}, task {index}), "
+                              f"see {self.log_dir}/{os.path.basename(script_path)}{LOG_SUFFIX}")
+                to_cancel = sorted(_descendants(job_id) - cancelled)
+                if to_cancel:
+                    print(f"[{self.name}] Cancel {len(to_cancel)} downstream array jobs of {job_id}: "
+                          f"{','.join(to_cancel)}")
+                    self.cancel(to_cancel)
+                    cancelled.update(to_cancel)
+            settled.update(job_id for job_id in pending_check if job_id not in active)
+            active -= cancelled
+            if not active:
+                break
+            print(f"[{self.name}] {len(active)} of {len(submitted)} array jobs still queued or running")
+            time.sleep(poll_interval)
+        return cancelled
+
+
+class SlurmBackend(BatchBackend):
+    """Slurm：sbatch --array，依赖使用 afterok。"""
+
+    name = "slurm"
+    task_id_var = "SLURM_ARRAY_TASK_ID"
+    first_index = 0
+
+    def submit(self, job_name, driver, n_tasks, resources, depends):
+        array = f"0-{n_tasks - 1}" + (f"%{self.max_workers}" if self.max_workers else "")
+        options = [
+            f"--parsable --job-name={shlex.quote(job_name)} --array={array}",
+            f"--cpus-per-task={int(math.ceil(resources['cpu']))} --mem={int(math.ceil(resources['mem']))}G",
+            f"--output={self.log_dir}/{job_name}.%A_%a.out",
+        ]
+        if depends:
+            options.append(f"--dependency=afterok:{':'.join(depends)}")
+        if self.config.SLURM_OPTIONS:
+            options.append(self.config.SLURM_OPTIONS)
+        output = self.call(f"{self.config.SLURM_SBATCH} {' '.join(options)} {driver}")
+        return output.split(";")[0]
+
+    def active_jobs(self, job_ids):
+        # 作业全部结束并被清出队列后 squeue -j 会报错退出，此时视为没有活动作业
+        output = self.call(f"{self.config.SLURM_SQUEUE} -h -o %F -j {','.join(job_ids)}", check=False)
+        return {line.strip() for line in output.splitlines() if line.strip() in job_ids}
+
+    def failed_tasks(self, job_ids):
+        if not job_ids:
+            return {}
+        output = self.call(f"{self.config.SLURM_SACCT} -n -P -X -o JobID,State -j {','.join(job_ids)}", check=False)
+        failed = {}
+        for line in output.splitlines():
+            job, _, state = line.partition("|")
+            # 数组任务为 <job_id>_<index>；尚未展开的排队任务为 <job_id>_[0-9]，跳过
+            job_id, _, index = job.strip().partition("_")
+            state = state.split()[0] if state.split() else ""
+            if job_id in job_ids and index.isdigit() and state in SLURM_FAILED_STATES:
+                failed.setdefault(job_id, []).append(int(index))
+        return failed
+
+    def cancel(self, job_ids):
+        self.call(f"{self.config.SLURM_SCANCEL} {' '.join(job_ids)}", check=False)
+
+
+class SGEBackend(BatchBackend):
+    """SGE / UGE：qsub -t，依赖使用 -hold_jid。"""
+
+    name = "sge"
+    task_id_var = "SGE_TASK_ID"
+    first_index = 1
+
+    def submit(self, job_name, driver, n_tasks, resources, depends):
+        cpu = int(math.ceil(resources["cpu"]))
+        options = [
+            f"-terse -cwd -S /bin/bash -N {shlex.quote(job_name)} -t 1-{n_tasks}",
+            f"-pe {self.config.SGE_PE} {cpu} -l h_vmem={int(math.ceil(resources['mem'] / cpu))}G",
+            f"-o {self.log_dir} -j y",
+        ]
+        if self.max_workers:
+            options.append(f"-tc {self.max_workers}")
+        if depends:
+            options.append(f"-hold_jid {','.join(depends)}")
+        if self.config.SGE_OPTIONS:
+            options.append(self.config.SGE_OPTIONS)
+        output = self.call(f"{self.config.SGE_QSUB} {' '.join(options)} {driver}")
+        # -terse 对数组作业输出 "<job_id>.1-N:1"
+        return output.split(".")[0]
+
+    def active_jobs(self, job_ids):
+        output = self.call(self.config.SGE_QSTAT, check=False)
+        active = set()
+        for line in output.splitlines():
+            fields = line.split()
+            if fields and fields[0] in job_ids:
+                active.add(fields[0])
+        return active
+
+    def failed_tasks(self, job_ids):
+        failed = {}
+        for job_id in job_ids:
+            # 作业尚无记账记录时 qacct 报错退出，输出为空
+            output = self.call(f"{self.config.SGE_QACCT} -j {job_id} 2>/dev/null", check=False)
+            for record in output.split("=" * 10):
+                fields = dict(line.split(None, 1) for line in record.splitlines() if len(line.split(None, 1)) == 2)
+                task_id = fields.get("taskid", "").strip()
+                if not task_id.isdigit():
+                    continue
+                # failed 非 0 表示调度层面的失败（如超出内存被杀），exit_status 为脚本退出码
+                if fields.get("failed", "0").split()[0] != "0" or fields.get("exit_status", "0").split()[0] != "0":
+                    failed.setdefault(job_id, []).append(int(task_id))
+        return failed
+
+    def cancel(self, job_ids):
+        self.call(f"{self.config.SGE_QDEL} {','.join(job_ids)}", check=False)
+
+
+BACKENDS = {
+    "slurm": SlurmBackend,
+    "sge": SGEBackend,
+}
@@ -41,6 +41,27 @@ SPAdes_OUTPUT_PATH = os.path.join(OUTPUT_PATH, "Assamble_SPADde")
 Megahit_OUTPUT_PATH = os.path.join(OUTPUT_PATH, "Assamble_Megahit")
 BP_OUTPUT_PATH = os.path.join(OUTPUT_PATH, "BPTracer")
 
+# ====================== 运行统计（--metrics） ======================
+# 开启后生成的脚本为每条命令记录耗时、CPU、最大内存与读写量，写入 METRICS_PATH
+METRICS_ENABLED = False
+METRICS_WRAPPER = os.path.join(BIN_PATH, "BPTracer/RunMetrics.py")
+METRICS_PATH = os.path.join(SHELL_PATH, "metrics")
+
+# ====================== 集群调度（--executor slurm|sge） ======================
+# 提交、查询、记账与取消命令，可替换为带路径的可执行文件或测试用的替身脚本
+SLURM_SBATCH = "sbatch"
+SLURM_SQUEUE = "squeue"
+SLURM_SACCT = "sacct"
+SLURM_SCANCEL = "scancel"
+SLURM_OPTIONS = ""        # 附加的 sbatch 参数，如 "-p cpu --time=7-0"
+SGE_QSUB = "qsub"
+SGE_QSTAT = "qstat"
+SGE_QACCT = "qacct"
+SGE_QDEL = "qdel"
+SGE_PE = "smp"            # 申请多核使用的并行环境
+SGE_OPTIONS = ""          # 附加的 qsub 参数，如 "-q all.q"
+BATCH_POLL_INTERVAL = 60  # 等待作业结束时查询队列的间隔（秒）
+
 def set_output_path(pwd=None):
     """
     设置分析输出的根目录，并同步更新各模块输出子目录。
@@ -50,7 +71,7 @@ def set_output_path(pwd=None):
         用户指定的输出目录。如果为 None，则使用当前工作目录。
     """
     global OUTPUT_PATH, SHELL_PATH, SARG_OUTPUT_PATH, Kraken2_OUTPUT_PATH, HGT_OUTPUT_PATH  # 声明全局变量
-    global SPAdes_OUTPUT_PATH, Megahit_OUTPUT_PATH, BP_OUTPUT_PATH, BP_TAX_PATH
+    global SPAdes_OUTPUT_PATH, Megahit_OUTPUT_PATH, BP_OUTPUT_PATH, BP_TAX_PATH, METRICS_PATH
     if pwd is not None:
         OUTPUT_PATH = os.path.abspath(pwd)  # Use absolute path
     else:
@@ -62,6 +83,7 @@ def set_output_path(pwd=None):
     SPAdes_OUTPUT_PATH = os.path.join(OUTPUT_PATH, "Assamble_SPADde")
     Megahit_OUTPUT_PATH = os.path.join(OUTPUT_PATH, "Assamble_Megahit")
     BP_OUTPUT_PATH = os.path.join(OUTPUT_PATH, "BPTracer")
+    METRICS_PATH = os.path.join(SHELL_PATH, "metrics")
 
 
 #"""Mapping software and Functional gene databases"""
@@ -81,6 +103,7 @@ FASTQSTAT_SOFTWARE =  os.path.join(BIN_PATH, 'FastqStat')
 # 默认 kraken2 软件路径和线程数
 Kraken2_MAPPING_SOFTWARE = os.path.join(BIN_PATH, "Kraken2")
 Kraken2_THREADS = 50  # 默认线程数
+Kraken2_MEMORY = 100  # 数据库整体载入内存，单位 GB
 # 默认 kraken2 数据库及物种列表
 Kraken2_DATABASE = os.path.join(DATABASE_PATH, "Kraken2", "krakenDB-202212")
 Kraken2_TAXLIST = os.path.join(Kraken2_DATABASE, "tax.list")
@@ -113,16 +136,45 @@ SPAdes_MAPPING_SOFTWARE = os.path.join(BIN_PATH, 'SPAdes-3.15.3')
 SPAdes_THREADS = 140
 SPAdes_MEMORY = 400
 
+# ====================== Megahit 相关 ======================
+Megahit_THREADS = 40
+Megahit_MEMORY = 100  # 单位 GB，通过 -m 传递给 megahit
+
 # ====================== BP-Tracer 主流程软件 ======================
 BP_SAMTOOLS_SOFTWARE = os.path.join(BIN_PATH,"BPTracer/samtools")
 BP_DIAMOND_SOFTWARE = os.path.join(BIN_PATH,"BPTracer/diamond blastx")
 BP_BLAST_SOFTWARE = os.path.join(BIN_PATH,"BPTracer/blastx")
-
-BP_FQ2FA_SOFTWARE = os.path.join(BIN_PATH,"BPTracer/Fq2fa.pl")
+BP_MMSEQS_SOFTWARE = os.path.join(BIN_PATH,"BPTracer/mmseqs")
+
+# BP_FQ2FA_SOFTWARE = os.path.join(BIN_PATH,"BPTracer/Fq2fa.pl")
+# 多线程 FASTQ.gz -> FASTA，R1/R2 同时转换，输出与 Fq2fa.pl 一致
+BP_FQ2FA_SOFTWARE = "python3 " + os.path.join(BIN_PATH,"BPTracer/FastqToFasta.py")
+BP_FQ2FA_THREADS = 8
+# 流式模式（--stream-reads）：S01 解压出的 FASTA 经命名管道直接送入 minimap2 与 USCMG diamond，
+# 只保存 BGZF 压缩的读库 {id}_1.fa.gz / {id}_2.fa.gz（带 .gzi 块索引）供 S02 使用
+BP_STREAM_READS = False
+# 去重（--derep）：S01 解压后合并 R1、R2 序列完全相同的 read 对，标题行记录出现次数 SZ:i:N，
+# 16S、USCMG 与功能基因丰度均按 N 加权；不能与 --stream-reads 同时使用
+BP_DEREP_READS = False
+BP_DEREP_SOFTWARE = "python3 " + os.path.join(BIN_PATH,"BPTracer/DerepPairs.py")
+# 去重时 S01 额外申请的内存：每 GB（gzip 压缩的）R1 FASTQ 所需的 GB 数，
+# 对应 DerepPairs.py 每个 read 对约 40 字节的摘要数组与两个读库索引（150 bp 的 read 对约 180 字节压缩 FASTQ）
+BP_DEREP_MEMORY_PER_GB = 1.0
+# 抽样（--subsample）：S01 解压时按 read 名称的哈希只保留一部分 read 对，用于快速概览；
+# 小于 1 为保留比例，不小于 1 为目标 read 对数，None 为不抽样。
+# 保留比例写入 meta_data_online.txt 的 SubsampleFraction 列，16S 数、细胞数与基因丰度据此外推到整个文库
+BP_SUBSAMPLE = None
 BP_FQ2FA_SOFTWARE2 = "seqtk" # 提供第二种方案1
 BP_MINIMAP2 = os.path.join(BIN_PATH,"BPTracer/minimap2")
+# minimap2 的 SAM 输出经管道流式统计，写出 {id}.16s.json，不再保存完整 SAM
+BP_16S_SOFTWARE = "python3 " + os.path.join(BIN_PATH,"BPTracer/Stream16S.py")
+# #of16Sreads 的算法："paired" 为双端比对记录数 × LibrarySize / 1432（原算法，与 samtools view -f 3 | wc -l 一致）；
+# "coverage" 为各主比对 参考覆盖长度 / 参考序列长度 之和
+BP_16S_ESTIMATOR = "paired"
 
 BP_EXTREA_SOFTWARE = os.path.join(BIN_PATH,"BPTracer/extract_usearch_reads.pl")
+# 按 S01 生成的读库索引（FastqToFasta.py --index）抽取比对上的 reads，替代 extract_usearch_reads.pl + MergeFastaRename.py
+BP_EXTRACT_HITS_SOFTWARE = "python3 " + os.path.join(BIN_PATH,"BPTracer/ExtractHits.py")
 # BP_MERGEFA_SOFTWARE = os.path.join(BIN_PATH,"BPTracer/merge_extracted_fa_update_metadate.v2.3.pl")
 BP_MERGEFA_SOFTWARE = os.path.join(BIN_PATH,"BPTracer/MergeFa.py")
 BP_16S_DATABASE = os.path.join(DATABASE_PATH, 'BPTracer/Gene/gg85_yinxiaole.fasta.mmi')
@@ -136,7 +188,26 @@ BP_USCMG_DATABASE = os.path.join(DATABASE_PATH, 'BPTracer/Gene/KO30_DIAMOND.0.8.
 
 # ====================== BP-Tracer 功能基因数据库 ======================
 
-BP_EXTRACTEDFA_WINDOW = 200000
+# BP2 S03 的 BLAST 分块按残基数切分：每块残基数约为
+# BP_BLAST_CHUNK_SECONDS × BP_BLAST_RESIDUES_PER_SECOND × BLAST 线程数，再在全部分块间平均
+BP_BLAST_CHUNK_SECONDS = 1800          # 单个分块的目标 BLAST 耗时（秒）
+BP_BLAST_RESIDUES_PER_SECOND = 2000    # blastx 每个线程每秒处理的查询碱基数（可按 BPtracer report 的实测值调整）
+# 跨样品去重：完全相同的序列只比对一个代表，合并时展开回每条序列（结果与不去重时相同）
+BP_BLAST_DEDUP = True
+# S03 比对后端（--aligner）：blastx（默认）、diamond-more-sensitive、diamond-ultra-sensitive、mmseqs，
+# 均输出与 blastx -outfmt 6 相同的 m8；换用前可用 BPtracer concordance 比较丰度差异
+BP_ALIGNER = "blastx"
+BP_MMSEQS_SENSITIVITY = 5.7            # mmseqs easy-search -s
+# mmseqs --max-accept 按预过滤顺序截断，不保证第一个是得分最高的目标：多接受几个，再按 bitscore 保留最佳比对
+BP_MMSEQS_MAX_ACCEPT = 10
+# BLAST 结果缓存：按 序列、数据库内容、搜索参数 保存每条序列的比对结果，S03 只比对未命中的序列，
+# 可跨批次、跨项目复用（BPtracer cache stats|prune 查看与清理）；默认 None 不使用缓存，
+# 可设为文件路径或使用 BPtracer BP2 --blast-cache 开启。
+# 缓存为 SQLite 文件（WAL 模式），同时运行的 S03 脚本共享并加锁写入，必须放在本地盘上：
+# NFS 等网络文件系统的文件锁不可靠，也不支持 WAL，因此只适用于在同一台主机上运行的 S03 脚本
+BP_BLAST_CACHE = None
+BP_BLAST_CACHE_MAX_GB = 20             # 超过该大小时按最近最少使用淘汰
+BP_BLAST_CACHE_SOFTWARE = "python3 " + os.path.join(BIN_PATH,"BPTracer/BlastCache.py")
 BP_META_LIBRARY_SIZE = 300
 BP_TAX_DATABASE = os.path.join(DATABASE_PATH, 'BPTracer/Gene/species.info.txt')
 
@@ -146,6 +217,22 @@ BP_MGE_DATABASE = os.path.join(DATABASE_PATH, 'BPTracer/Gene/Gene-MGE.dmnd')
 BP_MRG_DATABASE = os.path.join(DATABASE_PATH, 'BPTracer/Gene/Gene-MRG.dmnd')
 BP_VFs_DATABASE = os.path.join(DATABASE_PATH, 'BPTracer/Gene/Gene-VFs.dmnd')
 BP_SGs_DATABASE = os.path.join(DATABASE_PATH, 'BPTracer/Gene/Gene-SGs.dmnd')
+# 合并库（--combined-db）：全部基因类型的序列，ID 带类型前缀，由 bin/BPTracer/BuildGeneDB.py 生成
+BP_GENE_COMBINED_DATABASE = os.path.join(DATABASE_PATH, 'BPTracer/Gene/Gene-ALL.dmnd')
+# 合并库搜索每个 read 保留的比对数（diamond -k），需足够让各基因类型的最佳比对都被报告：
+# 一个 read 若在某类型中有 25 条以上得分更高的比对，其在其他类型中的最佳比对会被挤掉，
+# 与逐库搜索的 -k 1 不同；设为 0 时报告全部比对，与逐库搜索一致，但 .genes.us 更大
+BP_GENE_COMBINED_MAX_TARGETS = 25
+# 预过滤（--prefilter）：S02 的 diamond 之前用翻译种子索引去掉不可能比对上的 reads，
+# 索引与 diamond 库同名（Gene-ARG.dmnd -> Gene-ARG.seeds.npz），由 BuildSeedIndex.py 构建
+BP_PREFILTER = False
+BP_PREFILTER_SOFTWARE = "python3 " + os.path.join(BIN_PATH,"BPTracer/PrefilterReads.py")
+BP_PREFILTER_MIN_HITS = 1
+# 单遍模式（--one-pass）：S02 的 diamond 直接按最终阈值（BP_EVALUE_THRESHOLD / BP_IDENTITY_THRESHOLD）输出比对，
+# ExtractHits.py 写出以 <sample>_<n> 为查询的 extracted.m8，BP2 跳过 S03 的分块 BLAST，直接合并并计算丰度；
+# 速度优先，结果与 blastx 不逐条一致
+BP_ONE_PASS = False
+BP_ONE_PASS_DIAMOND_OPTIONS = ""       # 单遍模式 diamond 的附加参数，如 "--more-sensitive"
 # 功能基因结构信息
 BP_ARG_STRUCTURE = os.path.join(DATABASE_PATH, 'BPTracer/Gene/Gene-ARG.list')
 BP_MGE_STRUCTURE = os.path.join(DATABASE_PATH, 'BPTracer/Gene/Gene-MGE.list')
@@ -159,12 +246,17 @@ BP_BLASTMRG_DATABASE = os.path.join(DATABASE_PATH, 'BPTracer/Gene/Gene-MRG.faa')
 BP_BLASTVFs_DATABASE = os.path.join(DATABASE_PATH, 'BPTracer/Gene/Gene-VFs.faa')
 BP_BLASTSGs_DATABASE = os.path.join(DATABASE_PATH, 'BPTracer/Gene/Gene-SGs.faa')
 
+# 各步骤线程数
+BP_USCMG_THREADS = 20     # S01 diamond0.8.16 搜索 USCMG
+BP_DIAMOND_THREADS = 40   # S02 diamond 功能基因比对
+
 # Profile 阈值
 BP_LENGTH_THRESHOLD = 25  
 BP_IDENTITY_THRESHOLD = 80  
 BP_EVALUE_THRESHOLD = 1E-7
 
 # ====================== HGT (WAAFLE) 相关 ======================
+HGT_THREADS = 60
 # 默认 HGT 数据库：RefseqPan2
 BP_HGT_DATABASE  = os.path.join(DATABASE_PATH, 'BPTracer/HGT/RefseqPan2/RefseqPan2')
 BP_HGT_STRUCTURE = os.path.join(DATABASE_PATH, 'BPTracer/HGT/RefseqPan2/RefseqPan2_taxonomy.tsv')
@@ -179,3 +271,19 @@ def set_HGT_database(database=None):
         BP_HGT_STRUCTURE = os.path.join(DATABASE_PATH, 'BPTracer/HGT/', database, f"{database}_taxonomy.tsv")
 
 
+# ====================== 资源需求（--auto-run 打包调度） ======================
+# 每个脚本声明的 CPU 核数由上方各软件的线程数决定，内存需求（GB）在此设置。
+# 调度器据此把脚本装入主机预算（--cores / --mem），避免超订与 OOM。
+BP_RAWSTAT_MEMORY = 16    # S01：minimap2 + diamond0.8.16 USCMG
+BP_GENEANNO_MEMORY = 16   # S02：diamond 功能基因比对
+BP_BLAST_MEMORY = 4       # BP2 S03：单个分块 blastx
+BP_MMSEQS_MEMORY = 16     # BP2 S03：单个分块 mmseqs（--aligner mmseqs）
+BP_MERGE_MEMORY = 16      # BP2 S04：合并比对结果并计算丰度
+FASTQSTAT_MEMORY = 8      # Tax S00：FastqStat.jar
+Kraken2_MERGE_MEMORY = 4  # Tax S02：合并 bracken 结果
+HGT_MEMORY = 32           # WAAFLE blastn 搜索
+# BPtracer all 中 BP2 作为一个任务运行，其内部 S03/S04 脚本共用的核数与内存（GB）
+ALL_BP2_CORES = 40
+ALL_BP2_MEMORY = 64
+
+
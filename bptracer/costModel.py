@@ -0,0 +1,150 @@
+"""
+脚本耗时估计与调度模拟，用于 --auto-run 的最长任务优先排序和 BPtracer plan。
+
+耗时 = 输入数据量（GB）× 阶段速率（秒/GB）。输入数据量取脚本清单中已存在的
+输入文件大小之和（FASTQ、Final.extracted.fa 分块、contig 等）；生成脚本时输入
+尚不存在的下游脚本（如 BP S02 依赖 S01 的输出）沿用其上游脚本中最大的数据量。
+若 shell/metrics 中有历史运行记录（--metrics），则：
+- 同一脚本有记录时直接使用其实测墙钟时间；
+- 否则按同一阶段（如 BP.S01）的实测 秒/GB 估计，没有记录的阶段使用 DEFAULT_SECONDS_PER_GB。
+"""
+
+import os
+import heapq
+from typing import Dict, Optional
+
+from bptracer import manifest
+from bptracer import metrics
+
+# 没有历史记录时的默认速率（秒/GB 输入）
+DEFAULT_SECONDS_PER_GB = 600
+# 没有任何输入信息的脚本（如合并脚本）的默认耗时（秒）
+DEFAULT_SECONDS = 60
+
+
+def input_bytes(script_path: str) -> int:
+    """返回脚本清单中已存在输入文件的总字节数。"""
+    task_manifest = manifest.read_manifest(script_path)
+    if task_manifest is None:
+        return 0
+    return sum(os.path.getsize(p) for p in task_manifest["inputs"] if os.path.isfile(p))
+
+
+def measured_walls(metrics_path: Optional[str]) -> Dict[str, float]:
+    """返回 脚本名 -> 最近一次运行全部命令墙钟时间之和（秒）。"""
+    if not metrics_path or not os.path.isdir(metrics_path):
+        return {}
+    records = metrics.load_records(metrics_path)
+    if records.empty:
+        return {}
+    return records.groupby("script")["wall"].sum().to_dict()
+
+
+def estimate(graph, metrics_path: Optional[str] = None) -> Dict[str, float]:
+    """
+    估计图中每个脚本的耗时（秒）。
+
+    参数:
+    - graph (TaskGraph): 已登记全部脚本的依赖图。
+    - metrics_path (str): 历史运行统计目录（config.METRICS_PATH），可为 None。
+
+    返回:
+    - Dict[str, float]: 脚本路径 -> 估计耗时（秒）。
+    """
+    walls = measured_walls(metrics_path)
+
+    # 输入数据量：按登记顺序（上游总在下游之前）传递
+    sizes = {}
+    for script_path, task in graph.tasks.items():
+        size = input_bytes(script_path)
+        if size == 0 and task["depends"]:
+            size = max(sizes[dep] for dep in task["depends"])
+        sizes[script_path] = size
+
+    # 各阶段的实测速率（秒/GB）
+    stage_walls, stage_gb = {}, {}
+    for script_path in graph.tasks:
+        name = os.path.basename(script_path)
+        if name in walls and sizes[script_path] > 0:
+            stage = metrics.stage_name(name)
+            stage_walls[stage] = stage_walls.get(stage, 0) + walls[name]
+            stage_gb[stage] = stage_gb.get(stage, 0) + sizes[script_path] / 1024 ** 3
+    rates = {stage: stage_walls[stage] / stage_gb[stage] for stage in stage_walls if stage_gb[stage] > 0}
+
+    costs = {}
+    for script_path in graph.tasks:
+        name = os.path.basename(script_path)
+        if name in walls:
+            costs[script_path] = walls[name]
+        elif sizes[script_path] > 0:
+            rate = rates.get(metrics.stage_name(name), DEFAULT_SECONDS_PER_GB)
+            costs[script_path] = sizes[script_path] / 1024 ** 3 * rate
+        else:
+            costs[script_path] = DEFAULT_SECONDS
+    return costs
+
+
+def bottom_levels(graph, costs: Dict[str, float]) -> Dict[str, float]:
+    """
+    计算每个脚本的 bottom level：自身耗时加上到终点的最长下游路径耗时。
+
+    按 bottom level 从大到小启动就绪脚本，即最长任务优先（LPT），同时优先推进关键路径。
+    """
+    downstream = graph.children()
+    levels = {}
+    for script_path in reversed(list(graph.tasks)):
+        levels[script_path] = costs[script_path] + max(
+            (levels[child] for child in downstream[script_path]), default=0
+        )
+    return levels
+
+
+def simulate(graph, costs: Dict[str, float], cores: int, mem: float, lpt: bool = True) -> Dict[str, tuple]:
+    """
+    按 TaskGraph.run 的打包规则模拟执行，不考虑运行期间的内存回退。
+
+    参数:
+    - graph (TaskGraph): 依赖图。
+    - costs (Dict[str, float]): 估计耗时（秒）。
+    - cores (int) / mem (float): 主机预算。
+    - lpt (bool): True 为最长任务优先，False 为登记顺序。
+
+    返回:
+    - Dict[str, tuple]: 脚本路径 -> (开始时间, 结束时间)，单位秒。
+    """
+    order = {script_path: i for i, script_path in enumerate(graph.tasks)}
+    levels = bottom_levels(graph, costs)
+    priority = (lambda s: (-levels[s], order[s])) if lpt else (lambda s: order[s])
+
+    downstream = graph.children()
+    waiting = {script_path: len(task["depends"]) for script_path, task in graph.tasks.items()}
+    ready = [script_path for script_path, n in waiting.items() if n == 0]
+    running = []  # (结束时间, 登记序号, 脚本路径)
+    schedule = {}
+    now, free_cpu, free_mem = 0.0, cores, mem
+
+    def _need(script_path):
+        task_resources = graph.tasks[script_path]["resources"]
+        return min(task_resources["cpu"], cores), min(task_resources["mem"], mem)
+
+    while ready or running:
+        ready.sort(key=priority)
+        for script_path in list(ready):
+            need_cpu, need_mem = _need(script_path)
+            if need_cpu > free_cpu or need_mem > free_mem:
+                continue
+            ready.remove(script_path)
+            free_cpu -= need_cpu
+            free_mem -= need_mem
+            schedule[script_path] = (now, now + costs[script_path])
+            heapq.heappush(running, (now + costs[script_path], order[script_path], script_path))
+
+        now, _, script_path = heapq.heappop(running)
+        need_cpu, need_mem = _need(script_path)
+        free_cpu += need_cpu
+        free_mem += need_mem
+        for child in downstream[script_path]:
+            waiting[child] -= 1
+            if waiting[child] == 0:
+                ready.append(child)
+    return schedule
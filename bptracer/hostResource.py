@@ -0,0 +1,49 @@
+"""
+主机资源探测：为 --auto-run 调度器提供 CPU 核数与内存预算。
+
+内存统一以 GB 为单位；读取 /proc/meminfo 失败时（非 Linux 环境）返回 None。
+"""
+
+import os
+from typing import Dict, Optional
+
+MEMINFO = "/proc/meminfo"
+
+
+def detect_cores() -> int:
+    """返回当前进程可用的 CPU 核数（优先考虑 CPU 亲和性限制）。"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except (AttributeError, OSError):
+        return os.cpu_count() or 1
+
+
+def read_meminfo(path: str = MEMINFO) -> Dict[str, int]:
+    """读取 /proc/meminfo，返回 字段名 -> kB 数值 的 dict。"""
+    meminfo = {}
+    try:
+        with open(path, "r") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                fields = value.split()
+                if fields and fields[0].isdigit():
+                    meminfo[key.strip()] = int(fields[0])
+    except OSError:
+        pass
+    return meminfo
+
+
+def detect_memory() -> Optional[float]:
+    """返回主机总内存（GB）。"""
+    meminfo = read_meminfo()
+    if "MemTotal" not in meminfo:
+        return None
+    return meminfo["MemTotal"] / 1024 ** 2
+
+
+def available_memory() -> Optional[float]:
+    """返回当前可用内存 MemAvailable（GB），用于运行期间的内存回退判断。"""
+    meminfo = read_meminfo()
+    if "MemAvailable" not in meminfo:
+        return None
+    return meminfo["MemAvailable"] / 1024 ** 2
@@ -1,5 +1,6 @@
 import pandas as pd
 import os
+from bptracer.BP import read_store
 
 """
 目的是将输入的raw.fq.list定义到一个Class里面
@@ -45,34 +46,38 @@ def read_single_list(file):
     data = DataSingle(id_list, file1_list, id_num)
     return data
 
-def generate_inputlist(file, output_file, base_path):
+def generate_inputlist(file, output_file, config):
     """
-    根据输入文件生成路径信息并保存到输出文件。
+    根据输入文件生成 BP S01 各输出文件的路径并保存到输出文件。
+
+    每行为：样品 ID、两端读库（随 --stream-reads / --derep 为 .fa.gz / .derep.fa / .fa）、
+    两端 USCMG 比对（uscmg_[12].dmd）、16S 比对统计（.16s.json）与 meta_data_online.txt。
 
     Args:
-        input_file (str): 输入文件路径。
-        output_file (str): 输出文件路径。
-        base_path (str): 基础路径。
+        file (str): 输入文件路径。
+        output_file (str): 输出文件名（位于 BP 输出目录下）。
+        config: 配置模块。
     """
     # 获取输入文件的绝对路径
-    
     abs_raw = os.path.realpath(file)
     all_list = pd.read_csv(abs_raw, sep="\t", header=None)
     id_list = all_list[0]
+    base_path = config.BP_OUTPUT_PATH
 
     output_data = []
     for sample_id in id_list:
+        datadir = f"{base_path}/00.DataStat/{sample_id}"
         output_line = [
             sample_id,
-            f"{base_path}/00.DataStat/{sample_id}/{sample_id}_1.fa",
-            f"{base_path}/00.DataStat/{sample_id}/{sample_id}_2.fa",
-            f"{base_path}/00.DataStat/{sample_id}/{sample_id}.uscmg.blastx.txt",
-            f"{base_path}/00.DataStat/{sample_id}/{sample_id}.sam",
-            f"{base_path}/00.DataStat/{sample_id}/meta_data_online.txt"
+            *read_store(config, sample_id),
+            f"{datadir}/{sample_id}.uscmg_1.dmd",
+            f"{datadir}/{sample_id}.uscmg_2.dmd",
+            f"{datadir}/{sample_id}.16s.json",
+            f"{datadir}/meta_data_online.txt"
         ]
         output_data.append(output_line)
-        # 转换为 DataFrame 并写入输出文件
-        output_df = pd.DataFrame(output_data, columns=["ID", "File1", "File2", "Blastx", "Sam", "MetaData"])
-        final_path = os.path.join(base_path,output_file)
-        output_df.to_csv(final_path, sep="\t", index=False, header=False)
+    # 转换为 DataFrame 并写入输出文件
+    output_df = pd.DataFrame(output_data, columns=["ID", "File1", "File2", "USCMG1", "USCMG2", "16S", "MetaData"])
+    final_path = os.path.join(base_path, output_file)
+    output_df.to_csv(final_path, sep="\t", index=False, header=False)
     print(f"Inputlist set to: {final_path}")
\ No newline at end of file
@@ -0,0 +1,116 @@
+"""
+脚本清单（manifest）与完成标记（stamp），用于 --resume 增量重跑。
+
+每个生成的脚本旁写入 <script>.manifest.json，记录声明的输入、输出、
+命令文本哈希与配置哈希；脚本成功执行后将清单复制为 <script>.done。
+再次运行时，若完成标记中的哈希与当前清单一致，且全部输出存在并且
+不早于全部输入，则认为该脚本已是最新，可以跳过。
+"""
+
+import os
+import json
+import hashlib
+from typing import List, Optional
+
+MANIFEST_SUFFIX = ".manifest.json"
+STAMP_SUFFIX = ".done"
+
+
+def manifest_path(script_path: str) -> str:
+    return script_path + MANIFEST_SUFFIX
+
+
+def stamp_path(script_path: str) -> str:
+    return script_path + STAMP_SUFFIX
+
+
+def command_hash(command: str) -> str:
+    """返回命令文本的 sha1。"""
+    return hashlib.sha1(command.encode("utf-8")).hexdigest()
+
+
+def config_hash(config) -> str:
+    """
+    返回配置模块的 sha1，只统计全大写的配置常量（路径、线程数、阈值等）。
+
+    参数:
+    - config: 已加载的配置模块，为 None 时返回空字符串。
+    """
+    if config is None:
+        return ""
+    items = []
+    for key in sorted(dir(config)):
+        if not key.isupper():
+            continue
+        value = getattr(config, key)
+        if isinstance(value, (str, int, float, bool, list, tuple, dict)) or value is None:
+            items.append(f"{key}={value!r}")
+    return hashlib.sha1("\n".join(items).encode("utf-8")).hexdigest()
+
+
+def write_manifest(script_path: str, inputs: List[str], outputs: List[str], command: str, config=None):
+    """在脚本旁写入清单文件。"""
+    manifest = {
+        "script": script_path,
+        "inputs": [os.path.abspath(p) for p in inputs],
+        "outputs": [os.path.abspath(p) for p in outputs],
+        "command_hash": command_hash(command),
+        "config_hash": config_hash(config),
+    }
+    with open(manifest_path(script_path), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def read_manifest(script_path: str, suffix: str = MANIFEST_SUFFIX) -> Optional[dict]:
+    path = script_path + suffix
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def mark_done(script_path: str):
+    """脚本成功执行后，把当前清单记录为完成标记。"""
+    manifest = read_manifest(script_path)
+    if manifest is None:
+        return
+    with open(stamp_path(script_path), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+
+
+def clear_done(script_path: str):
+    """脚本失败或被重新执行时移除旧的完成标记。"""
+    if os.path.exists(stamp_path(script_path)):
+        os.remove(stamp_path(script_path))
+
+
+def is_up_to_date(script_path: str) -> bool:
+    """
+    判断脚本是否可以跳过。
+
+    条件:
+    - 存在清单与完成标记，且两者的命令哈希与配置哈希一致；
+    - 至少声明了一个输出，且全部输出文件存在；
+    - 最早的输出修改时间不早于最晚的输入修改时间（缺失的输入视为需要重跑）。
+    """
+    manifest = read_manifest(script_path)
+    stamp = read_manifest(script_path, STAMP_SUFFIX)
+    if manifest is None or stamp is None:
+        return False
+    for key in ("command_hash", "config_hash", "inputs", "outputs"):
+        if manifest.get(key) != stamp.get(key):
+            return False
+
+    outputs = manifest["outputs"]
+    if not outputs or not all(os.path.exists(p) for p in outputs):
+        return False
+    if not all(os.path.exists(p) for p in manifest["inputs"]):
+        return False
+
+    oldest_output = min(os.path.getmtime(p) for p in outputs)
+    newest_input = max((os.path.getmtime(p) for p in manifest["inputs"]), default=0)
+    return oldest_output >= newest_input
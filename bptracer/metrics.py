@@ -0,0 +1,166 @@
+"""
+运行统计（--metrics）：在生成的脚本中为每条命令套上 bin/BPTracer/RunMetrics.py，
+记录墙钟时间、CPU 时间、最大内存与读写字节数，写入 shell/metrics/<script>.jsonl；
+BPtracer report 按阶段、工具、样品汇总这些记录。
+"""
+
+import os
+import re
+import glob
+import json
+import shlex
+from typing import List, Optional
+
+import pandas as pd
+
+METRICS_SUFFIX = ".jsonl"
+# 不套统计的命令：需要在当前 shell 中生效（cd、set、export、wait 等）
+SHELL_BUILTINS = {"cd", "set", "export", "source", ".", "wait", "exit"}
+# 单独的变量赋值（如 map_pid=$!）同样需要在当前 shell 中执行
+ASSIGNMENT = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*=\S*$")
+# 命令末尾的失败处理（|| exit 1、|| { kill $pid; exit 1; }）必须留在当前 shell 中执行，
+# 套进 RunMetrics.py 的 bash -c 后只会退出子 shell，脚本仍会继续执行后续命令
+FAILURE_CLAUSE = re.compile(r"^(.*\S)\s*(\|\|\s*(?:exit(?:\s+\d+)?|\{[^{}]*\}))$", re.S)
+
+
+def metrics_file(metrics_path: str, script_path: str) -> str:
+    """返回脚本对应的统计文件路径 <metrics_path>/<script>.jsonl。"""
+    return os.path.join(metrics_path, os.path.basename(script_path) + METRICS_SUFFIX)
+
+
+def split_commands(text: str) -> List[str]:
+    """把脚本文本按逻辑行切分，以反斜杠结尾的续行并入同一条命令。"""
+    commands, current = [], []
+    for line in text.split("\n"):
+        current.append(line)
+        if not line.rstrip().endswith("\\"):
+            commands.append("\n".join(current))
+            current = []
+    if current:
+        commands.append("\n".join(current))
+    return commands
+
+
+def instrument(text: str, script_path: str, config, sample: Optional[str] = None) -> str:
+    """
+    为脚本中的每条命令套上 RunMetrics.py。
+
+    参数:
+    - text (str): build_command 生成的脚本文本。
+    - script_path (str): 脚本路径，用于命名统计文件。
+    - config: 配置模块，提供 METRICS_WRAPPER 与 METRICS_PATH。
+    - sample (str): 样品 ID，写入每条记录，便于按样品汇总。
+
+    返回:
+    - str: 套上统计后的脚本文本；空行、注释、cd/set/export/wait 与变量赋值保持原样，
+      以 & 结尾的后台命令在统计命令之外保留 &，使 $! 与 wait 仍然有效；
+      末尾的 || exit N 与 || { ...; } 同样留在统计命令之外，失败时退出整个脚本。
+    """
+    output = metrics_file(config.METRICS_PATH, script_path)
+    prefix = (
+        f"python3 {config.METRICS_WRAPPER} -o {shlex.quote(output)} "
+        f"-s {shlex.quote(os.path.basename(script_path))}"
+    )
+    if sample:
+        prefix += f" --sample {shlex.quote(sample)}"
+
+    lines = ['export BPTRACER_RUN_ID="${BPTRACER_RUN_ID:-$$.$(date +%s)}"']
+    for command in split_commands(text):
+        stripped = command.strip()
+        first = stripped.split(None, 1)[0] if stripped else ""
+        if not stripped or stripped.startswith("#") or first in SHELL_BUILTINS or ASSIGNMENT.match(stripped):
+            lines.append(command)
+        elif stripped.endswith("&") and not stripped.endswith("&&"):
+            lines.append(f"{prefix} -- {shlex.quote(stripped[:-1].rstrip())} &")
+        elif FAILURE_CLAUSE.match(stripped):
+            body, clause = FAILURE_CLAUSE.match(stripped).groups()
+            lines.append(f"{prefix} -- {shlex.quote(body)} {clause}")
+        else:
+            lines.append(f"{prefix} -- {shlex.quote(stripped)}")
+    return "\n".join(lines)
+
+
+def stage_name(script: str) -> str:
+    """由脚本名得到阶段，如 BP.S02.ARGsAnno.A1.sh -> BP.S02。"""
+    return ".".join(script.split(".")[:2])
+
+
+def load_records(metrics_path: str, all_runs: bool = False) -> pd.DataFrame:
+    """
+    读取统计目录下的全部 JSONL 记录。
+
+    参数:
+    - metrics_path (str): 统计目录（shell/metrics）。
+    - all_runs (bool): 为 False 时每个脚本只保留最近一次执行的记录。
+
+    返回:
+    - DataFrame: 每条命令一行，附加 stage 与 cpu（user + sys）列。
+    """
+    records = []
+    for path in sorted(glob.glob(os.path.join(metrics_path, "*" + METRICS_SUFFIX))):
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    print(f"Warning: skip malformed metrics line in {path}")
+    df = pd.DataFrame(records)
+    if df.empty:
+        return df
+
+    if not all_runs:
+        # 每个脚本只保留最近一次执行（start 最大的 run_id）
+        last_start = df.groupby(["script", "run_id"])["start"].max().reset_index()
+        latest = last_start.sort_values("start").groupby("script").tail(1)
+        df = df.merge(latest[["script", "run_id"]], on=["script", "run_id"])
+
+    df["stage"] = df["script"].map(stage_name)
+    df["cpu"] = df["user"] + df["sys"]
+    df["sample"] = df["sample"].fillna("").replace("", "-")
+    return df
+
+
+def aggregate(df: pd.DataFrame, by: str) -> pd.DataFrame:
+    """
+    按 stage / tool / sample 汇总统计。
+
+    返回列: commands、wall_h、cpu_h、cpu_util（cpu / wall）、max_rss_gb、read_gb、write_gb、failed，
+    按 wall_h 降序排列。
+    """
+    grouped = df.groupby(by)
+    table = pd.DataFrame({
+        "commands": grouped.size(),
+        "wall_h": grouped["wall"].sum() / 3600,
+        "cpu_h": grouped["cpu"].sum() / 3600,
+        "max_rss_gb": grouped["max_rss_kb"].max() / 1024 ** 2,
+        "read_gb": grouped["read_bytes"].sum() / 1024 ** 3,
+        "write_gb": grouped["write_bytes"].sum() / 1024 ** 3,
+        "failed": grouped["returncode"].apply(lambda codes: int((codes != 0).sum())),
+    })
+    table.insert(3, "cpu_util", (table["cpu_h"] / table["wall_h"]).where(table["wall_h"] > 0, 0))
+    return table.sort_values("wall_h", ascending=False).round(3)
+
+
+def report(metrics_path: str, by: List[str], all_runs: bool = False) -> dict:
+    """
+    打印并保存汇总表 <metrics_path>/report.<by>.tsv。
+
+    返回:
+    - dict: by -> 汇总 DataFrame；没有任何记录时返回空 dict。
+    """
+    df = load_records(metrics_path, all_runs=all_runs)
+    if df.empty:
+        print(f"No metrics found in {metrics_path}. Generate scripts with --metrics and run them first.")
+        return {}
+    tables = {}
+    for key in by:
+        table = aggregate(df, key)
+        output = os.path.join(metrics_path, f"report.{key}.tsv")
+        table.to_csv(output, sep="\t")
+        print(f"\n==== Per {key} ({output}) ====")
+        print(table.to_string())
+        tables[key] = table
+    return tables
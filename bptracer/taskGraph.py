@@ -0,0 +1,234 @@
+import os
+import json
+import asyncio
+from collections import OrderedDict
+from typing import List, Dict, Optional
+
+from bptracer.asyncExecutor import AsyncExecutor
+from bptracer import hostResource
+from bptracer import manifest
+from bptracer import costModel
+
+# 可用内存不足以启动下一个任务时，重新检查 /proc/meminfo 的间隔（秒）
+BACKOFF_INTERVAL = 15
+
+
+class TaskGraph:
+    """
+    TaskGraph 记录已生成脚本及其上游依赖，用于 --auto-run 时按依赖关系调度。
+
+    特点:
+    - 每个脚本在加入时声明所属阶段（stage）与上游脚本（depends）。
+    - 执行时不再在阶段之间设置全局屏障：某个脚本的全部上游完成后即可立即启动，
+      例如 BP.S02.ARGsAnno.A1.sh 只等待 BP.S01.RawStat.A1.sh。
+    - 上游失败时，其所有下游脚本会被跳过。
+    - 每个脚本携带 CPU 核数与内存（GB）需求，执行时按主机预算（--cores / --mem）
+      打包并发任务，并在实际可用内存下降时暂停启动新任务。
+    - resume 模式下，输出已是最新且命令与配置未变的脚本直接跳过（见 manifest 模块）。
+    - 就绪脚本按估计耗时的 bottom level 从大到小启动（最长任务优先，见 costModel 模块）。
+    - 脚本由 AsyncExecutor 以协程方式执行，输出写入 <shell>/logs/<script>.log，
+      并定期打印运行中、已完成、失败的脚本数。
+    """
+
+    def __init__(self):
+        # script_path -> {"stage": str, "depends": List[str], "resources": Dict}，保持插入顺序
+        self.tasks = OrderedDict()
+
+    def __len__(self):
+        return len(self.tasks)
+
+    def add(self, script_path: str, stage: str, depends: Optional[List[str]] = None,
+            resources: Optional[Dict[str, float]] = None):
+        """
+        登记一个已生成的脚本。
+
+        参数:
+        - script_path (str): 脚本路径。
+        - stage (str): 所属阶段名称，如 'S01_RawdataStat'。
+        - depends (List[str]): 上游脚本路径列表，必须已登记。
+        - resources (Dict[str, float]): {"cpu": 核数, "mem": 内存 GB}，
+          一般取自 BaseRunner.resources()，缺省为单核、1 GB。
+        """
+        depends = list(depends or [])
+        for dep in depends:
+            if dep not in self.tasks:
+                raise ValueError(f"Unknown upstream script for {script_path}: {dep}")
+        task_resources = {"cpu": 1, "mem": 1}
+        task_resources.update(resources or {})
+        self.tasks[script_path] = {"stage": stage, "depends": depends, "resources": task_resources}
+        return script_path
+
+    def stages(self) -> Dict[str, List[str]]:
+        """按登记顺序返回 “阶段 -> 脚本列表” 的 dict。"""
+        stage_scripts = OrderedDict()
+        for script_path, task in self.tasks.items():
+            stage_scripts.setdefault(task["stage"], []).append(script_path)
+        return stage_scripts
+
+    def children(self) -> Dict[str, List[str]]:
+        """返回 “脚本 -> 直接下游脚本列表” 的映射。"""
+        downstream = {script_path: [] for script_path in self.tasks}
+        for script_path, task in self.tasks.items():
+            for dep in task["depends"]:
+                downstream[dep].append(script_path)
+        return downstream
+
+    def save(self, path: str):
+        """
+        把依赖图写为任务清单 JSONL，每行一个脚本：
+        {"id": 脚本文件名, "script": 路径, "command": 执行命令, "stage": 阶段,
+         "depends": [上游 id], "resources": {...}}。
+        """
+        with open(path, "w", encoding="utf-8") as f:
+            for script_path, task in self.tasks.items():
+                f.write(json.dumps({
+                    "id": os.path.basename(script_path),
+                    "script": os.path.abspath(script_path),
+                    "command": f"bash {os.path.abspath(script_path)}",
+                    "stage": task["stage"],
+                    "depends": [os.path.basename(dep) for dep in task["depends"]],
+                    "resources": task["resources"],
+                }) + "\n")
+        print(f"Task manifest written to: {path}")
+
+    @classmethod
+    def load(cls, path: str) -> "TaskGraph":
+        """从 save() 写出的任务清单重建依赖图。"""
+        graph = cls()
+        scripts = {}
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                task = json.loads(line)
+                scripts[task["id"]] = task["script"]
+                graph.add(
+                    task["script"], stage=task["stage"],
+                    depends=[scripts[dep] for dep in task["depends"]],
+                    resources=task["resources"],
+                )
+        return graph
+
+    def run(self, max_workers: Optional[int] = None, cores: Optional[int] = None,
+            mem: Optional[float] = None, resume: bool = False, metrics_path: Optional[str] = None):
+        """
+        按依赖关系与资源预算并行执行全部脚本。
+
+        参数:
+        - max_workers (int): 最大并行脚本数，默认不单独限制。
+        - cores (int): CPU 核数预算，默认自动探测。
+        - mem (float): 内存预算（GB），默认读取 /proc/meminfo 的 MemTotal。
+        - resume (bool): 为 True 时跳过已是最新的脚本。
+        - metrics_path (str): 历史运行统计目录，用于细化耗时估计，可为 None。
+
+        说明:
+        - 就绪脚本按估计的 bottom level（自身耗时 + 最长下游路径）从大到小依次尝试，
+          能装入剩余预算的立即启动（first-fit），装不下的等待正在运行的任务释放资源；
+          大样品因此最先启动，不会在列表末尾成为拖尾任务。
+        - 需求超过整机预算的脚本按整机预算计，即独占主机运行。
+        - 若 MemAvailable 低于待启动脚本的内存需求，则暂缓启动，每隔
+          BACKOFF_INTERVAL 秒重新检查；没有任何任务在运行时不再等待。
+        - 是否最新在脚本就绪时（上游均已完成后）判断，因此上游重跑后下游也会重跑。
+        - 每个脚本的输出写入 <shell>/logs/<script>.log。
+
+        返回:
+        - Dict[str, List[str]]: {"finished": [...], "failed": [...], "skipped": [...],
+          "up_to_date": [...]}。
+        """
+        cores = cores or hostResource.detect_cores()
+        mem = mem or hostResource.detect_memory() or float("inf")
+        max_workers = max_workers or cores
+        print(f"[auto-run] Host budget: {cores} cores, {mem:.0f} GB memory, "
+              f"at most {max_workers} scripts at once.")
+        levels = costModel.bottom_levels(self, costModel.estimate(self, metrics_path))
+        return asyncio.run(self._run(max_workers, cores, mem, resume, levels))
+
+    async def _run(self, max_workers: int, cores: int, mem: float, resume: bool, levels: Dict[str, float]):
+        """run() 的协程实现。"""
+        executor = AsyncExecutor()
+        downstream = self.children()
+        waiting = {script_path: len(task["depends"]) for script_path, task in self.tasks.items()}
+        ready = [script_path for script_path, n in waiting.items() if n == 0]
+        status = {"finished": [], "failed": [], "skipped": [], "up_to_date": []}
+
+        def _need(script_path):
+            task_resources = self.tasks[script_path]["resources"]
+            return min(task_resources["cpu"], cores), min(task_resources["mem"], mem)
+
+        def _skip(script_path):
+            # 递归跳过失败脚本的全部下游
+            for child in downstream[script_path]:
+                if child in waiting:
+                    del waiting[child]
+                    status["skipped"].append(child)
+                    print(f"[auto-run] Skip {os.path.basename(child)}: upstream "
+                          f"{os.path.basename(script_path)} did not finish.")
+                    _skip(child)
+
+        def _release(script_path):
+            # 脚本完成后解锁其下游
+            for child in downstream[script_path]:
+                if child not in waiting:
+                    continue
+                waiting[child] -= 1
+                if waiting[child] == 0:
+                    del waiting[child]
+                    ready.append(child)
+
+        for script_path in ready:
+            del waiting[script_path]
+
+        running = {}
+        free_cpu, free_mem = cores, mem
+        reporter = asyncio.ensure_future(executor.report_status())
+        try:
+            while ready or running:
+                backoff = False
+                ready.sort(key=lambda s: -levels[s])
+                for script_path in list(ready):
+                    if resume and manifest.is_up_to_date(script_path):
+                        print(f"[auto-run] Up to date, skip: {os.path.basename(script_path)}")
+                        ready.remove(script_path)
+                        status["up_to_date"].append(script_path)
+                        _release(script_path)
+                        continue
+                    if len(running) >= max_workers:
+                        break
+                    need_cpu, need_mem = _need(script_path)
+                    if need_cpu > free_cpu or need_mem > free_mem:
+                        continue
+                    available = hostResource.available_memory()
+                    if running and available is not None and need_mem > available:
+                        # 实际可用内存不足：暂缓启动，等待运行中的任务释放内存
+                        backoff = True
+                        continue
+                    ready.remove(script_path)
+                    free_cpu -= need_cpu
+                    free_mem -= need_mem
+                    manifest.clear_done(script_path)
+                    running[asyncio.ensure_future(executor.run_script(script_path))] = script_path
+
+                if not running:
+                    # 本轮只跳过了已是最新的脚本，继续处理新解锁的下游
+                    continue
+                done, _ = await asyncio.wait(list(running), timeout=BACKOFF_INTERVAL if backoff else None,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                for future in done:
+                    script_path = running.pop(future)
+                    need_cpu, need_mem = _need(script_path)
+                    free_cpu += need_cpu
+                    free_mem += need_mem
+                    if future.result():
+                        manifest.mark_done(script_path)
+                        status["finished"].append(script_path)
+                        _release(script_path)
+                    else:
+                        status["failed"].append(script_path)
+                        _skip(script_path)
+        finally:
+            reporter.cancel()
+
+        print(f"[auto-run] finished: {len(status['finished'])}, "
+              f"up to date: {len(status['up_to_date'])}, "
+              f"failed: {len(status['failed'])}, skipped: {len(status['skipped'])}")
+        return status
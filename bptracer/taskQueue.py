@@ -0,0 +1,250 @@
+"""
+基于共享文件系统的任务队列，供 BPtracer worker 使用。
+
+任意数量的 worker（可在不同节点上）共享同一个队列目录：
+
+    <queue>/tasks.jsonl     任务清单（TaskGraph.save 的格式，含 command）
+    <queue>/running/<id>/   已被领取的任务；目录内 owner 记录 worker，目录 mtime 即心跳
+    <queue>/done/<id>       成功完成的任务
+    <queue>/failed/<id>     失败的任务（或上游失败而无法执行的任务）
+
+- 领取任务使用 mkdir running/<id>，同一时刻只有一个 worker 能创建成功；
+- worker 每隔 HEARTBEAT_INTERVAL 秒更新其运行中任务目录的 mtime；
+- 心跳超过 STALE_TIMEOUT 秒未更新的任务视为 worker 已退出：先把目录原子地
+  rename 到 running/.stale.*，再删除，任务随即可被重新领取；
+- 删除 failed/<id> 即可让失败任务重新排队。
+"""
+
+import os
+import json
+import time
+import uuid
+import shutil
+import socket
+import subprocess
+from typing import Dict, Optional
+
+from bptracer import costModel
+from bptracer import hostResource
+from bptracer import manifest
+from bptracer.asyncExecutor import log_path, format_elapsed
+from bptracer.taskGraph import TaskGraph
+
+TASKS_FILE = "tasks.jsonl"
+STATES = ("running", "done", "failed")
+HEARTBEAT_INTERVAL = 30
+STALE_TIMEOUT = 300
+POLL_INTERVAL = 5
+
+
+class TaskQueue:
+    """共享目录任务队列。"""
+
+    def __init__(self, queue_dir: str):
+        self.queue_dir = os.path.abspath(queue_dir)
+        self.tasks_file = os.path.join(self.queue_dir, TASKS_FILE)
+        for state in STATES:
+            os.makedirs(os.path.join(self.queue_dir, state), exist_ok=True)
+
+    def path(self, state: str, task_id: str = "") -> str:
+        return os.path.join(self.queue_dir, state, task_id)
+
+    def submit(self, tasks_file: str):
+        """
+        把任务清单加入队列；已在队列中的任务 id 不会重复加入，可被多个 worker 同时调用。
+        """
+        lock = os.path.join(self.queue_dir, ".submit.lock")
+        while True:
+            try:
+                os.mkdir(lock)
+                break
+            except FileExistsError:
+                time.sleep(1)
+        try:
+            known = set(self.load_tasks())
+            added = 0
+            with open(tasks_file, "r", encoding="utf-8") as src, \
+                    open(self.tasks_file, "a", encoding="utf-8") as dst:
+                for line in src:
+                    if not line.strip():
+                        continue
+                    task = json.loads(line)
+                    if task["id"] not in known:
+                        task.setdefault("command", f"bash {task['script']}")
+                        dst.write(json.dumps(task) + "\n")
+                        known.add(task["id"])
+                        added += 1
+            print(f"[worker] Submitted {added} tasks from {tasks_file} to {self.queue_dir}")
+        finally:
+            os.rmdir(lock)
+
+    def load_tasks(self) -> Dict[str, dict]:
+        """读取队列中的全部任务，保持提交顺序。"""
+        tasks = {}
+        if os.path.exists(self.tasks_file):
+            with open(self.tasks_file, "r", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        task = json.loads(line)
+                        tasks[task["id"]] = task
+        return tasks
+
+    def states(self) -> Dict[str, set]:
+        """返回 状态 -> 任务 id 集合。"""
+        return {
+            state: {name for name in os.listdir(self.path(state)) if not name.startswith(".")}
+            for state in STATES
+        }
+
+    def claim(self, task_id: str, owner: str) -> bool:
+        """尝试领取任务，成功返回 True。"""
+        try:
+            os.mkdir(self.path("running", task_id))
+        except FileExistsError:
+            return False
+        if any(os.path.exists(self.path(state, task_id)) for state in ("done", "failed")):
+            # 领取前的状态快照已过期：任务刚被其他 worker 完成
+            shutil.rmtree(self.path("running", task_id), ignore_errors=True)
+            return False
+        with open(os.path.join(self.path("running", task_id), "owner"), "w") as f:
+            f.write(owner + "\n")
+        return True
+
+    def heartbeat(self, task_id: str):
+        try:
+            os.utime(self.path("running", task_id))
+        except OSError:
+            pass  # 任务已被判定为失联并重新排队
+
+    def finish(self, task_id: str, success: bool, detail: str = ""):
+        """记录任务结果并释放 running/<id>。"""
+        state = "done" if success else "failed"
+        with open(self.path(state, task_id), "w") as f:
+            f.write(detail + "\n")
+        shutil.rmtree(self.path("running", task_id), ignore_errors=True)
+
+    def requeue_stale(self, timeout: float = STALE_TIMEOUT) -> int:
+        """把心跳超时的任务重新放回队列，返回重新排队的任务数。"""
+        requeued = 0
+        now = time.time()
+        for task_id in self.states()["running"]:
+            running = self.path("running", task_id)
+            try:
+                if now - os.path.getmtime(running) < timeout:
+                    continue
+                stale = self.path("running", f".stale.{task_id}.{uuid.uuid4().hex}")
+                os.rename(running, stale)
+            except OSError:
+                continue  # 其他 worker 已处理
+            shutil.rmtree(stale, ignore_errors=True)
+            print(f"[worker] Re-queued {task_id}: no heartbeat for {timeout:.0f}s")
+            requeued += 1
+        return requeued
+
+
+def run_worker(queue_dir: str, cores: Optional[int] = None, mem: Optional[float] = None,
+               stale_timeout: float = STALE_TIMEOUT, metrics_path: Optional[str] = None) -> Dict[str, list]:
+    """
+    持续从队列中领取并执行任务，直到所有任务完成或因上游失败无法执行。
+
+    参数:
+    - queue_dir (str): 队列目录。
+    - cores (int) / mem (float): 本 worker 的 CPU 核数与内存（GB）预算，默认自动探测。
+    - stale_timeout (float): 心跳超时秒数。
+    - metrics_path (str): 历史运行统计目录，用于按耗时排序，可为 None。
+
+    返回:
+    - Dict[str, list]: 本 worker 执行的 {"finished": [...], "failed": [...]}。
+    """
+    queue = TaskQueue(queue_dir)
+    cores = cores or hostResource.detect_cores()
+    mem = mem or hostResource.detect_memory() or float("inf")
+    owner = f"{socket.gethostname()}:{os.getpid()}"
+    print(f"[worker] {owner} serving {queue.queue_dir} with {cores} cores, {mem:.0f} GB memory.")
+
+    tasks, levels = {}, {}
+    running = {}  # task_id -> (Popen, log 文件, 开始时间, cpu, mem)
+    status = {"finished": [], "failed": []}
+    free_cpu, free_mem = cores, mem
+    last_heartbeat = 0.0
+
+    while True:
+        if len(queue.load_tasks()) != len(tasks):
+            # 首次启动或有新任务提交时重建优先级
+            tasks = queue.load_tasks()
+            graph = TaskGraph()
+            for task in tasks.values():
+                graph.add(task["script"], stage=task["stage"],
+                          depends=[tasks[dep]["script"] for dep in task["depends"]],
+                          resources=task["resources"])
+            script_levels = costModel.bottom_levels(graph, costModel.estimate(graph, metrics_path))
+            levels = {task_id: script_levels[task["script"]] for task_id, task in tasks.items()}
+
+        # 回收已结束的任务
+        for task_id, (process, log, start, need_cpu, need_mem) in list(running.items()):
+            if process.poll() is None:
+                continue
+            log.close()
+            del running[task_id]
+            free_cpu += need_cpu
+            free_mem += need_mem
+            elapsed = format_elapsed(time.time() - start)
+            success = process.returncode == 0
+            queue.finish(task_id, success, f"{owner}\texit {process.returncode}\t{elapsed}")
+            if success:
+                manifest.mark_done(tasks[task_id]["script"])
+                status["finished"].append(task_id)
+                print(f"[worker] Finished {task_id} ({elapsed})")
+            else:
+                status["failed"].append(task_id)
+                print(f"[worker] Failed {task_id} (exit {process.returncode}, {elapsed}), see {log.name}")
+
+        if time.time() - last_heartbeat >= min(HEARTBEAT_INTERVAL, stale_timeout / 3):
+            for task_id in running:
+                queue.heartbeat(task_id)
+            queue.requeue_stale(stale_timeout)
+            last_heartbeat = time.time()
+
+        states = queue.states()
+        closed = states["done"] | states["failed"]
+
+        # 上游失败的任务直接记为失败，避免其他 worker 一直等待
+        for task_id, task in tasks.items():
+            if task_id not in closed and any(dep in states["failed"] for dep in task["depends"]):
+                if queue.claim(task_id, owner):
+                    queue.finish(task_id, False, f"{owner}\tupstream failed")
+                    states["failed"].add(task_id)
+                    closed.add(task_id)
+                    print(f"[worker] Skip {task_id}: upstream failed")
+
+        pending = [task_id for task_id in tasks if task_id not in closed and task_id not in states["running"]]
+        if not pending and not states["running"] and not running:
+            break
+
+        ready = sorted(
+            (task_id for task_id in pending if all(dep in states["done"] for dep in tasks[task_id]["depends"])),
+            key=lambda task_id: -levels[task_id],
+        )
+        for task_id in ready:
+            task = tasks[task_id]
+            need_cpu = min(task["resources"].get("cpu", 1), cores)
+            need_mem = min(task["resources"].get("mem", 1), mem)
+            if need_cpu > free_cpu or need_mem > free_mem:
+                continue
+            if not queue.claim(task_id, owner):
+                continue
+            manifest.clear_done(task["script"])
+            log_file = log_path(task["script"])
+            os.makedirs(os.path.dirname(log_file), exist_ok=True)
+            log = open(log_file, "wb")
+            process = subprocess.Popen(task["command"], shell=True, stdin=subprocess.DEVNULL,
+                                       stdout=log, stderr=subprocess.STDOUT)
+            running[task_id] = (process, log, time.time(), need_cpu, need_mem)
+            free_cpu -= need_cpu
+            free_mem -= need_mem
+            print(f"[worker] Claimed {task_id} (log: {log_file})")
+
+        time.sleep(POLL_INTERVAL)
+
+    print(f"[worker] {owner} exiting: finished {len(status['finished'])}, failed {len(status['failed'])}")
+    return status